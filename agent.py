@@ -1,18 +1,32 @@
 # This is a basic agent to have a therapy conversation
 
-import os
+from __future__ import annotations
+
 import json
+import random
+import asyncio
 import logging
-import discord
 import datetime
-import requests
-
-from mistralai import Mistral
+import functools
+from typing import TYPE_CHECKING
+
+from batcher import MicroBatcher, batch_messages, parse_batch
+from content_pool import ContentPool
+from context import ConversationContext, render_turn
+from extract import LocalExtractor
+from gateway import OverBudget, Overloaded, get_gateway
+from journal import JournalIndex, render_page
+from memory import RECENT_TURNS, MemoryIndex
+from mood import MOOD_LABELS
+from sessions import ConversationField, SessionStore
+from storage import MemoryStorage
+from usage import DOWNGRADE
+
+if TYPE_CHECKING:
+    import discord  # only needed for annotations
 
 logger = logging.getLogger("discord")
 
-MISTRAL_MODEL = "mistral-large-latest"
-
 SYSTEM_PROMPT = """
 You are a compassionate therapist that is named Therabot. 
 Your role is to provide empathetic, non-judgemental, and supportive advice with a casual and approachable tone.
@@ -71,39 +85,150 @@ SYNTHESIS_PROMPT = """
 Analyze this conversation using the user's responses and summarize in 2 sentences very matter-of-factly. 
 """
 
-class ButtonManager:
-    def __init__(self):
-        MISTRAL_API_KEY = os.getenv("MISTRAL_API_KEY")
+ROLLING_SUMMARY_PROMPT = """
+You keep a running summary of a therapy conversation.
+Merge the previous summary with the new part of the conversation into at most 5 sentences.
+Keep the user's feelings, recurring themes, important people and events, and anything they asked you to remember.
+"""
 
-        self.client = Mistral(api_key=MISTRAL_API_KEY)
+MEMORY_PROMPT = """
+Things this user shared in earlier conversations that may be relevant now. Draw on them naturally
+when they help (e.g. "last time you mentioned..."), but don't list them back to the user:
 
-    async def get_mistral_response(self, prompt: str):
-        """Fetch AI-generated responses from Mistral AI."""
-        try:
-            response = await self.client.chat.complete_async(
-                model=MISTRAL_MODEL,
-                messages=[
-                    {"role": "system",
-                     "content": "You are a supportive mental health assistant. Provide uplifting and encouraging responses."},
-                    {"role": "user", "content": prompt}
-                ]
-            )
-            return response.choices[0].message.content.strip()
-        except Exception as e:
-            print(f"Error fetching affirmation: {e}")
-            return "🌟 **Daily Affirmation:** You are capable and enough!"
+"""
 
-# Manages user profiles, state tracking, and mood journal entries
-class UserManager:
-    def __init__(self):
-        MISTRAL_API_KEY = os.getenv("MISTRAL_API_KEY")
+CRISIS_PROMPT = """
+This message contains signs that the user may be in crisis (thoughts of suicide, self-harm or abuse).
+Hotline resources have already been sent to them separately. Respond with warmth and take it seriously:
+gently ask whether they are safe right now, encourage them to reach out to the crisis line or someone they trust,
+and keep the conversation going. Don't lecture, don't diagnose, and don't change the subject.
+"""
+
+BUTTON_SYSTEM_PROMPT = "You are a supportive mental health assistant. Provide uplifting and encouraging responses."
+
+# Feature button custom_id -> prompt for its content
+BUTTON_PROMPTS = {
+    "affirmation": "Give me a short, positive daily affirmation.",
+    "selfcare": "Give me a self-care tip.",
+    "music": "Give me two therapy music links.",
+    "art": "Give me two peaceful art links.",
+    "mindful": "Give me simple mindful tips (not about he breathing and five sense).",
+    "ground": "Give me five-sense grounding technique.",
+}
+
+# Served when the pool is empty and the LLM is overloaded or failing
+FALLBACK_CONTENT = {
+    "affirmation": [
+        "🌟 **Daily Affirmation:** You are capable and enough!",
+        "🌟 I am allowed to take up space and to go at my own pace.",
+        "🌟 I have handled hard days before, and I can handle this one too.",
+        "🌟 My feelings are valid, and they don't define my worth.",
+    ],
+    "selfcare": [
+        "Drink a full glass of water and step away from your screen for five minutes 💧",
+        "Write down one thing you can let go of today, and give yourself permission to do it 📝",
+        "Stretch your neck and shoulders slowly, then take three unhurried breaths 🌿",
+        "Eat something nourishing and sit down while you do it; no multitasking 🍎",
+    ],
+    "music": [
+        "Lo-fi beats to relax to: https://www.youtube.com/watch?v=jfKfPfyJRdk\n"
+        "Weightless by Marconi Union: https://www.youtube.com/watch?v=UfcAVejslrU",
+    ],
+    "art": [
+        "Claude Monet's Water Lilies: https://www.moma.org/collection/works/80220\n"
+        "Hokusai's The Great Wave: https://www.metmuseum.org/art/collection/search/45434",
+    ],
+    "mindful": [
+        "Eat one bite of food slowly and notice its texture, temperature and taste 🍵",
+        "Pick an everyday sound (a fan, traffic, birds) and just listen to it for one minute 🎧",
+        "Notice where your body touches the chair or floor, and let it hold your weight 🪑",
+    ],
+    "ground": [
+        "Name 5 things you can see, 4 you can touch, 3 you can hear, 2 you can smell and 1 you can taste 🌱",
+    ],
+}
+
+
+class CannedReply(str):
+    """A fixed reply standing in for the model's; it isn't part of the conversation, so it isn't recorded."""
+
+
+BUSY_REPLY = CannedReply("I'm getting a lot of messages right now, so I need a moment to give you a proper answer 💛 "
+                         "Could you tell me a little more about what's on your mind while I catch up?")
+BUDGET_REPLY = CannedReply("We've covered a lot together today, and I need to rest until tomorrow to keep giving you "
+                           "thoughtful answers 💛 `!menu` still has exercises you can do now. If you're in danger or "
+                           "thinking about harming yourself, tell me and I'll share people you can reach right away.")
+
+
+@functools.cache
+def system_message(*prompts):
+    """System message for a fixed combination of prompts, built once and shared by every call.
+
+    Static instructions go first and are sent byte-identical every time, so
+    the provider's prompt cache can reuse them; per-call text goes after.
+    Callers must not mutate the result.
+    """
+    return {"role": "system", "content": "".join(prompts)}
+
+class ButtonManager:
+    def __init__(self, gateway=None):
+        self.gateway = gateway or get_gateway()
+        # Button content doesn't depend on the user, so it's generated ahead of time
+        self.pools = {
+            feature: ContentPool(feature, functools.partial(self._generate, prompt))
+            for feature, prompt in BUTTON_PROMPTS.items()
+        }
 
-        self.client = Mistral(api_key=MISTRAL_API_KEY)
+    def start(self):
+        """Fill every pool in the background; call once the event loop is running."""
+        for pool in self.pools.values():
+            pool.start_refill()
+
+    async def _generate(self, prompt: str, user_id=None):
+        # Pool refills are for everyone and charged to nobody
+        response = await self.gateway.complete(
+            kind="button",
+            user_id=user_id,
+            messages=[
+                system_message(BUTTON_SYSTEM_PROMPT),
+                {"role": "user", "content": prompt}
+            ]
+        )
+        return response.choices[0].message.content.strip()
+
+    async def get_feature_content(self, feature: str, user_id=None):
+        """Content for a feature button: instant from the pool, live call (charged to user_id) only if it's empty."""
+        content = self.pools[feature].take()
+        if content is None:
+            try:
+                content = await self._generate(BUTTON_PROMPTS[feature], user_id)
+            except Exception as e:
+                # Buttons are the first thing shed under load; static content keeps the click instant
+                logger.warning(f"Serving fallback {feature} content: {e!r}")
+                content = random.choice(FALLBACK_CONTENT[feature])
+        return content
 
-        self.user_profiles = {}  # user_id -> profile (name, age, location)
-        self.user_states = {}  # user_id -> message count, onboarding status
-        self.mood_journal = {}  # user_id -> list of mood entries
-        self.user_conversations = {}
+# Manages user profiles, state tracking, and mood journal entries
+class UserManager:
+    def __init__(self, storage=None, gateway=None):
+        self.gateway = gateway or get_gateway()
+
+        # The session store is the read cache, bounded to recently active
+        # users and filled from the storage backend on a miss; every mutation
+        # is also handed to the backend, which persists it in the background
+        self.storage = storage if storage is not None else MemoryStorage()
+        self.sessions = SessionStore(self.storage)
+
+        # Dict-like views over the sessions
+        self.user_profiles = self.sessions.field("profile")  # user_id -> profile (name, age, location)
+        self.user_states = self.sessions.field("state")  # user_id -> message count, onboarding status
+        self.mood_journal = self.sessions.field("journal")  # user_id -> list of mood entries
+        self.user_conversations = ConversationField(self.sessions)  # user_id -> {"conversation": [(user, bot)]}
+        self.contexts = self.sessions.field("context")  # user_id -> ConversationContext, built on first use
+        self.journal_prefetch = self.sessions.field("prefetch")  # user_id -> (context version, task computing (mood, synthesis))
+        self.memories = self.sessions.field("memory")  # user_id -> MemoryIndex over past turns and journal entries, built on first use
+        self.journal_indexes = self.sessions.field("journal_index")  # user_id -> JournalIndex for !logs, built on first use
+        self.mood_batcher = MicroBatcher("mood", self._classify_moods, self._classify_mood)
 
     def is_onboarded(self, user_id):
         return user_id in self.user_profiles
@@ -122,94 +247,252 @@ class UserManager:
 
         # Initialize an empty conversation
         self.user_conversations[user_id] = {"conversation": []}
+        self.sessions.get(user_id).summary = None
+        self.storage.clear_turns(user_id)  # e.g. a crisis reply during onboarding, or it comes back on the next load
+        self.contexts.pop(user_id, None)
+        self.memories.pop(user_id, None)
+
+        self.storage.put_profile(user_id, self.user_profiles[user_id])
+        self.storage.put_state(user_id, self.user_states[user_id])
 
     def increment_message_count(self, user_id):
         state = self.user_states.setdefault(user_id, {"message_count": 0})
         state["message_count"] += 1
+        self.storage.put_state(user_id, state)
         return state["message_count"]
 
+    def update_state(self, user_id, **changes):
+        """Set state flags (e.g. awaiting_mood_journal) and persist them."""
+        state = self.user_states.setdefault(user_id, {"message_count": 0})
+        state.update(changes)
+        self.storage.put_state(user_id, state)
+        return state
+
     def log_mood(self, user_id, mood, synthesis):
-        profile = self.user_profiles.get(user_id, {})
+        # Name, age and location live in the profile; entries older than this still carry a copy
         entry = {
             "timestamp": datetime.datetime.now().isoformat(),
-            "name": profile.get("name"),
-            "age": profile.get("age"),
-            "location": profile.get("location"),
             "mood": mood,
             "synthesis": synthesis
         }
         self.mood_journal.setdefault(user_id, []).append(entry)
-        logger.info(f"Logged mood for user {user_id}: {entry}")
+        self.storage.append_mood(user_id, entry)
+        memory = self.memories.get(user_id)
+        if memory is not None:  # otherwise it's picked up when the index is built
+            memory.add(str(synthesis), _journal_snippet(entry))
+        logger.info(f"Logged mood for user {user_id}: {mood}")
 
     async def get_mood(self, user_id):
-        convo_pairs = self.user_conversations[user_id]["conversation"]
-        # Convert list of tuples into a readable conversation
-        convo = "\n".join([f"User: {u}\nBot: {b}" for u, b in convo_pairs])
-
-        response = await self.client.chat.complete_async(
-            model=MISTRAL_MODEL,
-            messages=[{"role": "system", "content": MOOD_PROMPT},
+        """The user's mood label, or None if it can't be classified right now."""
+        try:
+            item = (user_id, self.get_context(user_id).render())
+            if self.gateway.check_budget("mood", user_id) == DOWNGRADE:
+                return await self._classify_mood(item)  # on its own, so the downgrade is theirs alone
+            return await self.mood_batcher.submit(item)
+        except Overloaded:
+            # No guess: a wrong mood in the journal is worse than asking again later
+            return None
+
+    # Batched items are (user_id, text); a batch is charged to all of its users.
+    # Users past their soft budget aren't batched, so one of them never moves a
+    # whole batch to the cheaper model.
+
+    async def _classify_mood(self, item):
+        user_id, convo = item
+        response = await self.gateway.complete(
+            kind="mood",
+            user_id=user_id,
+            messages=[system_message(MOOD_PROMPT),
                       {"role": "user", "content": convo}],
             response_format={"type": "json_object"},
         )
         mood_data = json.loads(response.choices[0].message.content)
         return mood_data["mood"]
 
-    def get_mood_logs(self, user_id):
-        """Retrieve mood logs for a user."""
+    async def _classify_moods(self, items):
+        user_ids, convos = zip(*items)
+        response = await self.gateway.complete(
+            kind="mood",
+            user_id=list(user_ids),
+            messages=batch_messages(MOOD_PROMPT, convos),
+            response_format={"type": "json_object"},
+        )
+        results = parse_batch(response.choices[0].message.content, len(convos))
+        # Anything that isn't one of our labels gets a second, single-item try
+        return [r["mood"] if r is not None and r.get("mood") in MOOD_LABELS else None for r in results]
+
+    def mood_log_page(self, user_id, query, before=None):
+        """(text, older, newer) for one !logs page (see journal.render_page); text is None if no entry matches."""
+        journal = self.mood_journal.get(user_id)
+        if not journal:
+            return None, None, None
+        index = self.journal_indexes.get(user_id)
+        if index is None or index.entries is not journal:
+            index = self.journal_indexes[user_id] = JournalIndex(journal)
         profile = self.user_profiles[user_id]
-        name = profile.get("name")
-        age = profile.get("age")
-        location = profile.get("location")
-        logs = self.mood_journal.get(user_id, [])
-        if not logs:
-            return "You don't have any mood logs yet! 📓"
-
-        log_messages = [f"📓 User: {name} | {age} | {location} \n"]
-        for i, entry in enumerate(logs, 1):
-            log_messages.append(
-                f"📅 **Entry {i}:**\n"
-                f"- Timestamp: {entry['timestamp']}\n"
-                f"- Mood: {entry['mood']}\n"
-                f"- Summary: {entry['synthesis']}\n"
-            )
-        return "\n".join(log_messages)
+        header = f"📓 User: {profile.get('name')} | {profile.get('age')} | {profile.get('location')}\n"
+        return render_page(index, query, header, before)
+
+    def get_context(self, user_id):
+        """Token-bounded rendered transcript, kept up to date by add_to_conversation."""
+        context = self.contexts.get(user_id)
+        if context is None:
+            context = self.contexts[user_id] = ConversationContext(functools.partial(self._fold_summary, user_id))
+            history = self.user_conversations.get(user_id, {"conversation": []})["conversation"]
+            # A session that was spilled kept its rolling summary; only the turns after it are replayed
+            summary, covered = self.sessions.get(user_id).summary or ("", 0)
+            context.restore(summary, history[covered:], covered)
+        return context
+
+    def get_memory(self, user_id):
+        """Searchable index of the user's past turns and journal syntheses, kept up to date as they are added."""
+        memory = self.memories.get(user_id)
+        if memory is None:
+            memory = self.memories[user_id] = MemoryIndex()
+            history = self.user_conversations.get(user_id, {"conversation": []})["conversation"]
+            # Embed what the user said; the bot's replies are too generic to match on
+            memory.extend([user_msg for user_msg, _ in history],
+                          [render_turn(user_msg, bot_msg) for user_msg, bot_msg in history],
+                          range(len(history)))
+            journal = self.mood_journal.get(user_id, [])
+            memory.extend([str(entry["synthesis"]) for entry in journal],
+                          [_journal_snippet(entry) for entry in journal],
+                          [-1] * len(journal))
+        return memory
+
+    async def _fold_summary(self, user_id, previous_summary, transcript):
+        response = await self.gateway.complete(
+            kind="summary",
+            user_id=user_id,
+            messages=[
+                system_message(ROLLING_SUMMARY_PROMPT),
+                {"role": "user", "content": f"Previous summary: {previous_summary or 'None'}\n\n{transcript}"},
+            ],
+        )
+        return response.choices[0].message.content
 
     async def get_conversation(self,user_id):
-        convo_pairs = self.user_conversations[user_id]["conversation"]
-        # Convert list of tuples into a readable conversation
-        convo = "\n".join([f"User: {u}\nBot: {b}" for u, b in convo_pairs])
-        return convo
+        return self.get_context(user_id).render()
+
     async def summarize_conversation(self, user_id):
-        convo_pairs = self.user_conversations[user_id]["conversation"]
-        # Convert list of tuples into a readable conversation
-        convo = "\n".join([f"User: {u}\nBot: {b}" for u, b in convo_pairs])
-        synthesis = await self.client.chat.complete_async(
-                model=MISTRAL_MODEL,
-                messages=[
-                    {"role": "system", "content": SYNTHESIS_PROMPT},
-                    {"role": "user", "content": convo},
-                ],
-            )
+        convo = self.get_context(user_id).render()
+        try:
+            synthesis = await self.gateway.complete(
+                    kind="synthesis",
+                    user_id=user_id,
+                    messages=[
+                        system_message(SYNTHESIS_PROMPT),
+                        {"role": "user", "content": convo},
+                    ],
+                )
+        except Overloaded:
+            # Degraded entry: the user's own recent words instead of a summary
+            history = self.user_conversations.get(user_id, {"conversation": []})["conversation"]
+            quotes = "; ".join(f'"{_clip(user_msg)}"' for user_msg, _ in history[-3:])
+            return f"You talked about: {quotes}" if quotes else "No summary available right now."
         return synthesis.choices[0].message.content
 
+    async def _analyze_for_journal(self, user_id):
+        mood, synthesis = await asyncio.gather(self.get_mood(user_id), self.summarize_conversation(user_id))
+        return mood, synthesis
+
+    def prefetch_journal(self, user_id):
+        """Start computing mood and synthesis in the background, before the user answers the journal offer."""
+        version = self.get_context(user_id).version
+        cached = self.journal_prefetch.get(user_id)
+        if cached is not None:
+            if cached[0] == version:
+                return
+            cached[1].cancel()
+        task = asyncio.create_task(self._analyze_for_journal(user_id))
+        # Don't let a failed speculation log "exception never retrieved"; analyze_for_journal retries it
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        self.journal_prefetch[user_id] = (version, task)
+
+    async def analyze_for_journal(self, user_id):
+        """(mood, synthesis) for a journal entry, reusing the prefetch if the conversation hasn't changed since."""
+        version = self.get_context(user_id).version
+        cached = self.journal_prefetch.pop(user_id, None)
+        if cached is not None:
+            cached_version, task = cached
+            if cached_version == version:
+                try:
+                    return await task
+                except Exception as e:
+                    logger.warning(f"Speculative journal analysis failed, retrying: {e!r}")
+            else:
+                task.cancel()
+        return await self._analyze_for_journal(user_id)
+
     def add_to_conversation(self, user_id, user_msg, bot_msg):
+        context = self.get_context(user_id)  # build from history before the new turn lands
         convo = self.user_conversations.setdefault(user_id, {"conversation": []})
         convo["conversation"].append((user_msg, bot_msg))
+        context.add(user_msg, bot_msg)
+        memory = self.memories.get(user_id)
+        if memory is not None:
+            memory.add(user_msg, render_turn(user_msg, bot_msg), turn=len(convo["conversation"]) - 1)
+        self.storage.append_turn(user_id, user_msg, bot_msg)
 
 
 
 
-class OnboardingManager:
+def _clip(text, limit=120):
+    return text if len(text) <= limit else text[:limit].rsplit(" ", 1)[0] + "…"
 
-    def __init__(self, user_manager, therapy_agent):
-        MISTRAL_API_KEY = os.getenv("MISTRAL_API_KEY")
 
-        self.client = Mistral(api_key=MISTRAL_API_KEY)
+def _journal_snippet(entry):
+    return f"Journal entry from {entry['timestamp'][:10]} (mood: {entry['mood']}): {entry['synthesis']}"
+
+
+class OnboardingManager:
+
+    def __init__(self, user_manager, therapy_agent, gateway=None):
+        self.gateway = gateway or get_gateway()
 
         self.user_manager = user_manager
         self.therapy_agent = therapy_agent
-        self.pending_onboarding = {} # user_id -> current_stage (intro, name, age, location)
+        self.pending_onboarding = user_manager.sessions.field("stage")  # user_id -> current_stage (intro, name, age, location)
+        self.extractor = LocalExtractor()
+        self.extract_batcher = MicroBatcher("extract", self._extract_many, self._extract_one)
+
+    async def extract(self, field, content, user_id=None):
+        """Pull a name, age or location out of an answer; the LLM is only asked when the local parse is unsure."""
+        value = self.extractor.extract(field, content)
+        if value is not None:
+            return value
+
+        try:
+            if self.gateway.check_budget("extract", user_id) == DOWNGRADE:
+                obj = await self._extract_one((user_id, content))
+            else:
+                obj = await self.extract_batcher.submit((user_id, content))
+        except Overloaded:
+            return self.extractor.guess(field, content)
+        return obj.get(field)
+
+    async def _extract_one(self, item):
+        user_id, content = item
+        response = await self.gateway.complete(
+            kind="extract",
+            user_id=user_id,
+            messages=[
+                system_message(EXTRACT_INFO_PROMPT),
+                {"role": "user", "content": content},
+            ],
+            response_format={"type": "json_object"},
+        )
+        return json.loads(response.choices[0].message.content)
+
+    async def _extract_many(self, items):
+        user_ids, contents = zip(*items)
+        response = await self.gateway.complete(
+            kind="extract",
+            user_id=list(user_ids),
+            messages=batch_messages(EXTRACT_INFO_PROMPT, contents),
+            response_format={"type": "json_object"},
+        )
+        return parse_batch(response.choices[0].message.content, len(contents))
 
     def needs_onboarding(self, user_id):
         # Return True if they are not onboarded, or if they're partway through onboarding
@@ -237,16 +520,7 @@ class OnboardingManager:
 
         # Name step
         if current_stage == "name":
-            response = await self.client.chat.complete_async(
-                model=MISTRAL_MODEL,
-                messages=[
-                    {"role": "system", "content": EXTRACT_INFO_PROMPT},
-                    {"role": "user", "content": content},
-                ],
-                response_format={"type": "json_object"},
-            )
-            obj = json.loads(response.choices[0].message.content)
-            name = obj.get("name")
+            name = await self.extract("name", content, user_id)
 
             if not name:
                 await message.reply("Sorry, I didn't catch your name. Could you try again?")
@@ -261,17 +535,7 @@ class OnboardingManager:
 
         # Age step
         if current_stage == "age":
-            response = await self.client.chat.complete_async(
-                model=MISTRAL_MODEL,
-                messages=[
-                    {"role": "system", "content": EXTRACT_INFO_PROMPT},
-                    {"role": "user", "content":content},
-                ],
-                response_format={"type": "json_object"},
-            )
-
-            obj = json.loads(response.choices[0].message.content)
-            age = obj.get("age")
+            age = await self.extract("age", content, user_id)
 
             if not age:
                 await message.reply("Hmm, could you tell me your age again?")
@@ -286,16 +550,7 @@ class OnboardingManager:
 
         # Location step
         if current_stage == "location":
-            response = await self.client.chat.complete_async(
-                model=MISTRAL_MODEL,
-                messages=[
-                    {"role": "system", "content": EXTRACT_INFO_PROMPT},
-                    {"role": "user", "content": content},
-                ],
-                response_format={"type": "json_object"},
-            )
-            obj = json.loads(response.choices[0].message.content)
-            location = obj.get("location")
+            location = await self.extract("location", content, user_id)
 
             if not location:
                 await message.reply("Could you share your location one more time?")
@@ -326,25 +581,54 @@ class OnboardingManager:
             )
 
 class TherapyAgent:
-    def __init__(self, user_manager):
-        MISTRAL_API_KEY = os.getenv("MISTRAL_API_KEY")
-        self.client = Mistral(api_key=MISTRAL_API_KEY)
+    def __init__(self, user_manager, gateway=None):
+        self.gateway = gateway or get_gateway()
         self.user_manager = user_manager  # Pass in user manager
 
-    async def run(self, message: discord.Message, user_id):
+    async def _build_messages(self, message: discord.Message, user_id, crisis=False):
+        # The last few turns verbatim, plus whatever older turns and journal entries relate to this message
+        history = self.user_manager.user_conversations.get(user_id, {"conversation": []})["conversation"]
+        recent = history[-RECENT_TURNS:] if RECENT_TURNS else []
+        memories = self.user_manager.get_memory(user_id).search(message.content, before_turn=len(history) - len(recent))
+
+        system = system_message(SYSTEM_PROMPT, CRISIS_PROMPT) if crisis else system_message(SYSTEM_PROMPT)
+        if memories:
+            # Memories differ on every message, so they follow the cached static prefix
+            system = {"role": "system", "content": system["content"] + MEMORY_PROMPT + "\n\n".join(memories)}
+        messages = [system]
+        for user_msg, bot_msg in recent:
+            messages.append({"role": "user", "content": user_msg})
+            messages.append({"role": "assistant", "content": bot_msg})
+        messages.append({"role": "user", "content": message.content})
+        return messages
+
+    async def run(self, message: discord.Message, user_id, crisis=False):
         # The simplest form of an agent
         # Send the message's content to Mistral's API and return Mistral's response
 
-        convo = await self.user_manager.get_conversation(user_id)
-        messages = [
-            {"role": "system", "content": SYSTEM_PROMPT},
-            #{"role": "user", "content": convo},
-            {"role": "user", "content": message.content},
-        ]
+        messages = await self._build_messages(message, user_id, crisis)
 
-        response = await self.client.chat.complete_async(
-            model=MISTRAL_MODEL,
-            messages=messages,
-        )
+        try:
+            response = await self.gateway.complete(
+                kind="crisis" if crisis else "therapy",
+                user_id=user_id,
+                messages=messages,
+            )
+        except OverBudget:
+            return BUDGET_REPLY
+        except Overloaded:
+            return BUSY_REPLY
 
         return response.choices[0].message.content
+
+    async def stream(self, message: discord.Message, user_id, crisis=False):
+        """Same reply as run(), yielded in pieces as the model produces it; a CannedReply comes as the only piece."""
+        messages = await self._build_messages(message, user_id, crisis)
+        try:
+            async for chunk in self.gateway.stream(messages=messages, user_id=user_id,
+                                                   kind="crisis" if crisis else "therapy"):
+                yield chunk
+        except OverBudget:  # only raised before the first chunk, like Overloaded
+            yield BUDGET_REPLY
+        except Overloaded:  # only raised before the first chunk
+            yield BUSY_REPLY
@@ -0,0 +1,295 @@
+# Columnar mood journal for export and cross-user analytics
+#
+# Journal entries are also kept as parallel NumPy columns: timestamp (seconds),
+# user code, mood code and a synthesis reference (the entry's position in that
+# user's journal, where the text lives). Distributions, mood-to-mood transitions and weekday trends are array
+# operations over those columns, so millions of entries never turn into
+# per-entry dicts. Exports don't build columns at all: export_sqlite() writes
+# each chunk it fetches from the database straight to the file, so memory
+# stays at one chunk however big the journal is.
+#
+# The bot itself doesn't keep columns, which would grow with every entry
+# outside the bounded session store; the analytics read the SQLite database,
+# which covers every user of a sharded deployment too:
+#
+#   python -m analytics summary [--db therabot.db]
+#   python -m analytics export journal.csv|journal.jsonl|journal.parquet [--db therabot.db]
+#
+# Parquet export needs pyarrow (`pip install pyarrow`).
+
+import os
+import sys
+import csv
+import json
+import sqlite3
+import argparse
+import contextlib
+
+import numpy as np
+
+from mood import MOOD_LABELS
+from storage import DB_PATH
+
+MOODS = MOOD_LABELS + ["Other"]  # mood code -> label; anything outside MOOD_LABELS is "Other"
+MOOD_CODES = {label: code for code, label in enumerate(MOODS)}
+OTHER = MOOD_CODES["Other"]
+MOOD_NAMES = np.asarray(MOODS, dtype=object)
+WEEKDAYS = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+CHUNK = int(os.getenv("ANALYTICS_CHUNK", "65536"))  # entries per export write and SQLite fetch
+INITIAL_CAPACITY = 1024
+SYNTHESIS = "json_extract(data, '$.synthesis')"  # read in SQLite, so Python never decodes the entry JSON
+
+
+def _seconds(timestamps):
+    """ISO timestamps to int64 seconds since the epoch, in one vectorized parse."""
+    return np.array(timestamps, dtype="datetime64[us]").astype("datetime64[s]").astype(np.int64)
+
+
+def _connect(path):
+    return sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+
+
+class JournalColumns:
+    """Journal entries as columns; with `keep_texts`, the synthesis texts too, which export needs."""
+
+    def __init__(self, keep_texts=True):
+        self.size = 0
+        self.time = np.empty(INITIAL_CAPACITY, dtype=np.int64)  # seconds since the epoch, local time as logged
+        self.user = np.empty(INITIAL_CAPACITY, dtype=np.int32)  # index into user_ids
+        self.mood = np.empty(INITIAL_CAPACITY, dtype=np.uint8)  # index into MOODS
+        self.synthesis = np.empty(INITIAL_CAPACITY, dtype=np.int32)  # position in the user's journal
+        self.user_ids = []
+        self.user_codes = {}  # user_id -> code
+        self.user_entries = []  # user code -> entries so far
+        self.texts = [] if keep_texts else None  # synthesis of each entry, in entry order
+
+    def __len__(self):
+        return self.size
+
+    def _reserve(self, extra):
+        needed = self.size + extra
+        if needed <= len(self.time):
+            return
+        capacity = max(needed, 2 * len(self.time))
+        for name in ("time", "user", "mood", "synthesis"):
+            old = getattr(self, name)
+            column = np.empty(capacity, dtype=old.dtype)
+            column[:self.size] = old[:self.size]
+            setattr(self, name, column)
+
+    def _user_code(self, user_id):
+        code = self.user_codes.get(user_id)
+        if code is None:
+            code = self.user_codes[user_id] = len(self.user_ids)
+            self.user_ids.append(user_id)
+            self.user_entries.append(0)
+        return code
+
+    def append(self, user_id, timestamp, mood, synthesis):
+        self.extend([user_id], [timestamp], [mood], [synthesis])
+
+    def extend(self, user_ids, timestamps, moods, syntheses):
+        """Add entries given as parallel sequences, in the order they were logged."""
+        count = len(timestamps)
+        if not count:
+            return
+        self._reserve(count)
+        end = self.size + count
+        self.time[self.size:end] = _seconds(timestamps)
+        codes = [self._user_code(uid) for uid in user_ids]
+        refs = []
+        for code in codes:
+            refs.append(self.user_entries[code])
+            self.user_entries[code] += 1
+        self.user[self.size:end] = codes
+        self.synthesis[self.size:end] = refs
+        self.mood[self.size:end] = [MOOD_CODES.get(mood, OTHER) for mood in moods]
+        if self.texts is not None:
+            self.texts.extend(syntheses)
+        self.size = end
+
+    def load_journal(self, journal):
+        """Add a {user_id: [entry, ...]} journal as storage backends load it."""
+        for user_id, entries in journal.items():
+            self.extend([user_id] * len(entries), [e["timestamp"] for e in entries],
+                        [e["mood"] for e in entries], [e["synthesis"] for e in entries])
+
+    @classmethod
+    def from_sqlite(cls, path=DB_PATH, chunk=CHUNK, keep_texts=True):
+        """Read a bot database's whole journal, chunk by chunk, without decoding the entries' JSON in Python."""
+        columns = cls(keep_texts)
+        conn = _connect(path)
+        try:
+            cursor = conn.execute(f"SELECT user_id, timestamp, mood, {SYNTHESIS if keep_texts else 'NULL'} "
+                                  "FROM mood_journal ORDER BY id")
+            while rows := cursor.fetchmany(chunk):
+                user_ids, timestamps, moods, syntheses = zip(*rows)
+                columns.extend(user_ids, timestamps, moods, [str(s) for s in syntheses])
+        finally:
+            conn.close()
+        return columns
+
+    def select(self, since=None, until=None, user_ids=None):
+        """Boolean mask of the entries from `since` up to `until` (ISO timestamps or dates), by the given users."""
+        time = self.time[:self.size]
+        mask = np.ones(self.size, dtype=bool)
+        if since:
+            mask &= time >= _seconds([since])[0]
+        if until:
+            mask &= time < _seconds([until])[0]
+        if user_ids is not None:
+            codes = [self.user_codes[uid] for uid in user_ids if uid in self.user_codes]
+            mask &= np.isin(self.user[:self.size], codes)
+        return mask
+
+    # Analytics; each takes an optional mask from select()
+
+    def distribution(self, mask=None):
+        """Entries per mood code."""
+        moods = self.mood[:self.size] if mask is None else self.mood[:self.size][mask]
+        return np.bincount(moods, minlength=len(MOODS))
+
+    def transitions(self, mask=None):
+        """counts[a, b]: how often a user's entry with mood a was followed by their next entry with mood b."""
+        idx = np.arange(self.size) if mask is None else np.flatnonzero(mask)
+        order = idx[np.lexsort((self.time[idx], self.user[idx]))]  # by user, then time
+        users, moods = self.user[order], self.mood[order].astype(np.intp)
+        same_user = users[1:] == users[:-1]
+        pairs = moods[:-1][same_user] * len(MOODS) + moods[1:][same_user]
+        return np.bincount(pairs, minlength=len(MOODS) ** 2).reshape(len(MOODS), len(MOODS))
+
+    def weekday_trends(self, mask=None):
+        """counts[weekday, mood], Monday first."""
+        time, moods = self.time[:self.size], self.mood[:self.size]
+        if mask is not None:
+            time, moods = time[mask], moods[mask]
+        weekdays = (time // 86400 + 3) % 7  # 1970-01-01 was a Thursday
+        cells = weekdays * len(MOODS) + moods
+        return np.bincount(cells, minlength=7 * len(MOODS)).reshape(7, len(MOODS))
+
+    def export(self, path, fmt=None, chunk=CHUNK):
+        """Write every entry to `path` as jsonl, csv or parquet (by default from the extension); returns the count."""
+        if self.texts is None:
+            raise ValueError("These columns were built without the synthesis texts; export from the database")
+        user_ids = np.asarray(self.user_ids, dtype=object)
+        with open_export(path, fmt) as write:
+            for start in range(0, self.size, chunk):
+                stop = min(self.size, start + chunk)
+                write(self.time[start:stop], user_ids[self.user[start:stop]], self.mood[start:stop],
+                      self.texts[start:stop])
+        return self.size
+
+
+@contextlib.contextmanager
+def open_export(path, fmt=None):
+    """Yields write(times, user_ids, moods, texts), which appends one chunk of entries to `path`.
+
+    `times` are seconds since the epoch and `moods` codes into MOODS, both arrays. jsonl and csv rows
+    are written as they come, parquet as one row group per chunk.
+    """
+    fmt = fmt or os.path.splitext(path)[1].lstrip(".").lower()
+    if fmt == "parquet":
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError("Parquet export needs pyarrow: pip install pyarrow") from None
+        schema = pa.schema([("timestamp", pa.timestamp("s")), ("user_id", pa.string()),
+                            ("mood", pa.dictionary(pa.uint8(), pa.string())), ("synthesis", pa.string())])
+        with pq.ParquetWriter(path, schema) as writer:
+            def write(times, user_ids, moods, texts):
+                writer.write_table(pa.table([
+                    pa.array(times.astype("datetime64[s]")),
+                    pa.array(user_ids, type=pa.string()),
+                    pa.DictionaryArray.from_arrays(pa.array(moods), pa.array(MOODS)),
+                    pa.array(texts, type=pa.string()),
+                ], schema=schema))
+            yield write
+        return
+    if fmt not in ("jsonl", "csv"):
+        raise ValueError(f"Unknown export format {fmt!r}; use jsonl, csv or parquet")
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f) if fmt == "csv" else None
+        if writer is not None:
+            writer.writerow(["timestamp", "user_id", "mood", "synthesis"])
+
+        def write(times, user_ids, moods, texts):
+            times = np.datetime_as_string(times.astype("datetime64[s]"), unit="s")
+            moods = MOOD_NAMES[moods]
+            if writer is not None:
+                writer.writerows(zip(times, user_ids, moods, texts))
+            else:
+                f.writelines(f'{{"timestamp":"{t}","user_id":{json.dumps(u)},"mood":"{m}",'
+                             f'"synthesis":{json.dumps(s)}}}\n' for t, u, m, s in zip(times, user_ids, moods, texts))
+        yield write
+
+
+def export_sqlite(db_path, path, fmt=None, chunk=CHUNK):
+    """Stream a bot database's journal to `path`, one fetched chunk at a time; returns the count."""
+    count = 0
+    conn = _connect(db_path)
+    try:
+        cursor = conn.execute(f"SELECT user_id, timestamp, mood, {SYNTHESIS} FROM mood_journal ORDER BY id")
+        with open_export(path, fmt) as write:
+            while rows := cursor.fetchmany(chunk):
+                user_ids, timestamps, moods, syntheses = zip(*rows)
+                codes = np.fromiter((MOOD_CODES.get(mood, OTHER) for mood in moods), dtype=np.uint8, count=len(rows))
+                write(_seconds(timestamps), user_ids, codes, [str(s) for s in syntheses])
+                count += len(rows)
+    finally:
+        conn.close()
+    return count
+
+
+def summary(columns, mask=None):
+    """Human-readable report of the three analytics."""
+    counts = columns.distribution(mask)
+    total = int(counts.sum())
+    if not total:
+        return "No journal entries."
+    shown = [code for code in range(len(MOODS)) if counts[code]]
+    users = columns.user[:columns.size] if mask is None else columns.user[:columns.size][mask]
+    lines = [f"{total:,} journal entries from {len(np.unique(users)):,} users", "", "Moods:"]
+    lines += [f"  {MOODS[code]:<11}{counts[code]:>10,}  {counts[code] / total:>6.1%}" for code in shown]
+
+    transitions = columns.transitions(mask)
+    lines += ["", "Next mood after each mood (share of that mood's entries that had a next one):"]
+    lines.append(" " * 13 + "".join(f"{MOODS[code][:6]:>8}" for code in shown))
+    for a in shown:
+        row = transitions[a, shown]
+        if row.sum():
+            lines.append(f"  {MOODS[a]:<11}" + "".join(f"{n / row.sum():>8.0%}" for n in row))
+
+    weekdays = columns.weekday_trends(mask)
+    lines += ["", "Share of each weekday's entries by mood:"]
+    lines.append(" " * 6 + "".join(f"{MOODS[code][:6]:>8}" for code in shown))
+    for day, name in enumerate(WEEKDAYS):
+        row = weekdays[day, shown]
+        if row.sum():
+            lines.append(f"  {name:<4}" + "".join(f"{n / row.sum():>8.0%}" for n in row))
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export or summarize the bot's mood journal")
+    parser.add_argument("--db", default=DB_PATH or "therabot.db", help="bot database (THERABOT_DB)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    report = commands.add_parser("summary", help="mood distribution, transitions and weekday trends")
+    report.add_argument("--since", help="only entries from this date (YYYY-MM-DD)")
+    report.add_argument("--until", help="only entries before this date (YYYY-MM-DD)")
+    export = commands.add_parser("export", help="write the journal to a file")
+    export.add_argument("path", help="output file; .jsonl, .csv or .parquet")
+    export.add_argument("--format", choices=["jsonl", "csv", "parquet"], help="instead of the extension")
+    args = parser.parse_args()
+
+    if args.command == "summary":
+        columns = JournalColumns.from_sqlite(args.db, keep_texts=False)
+        mask = columns.select(args.since, args.until) if args.since or args.until else None
+        print(summary(columns, mask))
+    else:
+        count = export_sqlite(args.db, args.path, args.format)
+        print(f"Wrote {count:,} entries to {args.path}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
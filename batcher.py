@@ -0,0 +1,138 @@
+# Micro-batching for small JSON-mode LLM calls
+#
+# Mood classification and onboarding extraction are short, independent calls
+# that spike together at peak. MicroBatcher holds requests for up to
+# BATCH_MAX_WAIT (or until BATCH_MAX_SIZE are waiting), sends them as one
+# multi-item call and hands each caller its own result. Items the batched
+# answer doesn't cover, or can't be parsed at all, are retried as single calls.
+
+import os
+import json
+import functools
+import asyncio
+import logging
+
+import metrics
+
+logger = logging.getLogger("discord")
+
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", "8"))
+BATCH_MAX_WAIT = float(os.getenv("BATCH_MAX_WAIT_MS", "15")) / 1000
+
+BATCH_INSTRUCTIONS = """
+
+You will receive several numbered items instead of one. Handle each item independently, exactly as described above.
+Return a single JSON object of the form {"results": [{"id": 0, ...}, {"id": 1, ...}]} with one entry per item,
+where each entry is the JSON object you would have returned for that item alone, plus its "id".
+"""
+
+
+@functools.cache
+def _batch_system(prompt):
+    # Built once per prompt, so every batch starts with the same bytes for the provider's prompt cache
+    return {"role": "system", "content": prompt + BATCH_INSTRUCTIONS}
+
+
+def batch_messages(prompt, items):
+    """Messages asking for `prompt` to be applied to every item in one response."""
+    body = "\n\n".join(f"### Item {i}\n{item}" for i, item in enumerate(items))
+    return [_batch_system(prompt), {"role": "user", "content": body}]
+
+
+def parse_batch(content, count):
+    """Per-item result dicts from a batched response, None where an item is missing.
+
+    Raises ValueError if the response isn't a batch at all.
+    """
+    results = json.loads(content)["results"]
+    if not isinstance(results, list):
+        raise ValueError("results is not a list")
+    parsed = [None] * count
+    for position, result in enumerate(results):
+        if not isinstance(result, dict):
+            continue
+        i = result.pop("id", position)
+        if isinstance(i, int) and 0 <= i < count and parsed[i] is None:
+            parsed[i] = result
+    return parsed
+
+
+class MicroBatcher:
+    """Coalesces concurrent `submit(item)` calls.
+
+    `run_batch(items)` makes the multi-item call and returns one result per
+    item (None for items it couldn't answer); `run_one(item)` is the plain
+    single call, used for lone items and as the fallback.
+    """
+
+    def __init__(self, kind, run_batch, run_one, max_size=BATCH_MAX_SIZE, max_wait=BATCH_MAX_WAIT):
+        self.kind = kind
+        self.run_batch = run_batch
+        self.run_one = run_one
+        self.max_size = max_size
+        self.max_wait = max_wait
+
+        self.pending = []  # (item, future) waiting for the next flush
+        self._timer = None
+        self._tasks = set()
+
+    async def submit(self, item):
+        future = asyncio.get_running_loop().create_future()
+        self.pending.append((item, future))
+        if len(self.pending) >= self.max_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.max_wait, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self.pending = self.pending, []
+        # Callers that gave up (e.g. a cancelled prefetch) don't need an answer
+        batch = [(item, future) for item, future in batch if not future.done()]
+        if not batch:
+            return
+        task = asyncio.create_task(self._run(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch):
+        metrics.LLM_BATCH_SIZE.observe(len(batch), kind=self.kind)
+        if len(batch) == 1:
+            await self._run_single(*batch[0])
+            return
+
+        items = [item for item, _ in batch]
+        try:
+            results = await self.run_batch(items)
+        except (ValueError, KeyError, TypeError) as e:
+            # json.JSONDecodeError is a ValueError; anything else (API errors) is the callers' to handle
+            logger.warning(f"Batched {self.kind} call returned an unusable response, retrying singly: {e!r}")
+            results = [None] * len(batch)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        retry = []
+        for (item, future), result in zip(batch, results):
+            if result is None:
+                retry.append((item, future))
+            elif not future.done():
+                future.set_result(result)
+        if retry:
+            metrics.LLM_BATCH_FALLBACKS.inc(len(retry), kind=self.kind)
+            await asyncio.gather(*(self._run_single(item, future) for item, future in retry))
+
+    async def _run_single(self, item, future):
+        try:
+            result = await self.run_one(item)
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+            return
+        if not future.done():
+            future.set_result(result)
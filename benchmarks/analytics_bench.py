@@ -0,0 +1,138 @@
+# Cross-user mood analytics and journal export over millions of entries
+#
+# Writes a synthetic journal (default 1M entries from 50k users over a year)
+# into a bot database, then times reading it into columns (analytics.py),
+# the three analytics over the columns vs. the same counts as Python loops
+# over per-entry dicts (the shape the journal has in UserManager), and
+# exports to JSONL and CSV streamed straight from the database. Reports the
+# memory each form takes, and the peak while exporting.
+#
+# Run from the repo root:  python -m benchmarks.analytics_bench [--entries 1000000]
+
+import os
+import sys
+import json
+import time
+import random
+import sqlite3
+import argparse
+import datetime
+import tempfile
+import tracemalloc
+
+from analytics import MOODS, JournalColumns, export_sqlite, summary
+from storage import SCHEMA
+
+SYNTHESES = [
+    "The user felt overwhelmed by deadlines but found some relief talking it through.",
+    "They had a quiet, calm day and enjoyed a long walk after work.",
+    "Sleep has been poor and worries about family keep coming back at night.",
+    "A good conversation with a friend lifted their mood noticeably.",
+]
+
+
+def write_database(path, entries, users):
+    conn = sqlite3.connect(path)
+    conn.executescript(SCHEMA)
+    start = datetime.datetime(2024, 1, 1)
+    step = 365 * 86400 / entries
+    rows = []
+    for i in range(entries):
+        entry = {"timestamp": (start + datetime.timedelta(seconds=i * step)).isoformat(),
+                 "mood": random.choice(MOODS[:-1]), "synthesis": random.choice(SYNTHESES)}
+        rows.append((str(random.randrange(users)), entry["timestamp"], entry["mood"], json.dumps(entry)))
+        if len(rows) == 100_000:
+            conn.executemany("INSERT INTO mood_journal (user_id, timestamp, mood, data) VALUES (?, ?, ?, ?)", rows)
+            rows = []
+    conn.executemany("INSERT INTO mood_journal (user_id, timestamp, mood, data) VALUES (?, ?, ?, ?)", rows)
+    conn.commit()
+    conn.close()
+
+
+def load_dicts(path):
+    """The journal as SQLiteStorage.load builds it: {user_id: [entry dict, ...]}."""
+    journal = {}
+    conn = sqlite3.connect(path)
+    for uid, data in conn.execute("SELECT user_id, data FROM mood_journal ORDER BY id"):
+        journal.setdefault(uid, []).append(json.loads(data))
+    conn.close()
+    return journal
+
+
+def dict_analytics(journal):
+    distribution, transitions, weekdays = {}, {}, {}
+    for entries in journal.values():
+        previous = None
+        for entry in entries:
+            mood = entry["mood"]
+            distribution[mood] = distribution.get(mood, 0) + 1
+            day = datetime.datetime.fromisoformat(entry["timestamp"]).weekday()
+            weekdays[day, mood] = weekdays.get((day, mood), 0) + 1
+            if previous is not None:
+                transitions[previous, mood] = transitions.get((previous, mood), 0) + 1
+            previous = mood
+    return distribution, transitions, weekdays
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - start, result
+
+
+def traced(fn):
+    tracemalloc.start()
+    result = fn()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return size, result
+
+
+def peak(fn):
+    tracemalloc.start()
+    result = fn()
+    size = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return size, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Columnar journal analytics and export")
+    parser.add_argument("--entries", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=50_000)
+    args = parser.parse_args()
+    random.seed(11)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = os.path.join(tmp, "bench.db")
+        seconds, _ = timed(lambda: write_database(db, args.entries, args.users))
+        print(f"{args.entries:,} entries from {args.users:,} users ({seconds:.1f}s to write the database)\n")
+
+        load_columns, columns = timed(lambda: JournalColumns.from_sqlite(db))
+        load_dict, journal = timed(lambda: load_dicts(db))
+        column_bytes, _ = traced(lambda: JournalColumns.from_sqlite(db))
+        dict_bytes, _ = traced(lambda: load_dicts(db))
+        print(f"{'':<26}{'columns':>10}{'dicts':>10}")
+        print(f"{'load from SQLite':<26}{load_columns:>9.2f}s{load_dict:>9.2f}s")
+        print(f"{'memory':<26}{column_bytes / 1e6:>7.0f} MB{dict_bytes / 1e6:>7.0f} MB")
+
+        column_times = [timed(columns.distribution)[0], timed(columns.transitions)[0], timed(columns.weekday_trends)[0]]
+        dict_seconds, (distribution, _, _) = timed(lambda: dict_analytics(journal))
+        assert all(distribution.get(mood, 0) == count for mood, count in zip(MOODS, columns.distribution()))
+        print(f"{'distribution':<26}{column_times[0] * 1000:>8.1f}ms")
+        print(f"{'transitions':<26}{column_times[1] * 1000:>8.1f}ms")
+        print(f"{'weekday trends':<26}{column_times[2] * 1000:>8.1f}ms")
+        print(f"{'all three':<26}{sum(column_times):>9.2f}s{dict_seconds:>9.2f}s")
+
+        for fmt in ("jsonl", "csv"):
+            path = os.path.join(tmp, f"journal.{fmt}")
+            seconds, _ = timed(lambda: export_sqlite(db, path))
+            peak_bytes, _ = peak(lambda: export_sqlite(db, path))
+            print(f"{'export ' + fmt:<26}{seconds:>9.2f}s   {args.entries / seconds:,.0f} entries/s, "
+                  f"{os.path.getsize(path) / 1e6:.0f} MB, peak {peak_bytes / 1e6:.0f} MB in memory")
+
+    print("\n" + summary(columns).split("\n\n")[1])
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,77 @@
+# Request count and latency of mood/extract LLM calls with and without micro-batching
+#
+# A burst of users all needs a mood classification and an onboarding
+# extraction at once (the local extraction tier disabled so every call reaches the LLM).
+# The gateway keeps its default rate limit, which is where batching pays off:
+# single calls queue behind it and the tail runs into the call timeout.
+#
+# Run from the repo root:  python -m benchmarks.batch_bench [--users 100] [--latency 0.4]
+
+import os
+import sys
+import time
+import asyncio
+import argparse
+
+os.environ.setdefault("MISTRAL_API_KEY", "bench")
+
+from agent import UserManager, OnboardingManager
+from gateway import LLMGateway
+from storage import MemoryStorage
+from benchmarks.fake_mistral import FakeMistral
+from benchmarks.stats import percentile
+
+
+async def burst(name, server, users, max_size):
+    gateway = LLMGateway(server_url=server.url)
+    user_manager = UserManager(storage=MemoryStorage(), gateway=gateway)
+    onboarding = OnboardingManager(user_manager, None, gateway=gateway)
+    onboarding.extractor.threshold = float("inf")
+    for batcher in (user_manager.mood_batcher, onboarding.extract_batcher):
+        batcher.max_size = max_size
+    for i in range(users):
+        user_manager.user_conversations[str(i)] = {"conversation": [("work has been a lot lately", "I hear you 💛")]}
+
+    async def timed(call):
+        start = time.perf_counter()
+        try:
+            await call
+        except Exception:  # timed out waiting for the rate limiter
+            return None
+        return time.perf_counter() - start
+
+    requests_before = server.requests
+    start = time.perf_counter()
+    latencies = await asyncio.gather(
+        *(timed(user_manager.get_mood(str(i))) for i in range(users)),
+        *(timed(onboarding.extract("location", "somewhere near the coast")) for _ in range(users)),
+    )
+    elapsed = time.perf_counter() - start
+    await gateway.aclose()
+    failed = latencies.count(None)
+    latencies = [seconds for seconds in latencies if seconds is not None]
+
+    print(f"  {name:<12}{server.requests - requests_before:>10}{elapsed:>10.2f}s"
+          f"{percentile(latencies, .5):>10.2f}s{percentile(latencies, .95):>10.2f}s{failed:>9}")
+
+
+async def run(args):
+    server = await FakeMistral(latency=args.latency, jitter=args.latency / 4).start()
+    print(f"{args.users} moods + {args.users} extractions at once:")
+    print(f"  {'':<12}{'requests':>10}{'wall':>11}{'p50':>11}{'p95':>11}{'failed':>9}")
+    await burst("single", server, args.users, max_size=1)
+    await burst("batched", server, args.users, max_size=args.max_size)
+    await server.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-batching vs. single calls")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--latency", type=float, default=0.4, help="fake LLM latency in seconds")
+    parser.add_argument("--max-size", type=int, default=8, help="batch size for the batched run")
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,95 @@
+# Spend with and without per-user daily token budgets
+#
+# Twenty regular users send a handful of therapy messages each while three
+# heavy users send hundreds, against a fake Mistral that reports token usage
+# like the real one (about four characters per token). Compares the day's
+# tokens and cost per group with budgets off and with a small per-user
+# budget, and how the heavy users' replies degraded: the cheaper model past
+# the soft limit, then the over-budget reply.
+#
+# Run from the repo root:  python -m benchmarks.budget_bench [--budget 40000]
+
+import os
+import sys
+import random
+import asyncio
+import argparse
+
+os.environ.setdefault("MISTRAL_API_KEY", "bench")
+os.environ.setdefault("MISTRAL_RATE_LIMIT", "1000")
+os.environ.setdefault("MISTRAL_RATE_BURST", "1000")
+
+import gateway
+from agent import BUDGET_REPLY, CannedReply, TherapyAgent, UserManager
+from storage import MemoryStorage
+from benchmarks.fake_mistral import FakeMistral
+from benchmarks.fakes import FakeMessage, FakeUser
+
+CHAT = [
+    "I've been feeling really stressed about work lately.",
+    "I can't sleep well and I keep overthinking everything.",
+    "My friend cancelled on me again and it hurt more than I expected.",
+    "Honestly today was okay, I went for a walk.",
+]
+
+
+async def chat(user_manager, agent, user_id, messages, outcomes):
+    for _ in range(messages):
+        content = random.choice(CHAT)
+        reply = await agent.run(FakeMessage(FakeUser(int(user_id)), content), user_id)
+        outcomes[user_id] = outcomes.get(user_id, [0, 0])
+        outcomes[user_id][reply == BUDGET_REPLY] += 1
+        if not isinstance(reply, CannedReply):
+            user_manager.add_to_conversation(user_id, content, reply)
+
+
+async def scenario(name, server, args, budget):
+    random.seed(8)
+    llm = gateway.LLMGateway(server_url=server.url)
+    llm.usage.user_budget = budget
+    user_manager = UserManager(storage=MemoryStorage(), gateway=llm)
+    agent = TherapyAgent(user_manager, gateway=llm)
+    regulars = [str(1000 + i) for i in range(args.regulars)]
+    heavy = [str(9000 + i) for i in range(args.heavy)]
+    for user_id in regulars + heavy:
+        user_manager.onboard_user(user_id, "Alex", 30, "Austin, TX")
+
+    outcomes = {}
+    await asyncio.gather(*(chat(user_manager, agent, uid, args.messages, outcomes) for uid in regulars),
+                         *(chat(user_manager, agent, uid, args.heavy_messages, outcomes) for uid in heavy))
+    while any(user_manager.get_context(uid).busy for uid in regulars + heavy):  # summary folds still running
+        await asyncio.sleep(0.01)
+    await llm.aclose()
+
+    print(f"\n{name}")
+    print(f"  {'group':<10}{'tokens':>12}{'cost':>10}{'replies':>9}{'refused':>9}")
+    for group, users in (("regular", regulars), ("heavy", heavy)):
+        tokens = sum(llm.usage.spent(uid)[0] for uid in users)
+        cost = sum(llm.usage.spent(uid)[1] for uid in users)
+        replies = sum(outcomes[uid][0] for uid in users)
+        refused = sum(outcomes[uid][1] for uid in users)
+        print(f"  {group:<10}{tokens:>12,}{'$' + format(cost, '.4f'):>10}{replies:>9,}{refused:>9,}")
+    calls = {model: calls for (kind, model), (calls, *_) in llm.usage.routes.items() if kind == "therapy"}
+    print(f"  therapy calls per model: {calls}; day total ${llm.usage.spent_today()[1]:.4f}")
+
+
+async def run(args):
+    server = await FakeMistral(latency=0.01, jitter=0.002, stream_chunk_delay=0).start()
+    await scenario("no budget", server, args, budget=0)
+    await scenario(f"budget {args.budget:,} tokens per user per day", server, args, budget=args.budget)
+    await server.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Spend with and without per-user token budgets")
+    parser.add_argument("--regulars", type=int, default=20)
+    parser.add_argument("--messages", type=int, default=10, help="messages per regular user")
+    parser.add_argument("--heavy", type=int, default=3)
+    parser.add_argument("--heavy-messages", type=int, default=300, help="messages per heavy user")
+    parser.add_argument("--budget", type=int, default=40_000, help="tokens per user per day")
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,106 @@
+# Throughput of the crisis matcher over a large synthetic message corpus
+#
+# Compares the Aho-Corasick automaton in crisis.py with a compiled regex
+# alternation and a naive substring loop over the same normalized text, for
+# the real phrase list and for one padded with extra synthetic phrases, and
+# checks that all three agree on which messages match. The other two don't
+# know about negations, so the automaton is compared without its negation
+# guard; the guarded one, as detect() runs it, gets a row of its own.
+#
+# Run from the repo root:  python -m benchmarks.crisis_bench [messages]
+
+import re
+import sys
+import time
+import random
+
+from crisis import PHRASES, CrisisMatcher, normalize
+from benchmarks.stats import percentile
+
+WORDS = (
+    "i you we my work boss friend sister mom dad today tomorrow week feel feeling felt tired stressed "
+    "happy sad anxious calm busy sleep slept coffee walk run gym dinner lunch movie show phone text call "
+    "meeting deadline school class exam project team home house apartment rent money bills weekend trip "
+    "really just so very kind of maybe honestly again still always never lately skills myself killing "
+    "time dying laughing cutting edge ending hurt better off without dead battery live life"
+).split()
+CRISIS = [
+    "I don't want to be here anymore", "sometimes I think about killing myself", "I've been cutting again",
+    "everyone would be better off without me", "I feel so suicidal tonight", "he hits me when he drinks",
+]
+
+
+def corpus(n, crisis_rate=0.01):
+    random.seed(7)
+    messages = []
+    for _ in range(n):
+        words = random.choices(WORDS, k=random.randint(4, 60))
+        if random.random() < crisis_rate:
+            words.insert(random.randint(0, len(words)), random.choice(CRISIS))
+        messages.append(" ".join(words))
+    return messages
+
+
+def keys(phrases):
+    """(key, is_prefix) pairs on normalized text, with the same whole-word rules as CrisisMatcher."""
+    return [(normalize(p[:-1])[:-1], True) if p.endswith("*") else (normalize(p), False)
+            for patterns in phrases.values() for p in patterns]
+
+
+def regex_matcher(phrases):
+    pattern = re.compile("|".join(re.escape(key) for key, _ in sorted(keys(phrases), key=lambda k: -len(k[0]))))
+    return lambda text: pattern.search(normalize(text)) is not None
+
+
+def naive_matcher(phrases):
+    pairs = [key for key, _ in keys(phrases)]
+
+    def match(text):
+        text = normalize(text)
+        return any(key in text for key in pairs)
+    return match
+
+
+def padded(extra):
+    """The real phrases plus `extra` synthetic three-word phrases, to see how each matcher scales."""
+    random.seed(11)
+    synthetic = [" ".join(random.choices(WORDS, k=3)) + "x" for _ in range(extra)]
+    return {**PHRASES, "synthetic": synthetic}
+
+
+def run(name, match, messages):
+    latencies = []
+    hits = 0
+    start = time.perf_counter()
+    for text in messages:
+        t = time.perf_counter()
+        hits += bool(match(text))
+        latencies.append(time.perf_counter() - t)
+    elapsed = time.perf_counter() - start
+    megabytes = sum(len(m) for m in messages) / 1e6
+    print(f"  {name:<16}{len(messages) / elapsed:>12,.0f} msg/s{megabytes / elapsed:>8.1f} MB/s"
+          f"{percentile(latencies, .5) * 1e6:>9.1f} µs p50{percentile(latencies, .99) * 1e6:>9.1f} µs p99"
+          f"{hits:>9} matched")
+    return hits
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    messages = corpus(n)
+    print(f"{n:,} messages, {sum(len(m) for m in messages) / 1e6:.1f} MB")
+    for extra in (0, 1000):
+        phrases = padded(extra) if extra else PHRASES
+        count = sum(len(p) for p in phrases.values())
+        print(f"\n{count} phrases:")
+        run("aho + negation", CrisisMatcher(phrases).scan, messages)
+        hits = {
+            "aho-corasick": run("aho-corasick", CrisisMatcher(phrases, negatable=()).scan, messages),
+            "regex": run("regex", regex_matcher(phrases), messages),
+            "substring loop": run("substring loop", naive_matcher(phrases), messages),
+        }
+        if len(set(hits.values())) != 1:
+            print(f"  MISMATCH: {hits}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,155 @@
+# Local stand-in for the Mistral chat completions API
+#
+# Speaks just enough HTTP/1.1 (keep-alive, JSON and SSE streaming) for the
+# mistralai SDK. Latency, jitter, error rate and a slow tail (optionally per
+# model) are configurable so load tests can run without network access.
+#
+# Standalone:  python -m benchmarks.fake_mistral --port 8765 --latency 0.3
+
+import json
+import time
+import random
+import asyncio
+import argparse
+
+MOODS = ["Happy", "Sad", "Stressed", "Anxious", "Frustrated", "Angry", "Calm", "Excited", "Neutral"]
+REPLY = ("That sounds like a lot to carry right now 💛 What do you think is sitting underneath that feeling "
+         "when it shows up? Sometimes naming the root of it makes it a little lighter.")
+
+
+class FakeMistral:
+    def __init__(self, latency=0.3, jitter=0.1, error_rate=0.0, stream_chunk_delay=0.02,
+                 tail_rate=0.0, tail_factor=10.0, model_latency=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.stream_chunk_delay = stream_chunk_delay
+        self.tail_rate = tail_rate  # share of requests that take tail_factor times longer
+        self.tail_factor = tail_factor
+        self.model_latency = model_latency or {}  # model -> latency, overriding `latency`
+        self.requests = 0
+        self.by_model = {}  # model -> requests
+        self.errors = 0
+        self.batched_items = 0  # items that arrived inside multi-item requests
+        self.server = None
+        self.connections = set()
+
+    @property
+    def url(self):
+        host, port = self.server.sockets[0].getsockname()[:2]
+        return f"http://{host}:{port}"
+
+    async def start(self, host="127.0.0.1", port=0):
+        self.server = await asyncio.start_server(self._serve, host, port)
+        return self
+
+    async def close(self):
+        self.server.close()
+        for writer in self.connections:  # wait_closed also waits on idle keep-alive connections
+            writer.close()
+        await self.server.wait_closed()
+
+    def _content(self, body):
+        """Plausible output for whichever prompt the bot sent."""
+        system = body["messages"][0]["content"] if body["messages"] else ""
+        if body.get("response_format", {}).get("type") == "json_object":
+            if "classify it into one of the following moods" in system:
+                item = lambda: {"mood": random.choice(MOODS)}
+            else:
+                item = lambda: {"name": "Alex", "age": 21, "location": "San Francisco, CA"}
+            if "several numbered items" in system:  # batcher.BATCH_INSTRUCTIONS
+                count = body["messages"][-1]["content"].count("### Item ")
+                self.batched_items += count
+                return json.dumps({"results": [{"id": i, **item()} for i in range(count)]})
+            return json.dumps(item())
+        if "summarize" in system.lower() or "summary" in system.lower():
+            return "The user talked about feeling overwhelmed at work. They want more time for themselves."
+        return REPLY
+
+    async def _serve(self, reader, writer):
+        self.connections.add(writer)
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    key, _, value = line.decode().partition(":")
+                    headers[key.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+                await self._respond(writer, json.loads(body or b"{}"))
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.connections.discard(writer)
+            writer.close()
+
+    async def _respond(self, writer, body):
+        self.requests += 1
+        model = body.get("model", "fake")
+        self.by_model[model] = self.by_model.get(model, 0) + 1
+        latency = self.model_latency.get(model, self.latency)
+        if random.random() < self.tail_rate:
+            latency *= self.tail_factor
+        await asyncio.sleep(max(0.0, random.gauss(latency, self.jitter)))
+
+        if random.random() < self.error_rate:
+            self.errors += 1
+            status = random.choice([429, 503])
+            payload = json.dumps({"message": "simulated failure"}).encode()
+            writer.write(f"HTTP/1.1 {status} Error\r\nContent-Type: application/json\r\n"
+                         f"Content-Length: {len(payload)}\r\n\r\n".encode() + payload)
+            await writer.drain()
+            return
+
+        content = self._content(body)
+        meta = {"id": f"fake-{self.requests}", "model": model, "created": int(time.time())}
+        usage = {"prompt_tokens": sum(len(m.get("content") or "") for m in body["messages"]) // 4,
+                 "completion_tokens": len(content) // 4}
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+
+        if not body.get("stream"):
+            payload = json.dumps({**meta, "object": "chat.completion", "usage": usage, "choices": [
+                {"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}]}).encode()
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                         + f"Content-Length: {len(payload)}\r\n\r\n".encode() + payload)
+            await writer.drain()
+            return
+
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nTransfer-Encoding: chunked\r\n\r\n")
+        words = content.split(" ")
+        for i, word in enumerate(words):
+            chunk = {**meta, "object": "chat.completion.chunk", "choices": [
+                {"index": 0, "delta": {"content": word if i == 0 else " " + word},
+                 "finish_reason": "stop" if i == len(words) - 1 else None}]}
+            if i == len(words) - 1:
+                chunk["usage"] = usage
+            self._write_chunk(writer, f"data: {json.dumps(chunk)}\n\n".encode())
+            await writer.drain()
+            await asyncio.sleep(self.stream_chunk_delay)
+        self._write_chunk(writer, b"data: [DONE]\n\n")
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+    @staticmethod
+    def _write_chunk(writer, data):
+        writer.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.3)
+    parser.add_argument("--jitter", type=float, default=0.1)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--tail-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = await FakeMistral(args.latency, args.jitter, args.error_rate, tail_rate=args.tail_rate).start(port=args.port)
+    print(f"Fake Mistral listening on {server.url} (set MISTRAL_SERVER_URL to this)")
+    await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
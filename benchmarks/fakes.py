@@ -0,0 +1,104 @@
+# Minimal stand-ins for the discord.py objects the bot touches
+#
+# Only the attributes and coroutines bot.py and agent.py actually use are
+# implemented. Every send/reply/edit is timestamped so the load test can
+# measure time-to-first-response.
+
+import time
+import itertools
+
+_ids = itertools.count(1)
+
+
+class FakeUser:
+    def __init__(self, user_id=None, bot=False):
+        self.id = user_id if user_id is not None else next(_ids)
+        self.bot = bot
+        self.name = f"user{self.id}"
+
+    def __str__(self):
+        return self.name
+
+
+class FakeSentMessage:
+    def __init__(self, channel, content):
+        self.channel = channel
+        self.content = content
+
+    async def edit(self, content=None, **kwargs):
+        self.channel.record("edit", content)
+        self.content = content
+        return self
+
+
+class FakeChannel:
+    def __init__(self):
+        self.events = []  # (perf_counter, kind, content)
+
+    def record(self, kind, content):
+        self.events.append((time.perf_counter(), kind, content))
+
+    async def send(self, content=None, **kwargs):
+        self.record("send", content)
+        return FakeSentMessage(self, content)
+
+
+class FakeMessage:
+    def __init__(self, author, content, channel=None):
+        self.id = next(_ids)
+        self.author = author
+        self.content = content
+        self.channel = channel or FakeChannel()
+        self.created = time.perf_counter()
+
+    async def reply(self, content=None, **kwargs):
+        self.channel.record("reply", content)
+        return FakeSentMessage(self.channel, content)
+
+
+class FakeResponse:
+    def __init__(self, interaction):
+        self.interaction = interaction
+        self._done = False
+
+    def is_done(self):
+        return self._done
+
+    async def defer(self, **kwargs):
+        self._done = True
+        self.interaction.record("defer", None)
+
+    async def send_message(self, content=None, **kwargs):
+        self._done = True
+        self.interaction.record("send_message", content)
+
+    async def edit_message(self, content=None, **kwargs):
+        self._done = True
+        self.interaction.record("edit_message", content)
+
+
+class FakeFollowup:
+    def __init__(self, interaction):
+        self.interaction = interaction
+
+    async def send(self, content=None, wait=False, **kwargs):
+        self.interaction.record("followup", content)
+        return FakeSentMessage(self.interaction, content) if wait else None
+
+
+class FakeInteraction:
+    def __init__(self, client, user, custom_id=None):
+        self.id = next(_ids)
+        self.client = client
+        self.user = user
+        self.data = {"custom_id": custom_id}
+        self.response = FakeResponse(self)
+        self.followup = FakeFollowup(self)
+        self.events = []
+        self.created = time.perf_counter()
+
+    def record(self, kind, content):
+        self.events.append((time.perf_counter(), kind, content))
+
+    async def edit_original_response(self, content=None, **kwargs):
+        self.record("edit_original", content)
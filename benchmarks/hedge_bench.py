@@ -0,0 +1,99 @@
+# Latency tails with per-kind model routing and hedged requests
+#
+# Sends a steady stream of therapy replies (streamed and not) and onboarding
+# extractions through the gateway against a fake Mistral where a few percent
+# of requests are 10x slower, as when one upstream replica is struggling.
+# Compares everything on the large model, routing by kind, and routing plus
+# hedging to the fallback model after the route's p95.
+#
+# Run from the repo root:  python -m benchmarks.hedge_bench [--calls 1200] [--tail-rate 0.02]
+
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+
+os.environ.setdefault("MISTRAL_API_KEY", "bench")
+os.environ.setdefault("MISTRAL_RATE_LIMIT", "1000")
+os.environ.setdefault("MISTRAL_RATE_BURST", "1000")
+os.environ.setdefault("MISTRAL_MAX_CONCURRENCY", "64")
+os.environ.setdefault("MISTRAL_MODEL_CONCURRENCY", "64")
+
+import gateway
+from agent import EXTRACT_INFO_PROMPT, SYSTEM_PROMPT
+from benchmarks.fake_mistral import FakeMistral
+from benchmarks.stats import percentile
+
+CALLS = {
+    "therapy": [{"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": "I keep overthinking everything"}],
+    "extract": [{"role": "system", "content": EXTRACT_INFO_PROMPT},
+                {"role": "user", "content": "somewhere near the coast"}],
+}
+
+
+async def one(llm, kind):
+    start = time.perf_counter()
+    if kind == "stream":
+        async for _ in llm.stream(CALLS["therapy"], kind="therapy"):
+            break  # time to first token is what the user waits on
+    elif kind == "extract":
+        await llm.complete(CALLS[kind], kind=kind, response_format={"type": "json_object"})
+    else:
+        await llm.complete(CALLS[kind], kind=kind)
+    return kind, time.perf_counter() - start
+
+
+async def scenario(name, server, args, routes, hedging):
+    gateway.ROUTES.update(routes)
+    gateway.HEDGING = hedging
+    llm = gateway.LLMGateway(server_url=server.url)
+    requests = server.requests
+    random.seed(3)
+    kinds = random.choices(["therapy", "stream", "extract"], k=args.calls)
+
+    # Open loop at a fixed arrival rate, so slow calls overlap instead of slowing the senders
+    tasks = []
+    for kind in kinds:
+        tasks.append(asyncio.create_task(one(llm, kind)))
+        await asyncio.sleep(1 / args.rate)
+    results = await asyncio.gather(*tasks)
+    await llm.aclose()
+
+    sent = server.requests - requests
+    print(f"\n{name}: {sent} requests for {args.calls} calls (+{(sent - args.calls) / args.calls:.0%})")
+    print(f"  {'kind':<16}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}")
+    for kind, label in (("therapy", "therapy"), ("stream", "therapy ttft"), ("extract", "extract")):
+        seconds = [s for k, s in results if k == kind]
+        print(f"  {label:<16}{percentile(seconds, .5):>8.2f}s{percentile(seconds, .95):>8.2f}s"
+              f"{percentile(seconds, .99):>8.2f}s{max(seconds):>8.2f}s")
+
+
+async def run(args):
+    model_latency = {gateway.LARGE_MODEL: args.latency, gateway.SMALL_MODEL: args.latency / 2.5}
+    server = await FakeMistral(latency=args.latency, jitter=args.latency / 10, tail_rate=args.tail_rate,
+                               model_latency=model_latency, stream_chunk_delay=0.005).start()
+    routed = dict(gateway.ROUTES)
+    large = {kind: (gateway.LARGE_MODEL, None) for kind in routed}
+
+    await scenario("large model only", server, args, large, hedging=False)
+    await scenario("routed by kind", server, args, routed, hedging=False)
+    await scenario("routed + hedged", server, args, routed, hedging=True)
+    print(f"\nrequests per model: {server.by_model}")
+    await server.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Latency tails with model routing and hedging")
+    parser.add_argument("--calls", type=int, default=1200)
+    parser.add_argument("--rate", type=float, default=40, help="calls started per second")
+    parser.add_argument("--latency", type=float, default=0.5, help="large model latency in seconds")
+    parser.add_argument("--tail-rate", type=float, default=0.02, help="share of requests 10x slower")
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
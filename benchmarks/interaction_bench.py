@@ -0,0 +1,101 @@
+# Feature button acknowledgement: deferring at once vs. the dispatcher's deadline
+#
+# Users click feature buttons, each clicking twice in quick succession, against
+# a fake Mistral that is either fast (pools warm, the usual case) or slower
+# than Discord's 3 second acknowledgement window (pools empty, the API
+# struggling). Compares three ways to acknowledge through
+# interactions.InteractionDispatcher: deferring at once, as the old buttons
+# did; deferring at the ACK_DEADLINE; and never deferring. Reports
+# click-to-acknowledgement and click-to-answer latency, clicks acknowledged too
+# late for Discord, REST calls per click and LLM calls per click. Under the
+# slow LLM some clicks are shed to fallback content and answered at once.
+#
+# Run from the repo root:  python -m benchmarks.interaction_bench [--users 100]
+
+import os
+import sys
+import types
+import functools
+import random
+import asyncio
+import argparse
+
+os.environ.setdefault("MISTRAL_API_KEY", "bench")
+os.environ.setdefault("MISTRAL_RATE_LIMIT", "1000")
+os.environ.setdefault("MISTRAL_RATE_BURST", "1000")
+
+import gateway
+from agent import ButtonManager
+from bot import FEATURE_HEADINGS, send_feature
+from interactions import ACK_DEADLINE, InteractionDispatcher
+from benchmarks.fake_mistral import FakeMistral
+from benchmarks.fakes import FakeInteraction, FakeUser
+from benchmarks.stats import percentile
+
+DISCORD_DEADLINE = 3.0
+
+
+async def user_clicks(client, feature, gap, results):
+    user = FakeUser()
+    clicks = [FakeInteraction(client, user, custom_id=feature)]
+    first = asyncio.ensure_future(client.interactions.dispatch(clicks[0], feature))
+    await asyncio.sleep(gap)
+    clicks.append(FakeInteraction(client, user, custom_id=feature))
+    await client.interactions.dispatch(clicks[1], feature)
+    await first
+    for interaction in clicks:
+        times = [t - interaction.created for t, _, _ in interaction.events]
+        answers = [t - interaction.created for t, kind, _ in interaction.events if kind != "defer"]
+        results.append((times[0] if times else None, answers[0] if answers else None, len(interaction.events)))
+
+
+async def scenario(name, server, args, ack_deadline):
+    llm = gateway.LLMGateway(server_url=server.url)
+    client = types.SimpleNamespace(button_manager=ButtonManager(gateway=llm),
+                                   interactions=InteractionDispatcher(ack_deadline=ack_deadline))
+    for feature, heading in FEATURE_HEADINGS.items():
+        client.interactions.register(feature, functools.partial(send_feature, feature, heading))
+    await llm.warm_up()
+    requests = server.requests
+
+    results = []
+    await asyncio.gather(*(user_clicks(client, random.choice(list(FEATURE_HEADINGS)), args.gap, results)
+                           for _ in range(args.users)))
+    await llm.aclose()
+
+    acks = sorted(a for a, _, _ in results if a is not None)
+    answers = sorted(a for _, a, _ in results if a is not None)
+    late = sum(a is None or a > DISCORD_DEADLINE for a, _, _ in results)
+    rest = sum(n for _, _, n in results) / len(results)
+    print(f"  {name:<22}{percentile(acks, 0.5):>8.2f}{percentile(acks, 0.99):>8.2f}"
+          f"{percentile(answers, 0.5):>8.2f}{percentile(answers, 0.99):>8.2f}"
+          f"{late:>6}{rest:>6.2f}{(server.requests - requests) / len(results):>6.2f}")
+
+
+async def run(args):
+    for latency in (args.fast, args.slow):
+        random.seed(5)
+        server = await FakeMistral(latency=latency, jitter=latency / 10).start()
+        print(f"\nLLM {latency:.1f}s per call, {args.users} users clicking twice {args.gap * 1000:.0f}ms apart "
+              f"({2 * args.users} clicks)")
+        print(f"  {'acknowledge':<22}{'ack p50':>8}{'p99':>8}{'ans p50':>8}{'p99':>8}{'late':>6}{'REST':>6}{'LLM':>6}")
+        await scenario("at once (old buttons)", server, args, ack_deadline=0)
+        await scenario(f"deadline {ACK_DEADLINE:.1f}s", server, args, ack_deadline=ACK_DEADLINE)
+        await scenario("never", server, args, ack_deadline=float("inf"))
+        await server.close()
+    print("\nack/ans: seconds from the click; late: clicks not acknowledged within Discord's 3s; "
+          "REST and LLM: calls per click")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Feature button acknowledgement latency")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--gap", type=float, default=0.2, help="seconds between a user's two clicks")
+    parser.add_argument("--fast", type=float, default=0.3, help="LLM latency of the fast run")
+    parser.add_argument("--slow", type=float, default=4.0, help="LLM latency of the slow run")
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
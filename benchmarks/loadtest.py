@@ -0,0 +1,207 @@
+# Offline load test for the bot pipeline
+#
+# Drives DiscordBot.on_message (onboarding, therapy replies, mood journaling)
+# and the feature button callbacks with fake Discord objects, against a local
+# Mistral stand-in with configurable latency, jitter and error rate. Reports
+# throughput, p50/p95/p99 latency per pipeline stage and event-loop lag.
+#
+# Run from the repo root:
+#   python -m benchmarks.loadtest --users 200 --messages 12 --latency 0.3 --error-rate 0.02
+
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+
+# The bot reads its configuration at import time
+os.environ.setdefault("THERABOT_DB", "")  # keep everything in memory
+os.environ.setdefault("MISTRAL_API_KEY", "loadtest")
+os.environ.setdefault("MISTRAL_RATE_LIMIT", "100000")
+os.environ.setdefault("MISTRAL_RATE_BURST", "100000")
+os.environ.setdefault("MISTRAL_MAX_CONCURRENCY", "256")
+os.environ.setdefault("MISTRAL_MODEL_CONCURRENCY", "256")
+
+import bot as bot_module
+from gateway import LLMGateway
+from benchmarks.fake_mistral import FakeMistral
+from benchmarks.fakes import FakeUser, FakeMessage, FakeInteraction
+from benchmarks.stats import percentile
+
+BUTTONS = ["affirmation", "selfcare", "mindful", "ground", "gratitude"]
+ONBOARDING_ANSWERS = [
+    ["Alex", "Sam", "my name is Jordan", "it's complicated, call me whatever you like"],
+    ["21", "twenty one", "I'm 34", "old enough I guess"],
+    ["sf", "I live in nyc", "Austin, TX", "a small town up north"],
+]
+CHAT = [
+    "I've been feeling really stressed about work lately.",
+    "I can't sleep well and I keep overthinking everything.",
+    "My friend cancelled on me again and it hurt more than I expected.",
+    "Honestly today was okay, I went for a walk.",
+    "I don't know why I keep procrastinating on things that matter.",
+]
+
+
+class Recorder:
+    def __init__(self):
+        self.first = {}  # stage -> [seconds until the first visible response]
+        self.done = {}  # stage -> [seconds until handling finished]
+        self.errors = 0
+
+    def add(self, stage, first, done):
+        if first is not None:
+            self.first.setdefault(stage, []).append(first)
+        self.done.setdefault(stage, []).append(done)
+
+
+class LoopLagMonitor:
+    """Measures how late a 10ms sleep wakes up, i.e. how long the loop was blocked."""
+
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.lags = []
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            self.lags.append(max(0.0, loop.time() - start - self.interval))
+
+    def stop(self):
+        self._task.cancel()
+
+
+async def send(bot, recorder, user, content, stage=None):
+    """Push one message through on_message and wait until the bot has handled it."""
+    user_id = str(user.id)
+    if stage is None:
+        state = bot.user_manager.user_states.get(user_id, {})
+        if bot.onboarding_manager.needs_onboarding(user_id):
+            stage = "onboarding"
+        elif state.get("awaiting_mood_journal"):
+            stage = "journal"
+        elif state.get("awaiting_exercise_decision"):
+            stage = "exercise_decision"
+        else:
+            stage = "therapy"
+
+    message = FakeMessage(user, content)
+    start = time.perf_counter()
+    await bot.on_message(message)
+    # The dispatcher runs each user's jobs in order, so this resolves once the message is handled
+    await bot.dispatcher.submit(user_id, asyncio.sleep, 0)
+    done = time.perf_counter() - start
+
+    events = message.channel.events
+    first = events[0][0] - start if events else None
+    if stage == "therapy" and events and "log your mood" in (events[-1][2] or ""):
+        stage = "journal_offer"
+    recorder.add(stage, first, done)
+    return events[-1][2] if events else ""
+
+
+async def click(bot, recorder, user, feature):
+    interaction = FakeInteraction(bot, user, custom_id=feature)
+    start = time.perf_counter()
+    try:
+        await bot.interactions.dispatch(interaction, feature)
+    except Exception:
+        recorder.errors += 1
+        return
+    done = time.perf_counter() - start
+    # The content is the response, or a followup when the answer missed the acknowledgement deadline
+    content = [t for t, kind, _ in interaction.events if kind in ("followup", "send_message")]
+    recorder.add(f"button:{feature}", content[0] - start if content else None, done)
+
+
+async def simulate_user(bot, recorder, messages, clicks):
+    user = FakeUser()
+    await send(bot, recorder, user, "hi")
+    for answers in ONBOARDING_ANSWERS:
+        await send(bot, recorder, user, random.choice(answers))
+
+    for _ in range(messages):
+        reply = await send(bot, recorder, user, random.choice(CHAT))
+        if "log your mood" in reply:
+            reply = await send(bot, recorder, user, "yes")
+            if "(yes/no)" in reply or "(continue/exercises)" in reply:
+                await send(bot, recorder, user, "no")
+
+    for _ in range(clicks):
+        await click(bot, recorder, user, random.choice(BUTTONS))
+
+
+async def run(args):
+    server = await FakeMistral(args.latency, args.jitter, args.error_rate).start()
+
+    bot = bot_module.DiscordBot()
+    gateway = LLMGateway(server_url=server.url)
+    for owner in (bot, bot.user_manager, bot.therapy_agent, bot.onboarding_manager, bot.button_manager):
+        owner.gateway = gateway
+
+    # Commands need a logged-in gateway connection, which a load test doesn't have
+    async def no_commands(message):
+        pass
+    bot.process_commands = no_commands
+    if args.warm_pools:
+        bot.button_manager.start()
+
+    recorder = Recorder()
+    monitor = LoopLagMonitor()
+    monitor.start()
+    start = time.perf_counter()
+    results = await asyncio.gather(
+        *(simulate_user(bot, recorder, args.messages, args.clicks) for _ in range(args.users)),
+        return_exceptions=True,
+    )
+    elapsed = time.perf_counter() - start
+    monitor.stop()
+    recorder.errors += sum(isinstance(r, Exception) for r in results)
+
+    actions = sum(len(v) for v in recorder.done.values())
+    print(f"\n{args.users} users, {actions} actions in {elapsed:.2f}s -> {actions / elapsed:.1f} actions/s")
+    print(f"LLM requests: {server.requests} ({server.errors} simulated errors, {server.batched_items} items sent batched), "
+          f"failed users/clicks: {recorder.errors}")
+    tokens, cost = gateway.usage.spent_today()
+    per_user = sorted(spent for spent, _ in (gateway.usage.spent(uid) for uid in gateway.usage.users))
+    print(f"LLM tokens: {tokens:,} (${cost:.4f} at MODEL_PRICES), per user p50 {percentile(per_user, .5):,.0f} "
+          f"max {max(per_user, default=0):,}")
+    print(f"\n{'stage':<22}{'n':>7}{'first p50':>11}{'p95':>8}{'p99':>8}{'done p50':>11}{'p95':>8}{'p99':>8}")
+    for stage in sorted(recorder.done):
+        first, done = recorder.first.get(stage, []), recorder.done[stage]
+        print(f"{stage:<22}{len(done):>7}"
+              f"{percentile(first, .5):>11.3f}{percentile(first, .95):>8.3f}{percentile(first, .99):>8.3f}"
+              f"{percentile(done, .5):>11.3f}{percentile(done, .95):>8.3f}{percentile(done, .99):>8.3f}")
+    lags = monitor.lags
+    print(f"\nevent loop lag: p50 {percentile(lags, .5) * 1000:.2f}ms  p99 {percentile(lags, .99) * 1000:.2f}ms  "
+          f"max {max(lags, default=0) * 1000:.2f}ms")
+
+    await bot.dispatcher.close()
+    await gateway.aclose()
+    await server.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline load test for the bot pipeline")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--messages", type=int, default=9, help="chat messages per user after onboarding")
+    parser.add_argument("--clicks", type=int, default=3, help="button clicks per user")
+    parser.add_argument("--latency", type=float, default=0.3, help="mean upstream latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.1, help="latency standard deviation in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with 429/503")
+    parser.add_argument("--warm-pools", action="store_true", help="pre-generate button content before starting")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+    random.seed(args.seed)
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
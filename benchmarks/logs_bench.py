@@ -0,0 +1,85 @@
+# Cost of a !logs call as the journal grows
+#
+# Fills one user's journal with 10 to 100k entries a few hours apart, then
+# times what !logs does per call: formatting the whole journal into one string
+# and cutting it into 2000-character messages (how it used to work) vs.
+# rendering one page through the journal index, unfiltered, by mood, by date
+# range, and paging back from the newest page.
+#
+# Run from the repo root:  python -m benchmarks.logs_bench
+
+import sys
+import time
+import random
+import datetime
+
+from agent import UserManager
+from journal import JournalQuery
+from mood import MOOD_LABELS
+from storage import MemoryStorage
+
+USER = "1"
+
+
+def full_history(user_manager, user_id):
+    """The old get_mood_logs: every entry, every call."""
+    profile = user_manager.user_profiles[user_id]
+    lines = [f"📓 User: {profile['name']} | {profile['age']} | {profile['location']} \n"]
+    for i, entry in enumerate(user_manager.mood_journal[user_id], 1):
+        lines.append(f"📅 **Entry {i}:**\n- Timestamp: {entry['timestamp']}\n- Mood: {entry['mood']}\n"
+                     f"- Summary: {entry['synthesis']}\n")
+    logs = "\n".join(lines)
+    return [logs[i:i + 2000] for i in range(0, len(logs), 2000)]
+
+
+def build(entries):
+    user_manager = UserManager(storage=MemoryStorage())
+    user_manager.onboard_user(USER, "Alex", 34, "Austin, TX")
+    start = datetime.datetime(2020, 1, 1)
+    journal = user_manager.mood_journal.setdefault(USER, [])
+    for i in range(entries):
+        journal.append({"timestamp": (start + datetime.timedelta(hours=6 * i)).isoformat(), "name": "Alex",
+                        "age": 34, "location": "Austin, TX", "mood": random.choice(MOOD_LABELS),
+                        "synthesis": "The user talked about work and sleep and felt a little lighter afterwards. " * 2})
+    return user_manager, start + datetime.timedelta(hours=6 * entries)
+
+
+def timed(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        t = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - t)
+    return best * 1000, result
+
+
+def main():
+    random.seed(4)
+    print(f"{'entries':>8}{'full':>11}{'messages':>10}{'page':>10}{'by mood':>10}{'by date':>10}{'10 back':>10}")
+    for entries in (10, 100, 1_000, 10_000, 100_000):
+        user_manager, end = build(entries)
+        repeat = 3 if entries >= 10_000 else 20
+        mid = (end - datetime.timedelta(days=30)).date()
+        by_date = JournalQuery.parse([mid.isoformat(), (mid + datetime.timedelta(days=7)).isoformat()])
+
+        def back(pages=10):
+            query, before = JournalQuery(), None
+            for _ in range(pages):
+                _, before, _ = user_manager.mood_log_page(USER, query, before)
+                if before is None:
+                    break
+
+        full_ms, chunks = timed(lambda: full_history(user_manager, USER), repeat)
+        page_ms, _ = timed(lambda: user_manager.mood_log_page(USER, JournalQuery()), repeat)
+        # The first mood query builds the per-mood positions; later ones only catch up on new entries
+        user_manager.mood_log_page(USER, JournalQuery(mood="Stressed"))
+        mood_ms, _ = timed(lambda: user_manager.mood_log_page(USER, JournalQuery(mood="Stressed")), repeat)
+        date_ms, _ = timed(lambda: user_manager.mood_log_page(USER, by_date), repeat)
+        back_ms, _ = timed(back, repeat)
+        print(f"{entries:>8,}{full_ms:>9.2f}ms{len(chunks):>10,}{page_ms:>8.3f}ms{mood_ms:>8.3f}ms"
+              f"{date_ms:>8.3f}ms{back_ms:>8.3f}ms")
+    print("\nfull is the old one-string-per-call !logs; the rest render one page (10 back: ten pages in a row)")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,87 @@
+# Prompt size, index cost and recall of the therapy memory as history grows
+#
+# Builds a user with N filler turns plus a few planted facts early on, then
+# checks that a related message later retrieves each fact, how long indexing
+# and search take, and how big the therapy prompt is compared with sending
+# the whole history.
+#
+# Run from the repo root:  python -m benchmarks.memory_bench [turns ...]
+
+import sys
+import time
+import random
+import asyncio
+
+from agent import UserManager, TherapyAgent
+from context import estimate_tokens, render_turn
+from storage import MemoryStorage
+from benchmarks.fakes import FakeUser, FakeMessage
+
+FILLER = [
+    "Work was busy again, lots of meetings.", "I went for a walk after lunch.", "Didn't sleep great last night.",
+    "Had coffee with a coworker.", "I've been procrastinating on my taxes.", "The weather has been gloomy.",
+    "Watched a show and went to bed early.", "My commute took forever today.", "Cooked pasta for dinner.",
+    "I feel kind of flat, nothing special happening.", "Spent the evening scrolling on my phone.",
+]
+# (planted early, asked about much later)
+FACTS = [
+    ("My sister Emma and I had a huge fight about who takes care of mom.",
+     "Emma called me about mom again and I'm dreading it"),
+    ("I adopted a rescue dog named Biscuit last month, he's so anxious around strangers.",
+     "Biscuit hid under the bed all day when the guests came over"),
+    ("My thesis advisor said my dissertation draft needs a complete rewrite.",
+     "I opened the dissertation file and just closed it again"),
+    ("I've been having panic attacks on the subway since the accident.",
+     "Had another panic attack underground this morning"),
+]
+REPLY = "That sounds like a lot to carry 💛 What do you think sits underneath that feeling?"
+
+
+async def run(turns):
+    user_manager = UserManager(storage=MemoryStorage())
+    agent = TherapyAgent(user_manager)
+    user = FakeUser()
+    user_id = str(user.id)
+    user_manager.onboard_user(user_id, "Alex", 30, "Denver, CO")
+    history = user_manager.user_conversations[user_id]["conversation"]
+    for fact, _ in FACTS:
+        history.append((fact, REPLY))
+    history += [(random.choice(FILLER), REPLY) for _ in range(turns - len(FACTS))]
+
+    start = time.perf_counter()
+    memory = user_manager.get_memory(user_id)
+    build = time.perf_counter() - start
+
+    # The index update add_to_conversation does per turn
+    start = time.perf_counter()
+    for _ in range(100):
+        text = random.choice(FILLER)
+        memory.add(text, render_turn(text, REPLY), turn=len(history))
+        history.append((text, REPLY))
+    add = (time.perf_counter() - start) / 100
+
+    recalled, search, prompt_tokens = 0, [], []
+    for fact, question in FACTS:
+        start = time.perf_counter()
+        messages = await agent._build_messages(FakeMessage(user, question), user_id)
+        search.append(time.perf_counter() - start)
+        recalled += fact in messages[0]["content"]
+        prompt_tokens.append(sum(estimate_tokens(m["content"]) for m in messages))
+
+    full = sum(estimate_tokens(render_turn(u, b)) for u, b in history)
+    print(f"{turns:>8}{build * 1000:>11.1f} ms{add * 1e6:>10.0f} µs{max(search) * 1000:>10.2f} ms"
+          f"{recalled:>6}/{len(FACTS)}{max(prompt_tokens):>10}{full:>14,}{memory.nbytes / 1e6:>10.1f} MB")
+
+
+def main():
+    random.seed(1)
+    sizes = [int(n) for n in sys.argv[1:]] or [100, 1000, 10000]
+    print(f"{'turns':>8}{'build':>14}{'add':>13}{'search':>13}{'recall':>8}{'prompt':>10}"
+          f"{'full history':>14}{'index':>13}")
+    for turns in sizes:
+        asyncio.run(run(turns))
+    print("\nprompt and full history in estimated tokens; search includes building the prompt")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,112 @@
+# Latency per call kind when the LLM is overloaded, with and without priorities
+#
+# Floods the managers with button clicks, journal analyses, onboarding
+# extractions, therapy replies and a few crisis replies at once against a slow
+# fake Mistral and a tight concurrency/rate limit. "fifo" puts every kind in
+# one unbounded queue (how the gateway worked before admission control);
+# "priority" uses the gateway's priorities, queue limits and wait budgets, and
+# the managers' degraded fallbacks.
+#
+# Run from the repo root:  python -m benchmarks.overload_bench [--latency 2.0]
+
+import os
+import sys
+import time
+import asyncio
+import argparse
+
+os.environ.setdefault("MISTRAL_API_KEY", "bench")
+os.environ.setdefault("MISTRAL_MAX_CONCURRENCY", "4")
+os.environ.setdefault("MISTRAL_MODEL_CONCURRENCY", "4")
+os.environ.setdefault("MISTRAL_TIMEOUT", "60")
+
+import gateway
+import metrics
+from agent import BUSY_REPLY, ButtonManager, OnboardingManager, TherapyAgent, UserManager
+from storage import MemoryStorage
+from benchmarks.fake_mistral import FakeMistral
+from benchmarks.fakes import FakeUser, FakeMessage
+from benchmarks.stats import percentile
+
+LOAD = {"crisis": 5, "therapy": 40, "extract": 30, "journal": 30, "button": 100}
+
+
+async def flood(name, server):
+    llm = gateway.LLMGateway(server_url=server.url)
+    user_manager = UserManager(storage=MemoryStorage(), gateway=llm)
+    therapy = TherapyAgent(user_manager, gateway=llm)
+    onboarding = OnboardingManager(user_manager, therapy, gateway=llm)
+    buttons = ButtonManager(gateway=llm)
+    onboarding.extractor.threshold = float("inf")
+    for batcher in (user_manager.mood_batcher, onboarding.extract_batcher):
+        batcher.max_size = 1  # one request per call, so the queueing is what's measured
+
+    results = {kind: [] for kind in LOAD}  # kind -> [(seconds, degraded)]
+
+    async def timed(kind, call):
+        start = time.perf_counter()
+        try:
+            result = await call
+            degraded = result == BUSY_REPLY or (kind == "journal" and result[1].startswith("You talked about"))
+        except Exception:
+            result, degraded = None, True
+        results[kind].append((time.perf_counter() - start, degraded))
+
+    calls = []
+    for i in range(LOAD["journal"]):
+        user_manager.user_conversations[f"j{i}"] = {"conversation": [("work has been a lot lately", "I hear you 💛")]}
+        calls.append(timed("journal", user_manager.analyze_for_journal(f"j{i}")))
+    for _ in range(LOAD["button"]):
+        calls.append(timed("button", buttons.get_feature_content("affirmation")))
+    for _ in range(LOAD["extract"]):
+        calls.append(timed("extract", onboarding.extract("location", "somewhere near the coast")))
+    for _ in range(LOAD["therapy"]):
+        calls.append(timed("therapy", therapy.run(FakeMessage(FakeUser(), "I keep overthinking everything"), "t")))
+    for _ in range(LOAD["crisis"]):
+        message = FakeMessage(FakeUser(), "I don't want to be here anymore")
+        calls.append(timed("crisis", therapy.run(message, "c", crisis=True)))
+
+    start = time.perf_counter()
+    await asyncio.gather(*calls)
+    elapsed = time.perf_counter() - start
+    await llm.aclose()
+
+    print(f"\n{name}: {elapsed:.1f}s for everything")
+    print(f"  {'kind':<10}{'n':>5}{'p50':>9}{'p99':>9}{'max':>9}{'degraded':>10}")
+    for kind, values in results.items():
+        seconds = [s for s, _ in values]
+        print(f"  {kind:<10}{len(values):>5}{percentile(seconds, .5):>8.2f}s{percentile(seconds, .99):>8.2f}s"
+              f"{max(seconds):>8.2f}s{sum(d for _, d in values):>10}")
+
+
+async def run(args):
+    server = await FakeMistral(latency=args.latency, jitter=args.latency / 4).start()
+
+    # Everything equal and unbounded, as before admission control
+    saved = dict(gateway.PRIORITIES), list(gateway.QUEUE_LIMITS), list(gateway.MAX_WAIT)
+    gateway.PRIORITIES.update({kind: 3 for kind in gateway.PRIORITIES})
+    gateway.QUEUE_LIMITS[:] = [None] * len(gateway.QUEUE_LIMITS)
+    gateway.MAX_WAIT[:] = [None] * len(gateway.MAX_WAIT)
+    await flood("fifo", server)
+
+    gateway.PRIORITIES.update(saved[0])
+    gateway.QUEUE_LIMITS[:] = saved[1]
+    gateway.MAX_WAIT[:] = saved[2]
+    await flood("priority", server)
+
+    shed = {dict(key)["reason"]: 0 for key in metrics.LLM_SHED.values}
+    for key, count in metrics.LLM_SHED.values.items():
+        shed[dict(key)["reason"]] += count
+    print(f"\nshed calls by reason: {shed}")
+    await server.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Overload behaviour with and without priorities")
+    parser.add_argument("--latency", type=float, default=2.0, help="fake LLM latency in seconds")
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
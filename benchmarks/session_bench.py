@@ -0,0 +1,115 @@
+# Memory held by user state at 100k users, unbounded vs. the session store
+#
+# Simulates a big server's history: every user onboarded, chatted a few turns
+# and maybe journaled, on a fake clock spread over a few days. Then a burst
+# of traffic in which most messages come from a small group of regulars and
+# the rest from users who have gone cold. Reports traced memory with every
+# session kept live (how UserManager used to hold state), with the default
+# live cap and idle TTL, and with SQLite behind the store, where the cold tier
+# is capped and dropped users are looked up in storage. Also how long bringing
+# back a user that isn't live takes.
+#
+# Run from the repo root:  python -m benchmarks.session_bench [users]
+
+import os
+import sys
+import time
+import random
+import tempfile
+import tracemalloc
+
+import sessions
+from agent import UserManager
+from storage import MemoryStorage, SQLiteStorage
+from benchmarks.stats import percentile
+
+WORDS = (
+    "work boss friend sister mom dad today week tired stressed happy sad anxious calm busy sleep coffee walk "
+    "gym dinner movie phone meeting deadline school exam project team home apartment rent money weekend trip "
+    "honestly lately myself feel felt better worse overwhelmed lonely excited nervous proud grateful again "
+    "conversation argument quiet loud morning evening night routine habit therapy journal breathe pause"
+).split()
+
+
+def sentence(words):
+    return " ".join(random.choices(WORDS, k=words)).capitalize() + "."
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def populate(user_manager, clock, users):
+    span = 3 * 24 * 3600  # history spread over three days
+    for i in range(users):
+        clock.now = span * i / users
+        user_id = str(100_000_000 + i)
+        user_manager.onboard_user(user_id, f"User{i}", random.randint(18, 70), "Denver, CO")
+        for _ in range(random.randint(1, 8)):
+            user_manager.add_to_conversation(user_id, sentence(random.randint(6, 20)), sentence(random.randint(25, 45)))
+            user_manager.increment_message_count(user_id)
+        if random.random() < 0.3:
+            user_manager.log_mood(user_id, random.choice(["Calm", "Stressed", "Sad"]), sentence(30))
+    return span
+
+
+def run(label, users, max_live, idle_ttl, storage=None, max_cold=sessions.SESSION_MAX_COLD):
+    random.seed(5)
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    user_manager = UserManager(storage=storage or MemoryStorage())
+    clock = Clock()
+    user_manager.sessions.max_live = max_live
+    user_manager.sessions.max_cold = max_cold
+    user_manager.sessions.idle_ttl = idle_ttl
+    user_manager.sessions.clock = clock
+
+    start = time.perf_counter()
+    span = populate(user_manager, clock, users)
+    populate_seconds = time.perf_counter() - start
+    user_manager.sessions.spill_idle()
+    after_history = tracemalloc.get_traced_memory()[0] - baseline
+
+    # One busy hour: 80% of messages from 500 regulars, the rest from anyone
+    regulars = [str(100_000_000 + i) for i in random.sample(range(users), 500)]
+    rehydrate = []
+    for n in range(20_000):
+        clock.now = span + 3600 * n / 20_000
+        user_id = random.choice(regulars) if random.random() < 0.8 else str(100_000_000 + random.randrange(users))
+        cold = user_id not in user_manager.sessions.live
+        t = time.perf_counter()
+        user_manager.get_context(user_id)
+        if cold:
+            rehydrate.append(time.perf_counter() - t)
+        user_manager.increment_message_count(user_id)
+    after_traffic = tracemalloc.get_traced_memory()[0] - baseline
+    tracemalloc.stop()
+    user_manager.storage.close()
+
+    stats = user_manager.sessions.stats()
+    print(f"{label:<14}{after_history / 1e6:>9.0f} MB{after_traffic / 1e6:>9.0f} MB{stats['live']:>9,}{stats['cold']:>9,}"
+          f"{stats['cold_bytes'] / 1e6:>9.1f} MB{stats['rehydrations']:>8,}{stats['loads']:>8,}"
+          f"{percentile(rehydrate, .5) * 1e6:>8.0f} µs{percentile(rehydrate, .99) * 1e6:>8.0f} µs"
+          f"{populate_seconds:>8.1f}s")
+
+
+def main():
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    print(f"{users:,} users\n")
+    print(f"{'':<14}{'history':>12}{'+traffic':>12}{'live':>9}{'cold':>9}{'cold size':>12}{'thawed':>8}{'loaded':>8}"
+          f"{'back p50':>11}{'p99':>11}{'build':>9}")
+    run("unbounded", users, max_live=float("inf"), idle_ttl=float("inf"))
+    run("session store", users, max_live=sessions.SESSION_MAX_LIVE, idle_ttl=sessions.SESSION_IDLE_TTL)
+    with tempfile.TemporaryDirectory() as tmp:
+        run("+ sqlite", users, max_live=sessions.SESSION_MAX_LIVE, idle_ttl=sessions.SESSION_IDLE_TTL,
+            storage=SQLiteStorage(os.path.join(tmp, "bench.db")), max_cold=users // 10)
+    print("\nmemory is what tracemalloc attributes to UserManager; sqlite's page cache is outside it.")
+    print("bringing a user back includes thawing or loading them and rebuilding the context")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,193 @@
+# Message throughput with the bot sharded across 1..N worker processes
+#
+# Starts a StateServer and N worker processes the way bot.run_sharded does,
+# minus the Discord connection. Each worker plays its own shards' traffic:
+# every user (onboarding, then a run of chat messages) arrives on one
+# worker, which relays users it doesn't own to their owner over the state
+# server. Messages are real discord.Message objects built from gateway-shaped
+# data, and relays go through DiscordBot.message_payload/message_from_payload
+# and on_message; only Discord's REST API is faked, so
+# replies never leave the process. Half the users write from a guild no
+# worker has cached, which must still arrive as a guild message. Each worker
+# has its own fake Mistral, so the LLM side scales with the workers too.
+# Reports messages/s overall and how many were relayed.
+#
+# Run from the repo root:  python -m benchmarks.shard_bench [--users 200] [--workers 1 2 4]
+
+import os
+import sys
+import time
+import random
+import asyncio
+import logging
+import argparse
+import datetime
+import tempfile
+import itertools
+import multiprocessing
+
+SOCKET = os.path.join(tempfile.gettempdir(), f"therabot-shard-bench-{os.getpid()}.sock")
+ENV = {
+    "THERABOT_DB": "", "THERABOT_STATE_SOCKET": SOCKET, "THERABOT_STREAMING": "0", "METRICS_PORT": "",
+    "MISTRAL_API_KEY": "bench", "MISTRAL_RATE_LIMIT": "100000", "MISTRAL_RATE_BURST": "100000",
+    "MISTRAL_MAX_CONCURRENCY": "256", "MISTRAL_MODEL_CONCURRENCY": "256",
+}
+SCRIPT = ["hi", "Alex", "I'm 34", "Austin, TX"]
+CHAT = [
+    "I've been feeling really stressed about work lately.",
+    "I can't sleep well and I keep overthinking everything.",
+    "My friend cancelled on me again and it hurt more than I expected.",
+    "Honestly today was okay, I went for a walk.",
+]
+
+
+BOT_USER = {"id": "900000000000000001", "username": "therabot", "discriminator": "0", "global_name": None,
+            "avatar": None, "bot": True}
+GUILD_ID = "800000000000000001"  # on a shard none of the workers runs, so no worker has it cached
+_snowflakes = itertools.count(700000000000000001)
+
+
+def message_data(channel_id, author, content, guild_id=None):
+    """A MESSAGE_CREATE payload as the gateway or REST API would send it."""
+    return {
+        "id": str(next(_snowflakes)), "channel_id": str(channel_id), "guild_id": guild_id, "content": content,
+        "author": author, "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "type": 0, "attachments": [], "embeds": [], "mentions": [], "mention_roles": [],
+        "pinned": False, "mention_everyone": False, "tts": False, "edited_timestamp": None,
+    }
+
+
+def user_data(uid):
+    return {"id": str(uid), "username": f"user{uid}", "discriminator": "0", "global_name": None,
+            "avatar": None, "bot": False}
+
+
+async def fake_discord_request(route, **kwargs):
+    """Stands in for HTTPClient.request: sends and edits echo back a message, everything else succeeds empty."""
+    if route.path.startswith("/channels/{channel_id}/messages"):
+        content = (kwargs.get("json") or {}).get("content") or ""
+        return message_data(route.channel_id, BOT_USER, content)
+    return {}
+
+
+async def run_worker(worker, workers, users, messages, latency, barrier, results):
+    import discord
+    import bot as bot_module
+    from gateway import LLMGateway
+    from shared_state import owner
+    from benchmarks.fake_mistral import FakeMistral
+
+    class BenchBot(bot_module.DiscordBot):
+        async def handle_message(self, message, crisis=()):
+            try:
+                in_guild = int(message.author.id) % 2 == 0
+                if (message.guild is not None) != in_guild:
+                    self.misrouted += 1
+                await super().handle_message(message, crisis)
+            finally:
+                self.handled += 1
+                if self.handled == self.expected:
+                    self.finished.set()
+
+    logging.basicConfig(level=logging.WARNING, format=f"worker {worker}: %(message)s")
+    logging.getLogger("discord.client").setLevel(logging.ERROR)  # no voice support warnings
+    server = await FakeMistral(latency=latency, jitter=latency / 4, stream_chunk_delay=0).start()
+    bot = BenchBot(worker=worker, workers=workers)
+    bot.http.request = fake_discord_request
+    bot._connection.user = discord.ClientUser(state=bot._connection, data=BOT_USER)  # what login would set
+    gateway = LLMGateway(server_url=server.url)
+    for part in (bot, bot.user_manager, bot.therapy_agent, bot.onboarding_manager, bot.button_manager):
+        part.gateway = gateway
+    if bot.router is not None:  # a single worker runs unsharded, like THERABOT_WORKERS=1
+        await bot.router.start()
+
+    per_user = len(SCRIPT) + messages
+    bot.handled = bot.misrouted = 0
+    bot.expected = per_user * sum(owner(str(uid), workers) == worker for uid in range(1, users + 1))
+    bot.finished = asyncio.Event()
+    if not bot.expected:
+        bot.finished.set()
+
+    # Users arrive on worker uid % workers, like DMs and guilds spread over shards; even users write in a guild
+    arriving = [uid for uid in range(1, users + 1) if uid % workers == worker]
+    await asyncio.to_thread(barrier.wait)
+    start = time.perf_counter()
+    for n in range(per_user):
+        for uid in arriving:
+            guild_id = GUILD_ID if uid % 2 == 0 else None
+            content = SCRIPT[n] if n < len(SCRIPT) else random.choice(CHAT)
+            payload = message_data(uid, user_data(uid), content, guild_id)
+            payload["channel_type"] = (discord.ChannelType.text if guild_id else discord.ChannelType.private).value
+            await bot.on_message(bot.message_from_payload(payload))
+    await bot.finished.wait()
+    elapsed = time.perf_counter() - start
+
+    results.put((worker, bot.handled, bot.router.forwarded if bot.router else 0, elapsed, bot.misrouted))
+    if bot.router is not None:
+        await bot.router.close()
+    await bot.dispatcher.close()
+    await gateway.aclose()
+    await server.close()
+
+
+def worker_main(worker, *args):
+    # The environment comes from the parent; this module's SOCKET would name this process's pid
+    try:
+        asyncio.run(run_worker(worker, *args))
+    except BaseException:
+        args[-1].put(None)  # don't leave the parent waiting on a report
+        raise
+
+
+async def scenario(workers, args):
+    from shared_state import StateServer
+    from storage import MemoryStorage
+
+    state = await StateServer(MemoryStorage(), workers, path=SOCKET).start()
+    spawn = multiprocessing.get_context("spawn")
+    barrier, results = spawn.Barrier(workers), spawn.Queue()
+    processes = [spawn.Process(target=worker_main, args=(w, workers, args.users, args.messages, args.latency,
+                                                         barrier, results)) for w in range(workers)]
+    for process in processes:
+        process.start()
+    reports = [await asyncio.to_thread(results.get) for _ in processes]
+    for process in processes:
+        await asyncio.to_thread(process.join)
+    await state.close()
+    if None in reports:
+        raise RuntimeError("a worker failed, see its traceback above")
+    if any(r[4] for r in reports):
+        raise RuntimeError(f"{sum(r[4] for r in reports)} relayed messages lost or gained a guild")
+
+    handled = sum(r[1] for r in reports)
+    elapsed = max(r[3] for r in reports)
+    relayed = sum(r[2] for r in reports)
+    print(f"{workers:>8}{handled:>10,}{elapsed:>10.2f}s{handled / elapsed:>12,.0f}{relayed:>10,}"
+          f"{'  ' + ' '.join(str(r[1]) for r in sorted(reports)):<}")
+    return handled / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput with 1..N sharded worker processes")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--messages", type=int, default=8, help="chat messages per user after onboarding")
+    parser.add_argument("--latency", type=float, default=0.05, help="fake LLM latency in seconds")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    args = parser.parse_args()
+
+    os.environ.update(ENV)  # before anything reads its configuration; workers inherit it
+    random.seed(1)
+    cores = os.cpu_count()
+    print(f"{args.users} users x {len(SCRIPT) + args.messages} messages, {cores} CPU core(s)")
+    if cores < max(args.workers):
+        print(f"note: more workers than cores; expect no speedup past {cores}")
+    print(f"\n{'workers':>8}{'messages':>10}{'time':>11}{'msg/s':>12}{'relayed':>10}  handled per worker")
+    base = None
+    for workers in args.workers:
+        rate = asyncio.run(scenario(workers, args))
+        base = base or rate
+    print(f"\nspeedup at {args.workers[-1]} workers: {rate / base:.2f}x")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
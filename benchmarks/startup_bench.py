@@ -0,0 +1,86 @@
+# Cold-start benchmark
+#
+# Reports import time per module (from `python -X importtime`) and the time
+# from interpreter start until the bot is ready to connect: imports,
+# DiscordBot() and setup_hook. The Discord handshake itself needs a token and
+# network, so the live bot logs its real time-to-on_ready instead
+# ("Ready ...s after startup", also the therabot_time_to_ready_seconds metric).
+#
+# Run from the repo root:  python -m benchmarks.startup_bench [runs]
+
+import os
+import re
+import sys
+import json
+import statistics
+import subprocess
+
+ENV = {**os.environ, "THERABOT_DB": "", "METRICS_PORT": "", "MISTRAL_API_KEY": "bench"}
+
+READY_PROBE = """
+import time, json, asyncio
+t0 = time.perf_counter()
+import bot
+t_import = time.perf_counter()
+
+async def main():
+    b = bot.DiscordBot()
+    t_construct = time.perf_counter()
+    await b.setup_hook()
+    t_ready = time.perf_counter()
+    # Background warm-up (Mistral client + button pools); the first LLM call would pay for this otherwise
+    await b.warm_up_task
+    t_warm = time.perf_counter()
+    await b.close()
+    return t_construct, t_ready, t_warm
+
+t_construct, t_ready, t_warm = asyncio.run(main())
+print(json.dumps({
+    "import bot": t_import - t0,
+    "DiscordBot()": t_construct - t_import,
+    "setup_hook": t_ready - t_construct,
+    "ready to connect": t_ready - t0,
+    "background warm-up": t_warm - t_ready,
+}))
+"""
+
+IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def import_times():
+    """(module, self µs, cumulative µs, depth) for every import of bot.py."""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import bot"],
+                            capture_output=True, text=True, env=ENV, check=True)
+    rows = []
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, module = match.groups()
+            rows.append((module, int(self_us), int(cumulative_us), (len(indent) - 1) // 2))
+    return rows
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+
+    rows = import_times()
+    print("Slowest imports (cumulative, first two levels below bot):")
+    print(f"  {'module':<40}{'self ms':>10}{'cumulative ms':>16}")
+    for module, self_us, cumulative_us, depth in sorted(
+            (r for r in rows if r[3] <= 2), key=lambda r: -r[2])[:15]:
+        print(f"  {'  ' * depth + module:<40}{self_us / 1000:>10.1f}{cumulative_us / 1000:>16.1f}")
+
+    timings = {}
+    for _ in range(runs):
+        result = subprocess.run([sys.executable, "-c", READY_PROBE], capture_output=True, text=True,
+                                env=ENV, check=True)
+        for name, seconds in json.loads(result.stdout.strip().splitlines()[-1]).items():
+            timings.setdefault(name, []).append(seconds)
+
+    print(f"\nTime to ready, median of {runs} runs (excluding interpreter start and the Discord handshake):")
+    for name, values in timings.items():
+        print(f"  {name:<28}{statistics.median(values) * 1000:>8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
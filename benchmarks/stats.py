@@ -0,0 +1,12 @@
+# Summary statistics shared by the benchmarks
+#
+# Every latency table reports the same nearest-rank percentiles, so the
+# numbers from one benchmark can be compared with another's.
+
+
+def percentile(values, p):
+    """The nearest-rank `p` quantile (0.5 for p50) of `values`, in any order; 0.0 if there are none."""
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p * len(values)))]
@@ -0,0 +1,67 @@
+# Messages/sec through UserManager with persistence on vs. pure in-memory
+#
+# Run from the repo root:  python -m benchmarks.storage_bench [messages] [users]
+
+import os
+import sys
+import time
+import tempfile
+
+from agent import UserManager
+from storage import MemoryStorage, SQLiteStorage
+
+
+def simulate(user_manager, messages, users):
+    """Replay the storage side of on_message: onboarding, turns and mood logs."""
+    for i in range(messages):
+        user_id = str(i % users)
+        if not user_manager.is_onboarded(user_id):
+            user_manager.onboard_user(user_id, f"user{user_id}", 20, "San Francisco, CA")
+        count = user_manager.increment_message_count(user_id)
+        if count % 3 == 0:
+            user_manager.update_state(user_id, awaiting_mood_journal=True, awaiting_exercise_decision=False)
+            user_manager.log_mood(user_id, "Calm", "The user talked about their day.")
+            user_manager.update_state(user_id, awaiting_mood_journal=False)
+        else:
+            user_manager.add_to_conversation(user_id, f"message {i}", "That sounds like a lot to carry 💛")
+
+
+def run(name, storage, messages, users):
+    user_manager = UserManager(storage=storage)
+    start = time.perf_counter()
+    simulate(user_manager, messages, users)
+    hot = time.perf_counter() - start
+    storage.close()  # includes the final flush
+    total = time.perf_counter() - start
+    print(f"{name:<10} {messages / hot:>12,.0f} msg/s on the hot path   "
+          f"{messages / total:>12,.0f} msg/s including final flush")
+
+
+def main():
+    messages = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    users = int(sys.argv[2]) if len(sys.argv) > 2 else 1_000
+
+    run("memory", MemoryStorage(), messages, users)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        run("sqlite", SQLiteStorage(path), messages, users)
+
+        # Reload to make sure everything made it to disk
+        reloaded = SQLiteStorage(path)
+        profiles, _, journal, conversations = reloaded.load()
+        turns = sum(len(c["conversation"]) for c in conversations.values())
+        moods = sum(len(j) for j in journal.values())
+        print(f"reloaded {len(profiles)} users, {turns} turns, {moods} mood entries")
+
+        # A restarted bot loads nothing up front; each user is looked up on their first message
+        user_manager = UserManager(storage=reloaded)
+        start = time.perf_counter()
+        for user_id in profiles:
+            user_manager.get_context(user_id)
+        lookup = (time.perf_counter() - start) / len(profiles)
+        print(f"first access after a restart: {lookup * 1e6:,.0f} µs per user")
+        reloaded.close()
+
+
+if __name__ == "__main__":
+    main()
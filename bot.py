@@ -1,8 +1,12 @@
+import time
+STARTED_AT = time.perf_counter()  # for time-to-ready; keep this above the heavy imports
+
 import os
 import discord
 import logging
 import random
 import platform
+import multiprocessing
 
 from discord.ext import commands
 from discord.ui import View, Button, Select
@@ -12,9 +16,23 @@ from agent import TherapyAgent
 from agent import UserManager
 from agent import OnboardingManager
 from agent import ButtonManager
-
+from agent import CannedReply
+import metrics
+from charts import MoodChartRenderer
+from dispatcher import UserDispatcher
+from gateway import PRIORITY_NAMES, get_gateway
+from interactions import InteractionDispatcher
+from journal import JournalQuery
+from crisis import detect as detect_crisis, resources as crisis_resources
+from mood import MOOD_LABELS, NEGATIVE_MOODS
+from shared_state import RemoteStorage, ShardRouter, StateServer
+from storage import StorageUnavailable, open_storage
+from streaming import stream_reply
+from timeline import TimelineScheduler, TimelineSession
+
+import io
 import asyncio
-import matplotlib.pyplot as plt
+import functools
 from datetime import datetime
 
 #import certifi
@@ -29,82 +47,85 @@ logger = logging.getLogger("discord")
 
 PREFIX = "!"
 CUSTOM_STATUS = "therapy chats 🤗"
-# Define Button View Class
-class FeatureButtons(View):
-    def __init__(self):
-        super().__init__()
-        # Add buttons for different features with separate callbacks
-        self.add_item(AffirmationButton())
-        self.add_item(SelfCareButton())
-        self.add_item(BreatheButton())
-        self.add_item(MusicButton())
-        self.add_item(ArtButton())
-        self.add_item(MindfulButton())
-        self.add_item(GratitudeButton())
-        self.add_item(GroundButton())
-
-class AffirmationButton(Button):
-    def __init__(self):
-        super().__init__(label="Affirmation", style=discord.ButtonStyle.primary, custom_id="affirmation")
-    async def callback(self, interaction: discord.Interaction):
-        await interaction.response.defer(ephemeral=True)
-        affirmation = await button_manager.get_mistral_response("Give me a short, positive daily affirmation.")
-        await interaction.followup.send(f"🌟 **Daily Affirmation:** {affirmation}", ephemeral=True)
-
-class SelfCareButton(Button):
-    def __init__(self):
-        super().__init__(label="Self Care", style=discord.ButtonStyle.primary, custom_id="selfcare")
+# Stream therapy replies into a progressively edited message instead of waiting for the full completion
+STREAM_REPLIES = os.getenv("THERABOT_STREAMING", "1") == "1"
+# Worker processes to run the Discord shards in; above 1, users' state is shared through shared_state.StateServer
+WORKERS = int(os.getenv("THERABOT_WORKERS", "1"))
+SHARDS_PER_WORKER = int(os.getenv("THERABOT_SHARDS_PER_WORKER", "1"))
+# When the user's data can't be loaded; nothing about them is known, so nothing else can be said
+STORAGE_UNAVAILABLE_REPLY = "I'm having trouble reaching my notes right now 😔 Please try again in a minute."
+# Feature menu buttons, in display order: custom_id -> label. The custom_ids
+# are what route a click, so they must never change.
+MENU = {
+    "affirmation": "Affirmation",
+    "selfcare": "Self Care",
+    "breathe": "Breathing",
+    "music": "Sounds of Music",
+    "art": "Peaceful Art",
+    "mindful": "Mindfulness Practice",
+    "gratitude": "Gratitude and Appreciation",
+    "ground": "Five Senses Grounding",
+}
+# Buttons answered with ButtonManager content: custom_id -> heading
+FEATURE_HEADINGS = {
+    "affirmation": "🌟 **Daily Affirmation:**",
+    "selfcare": "🌟 **Self-Care Tip:**",
+    "music": "🎼 **Sounds of music:**",
+    "art": "🎼 **Peaceful art:**",
+    "mindful": "🎼 **Mindfulness practice:**",
+    "ground": "🎼 **Five sense grounding:**",
+}
+
+class FeatureButton(Button):
+    def __init__(self, custom_id, label):
+        super().__init__(label=label, style=discord.ButtonStyle.primary, custom_id=custom_id)
     async def callback(self, interaction: discord.Interaction):
-        await interaction.response.defer(ephemeral=True)
-        selfcare = await button_manager.get_mistral_response("Give me a self-care tip.")
-        await interaction.followup.send(f"🌟 **Self-Care Tip:** {selfcare}", ephemeral=True)
+        await interaction.client.interactions.dispatch(interaction, self.custom_id)
 
-class BreatheButton(Button):
+class FeatureButtons(View):
+    """The feature menu. Persistent: setup_hook registers one instance, which every menu message shares,
+    so the buttons keep working after the view would have timed out and across restarts."""
     def __init__(self):
-        super().__init__(label="Breathing", style=discord.ButtonStyle.primary, custom_id="breathe")
-    async def callback(self, interaction: discord.Interaction):
-        await interaction.response.send_message("🌿 **Breathing Exercise Started!**", ephemeral=True)
-        await asyncio.sleep(1)
-        # Inhale (6 seconds)
-        await interaction.followup.send("🌿 **Inhale...** Take a deep breath in.", ephemeral=True)
-        for i in range(6, 0, -1):
-            await asyncio.sleep(1)
-            await interaction.followup.send(f"**{i} seconds left to inhale**", ephemeral=True)
-        # Hold (3 seconds)
-        await interaction.followup.send("🌿 **Hold your breath...**", ephemeral=True)
-        for i in range(3, 0, -1):
-            await asyncio.sleep(1)
-            await interaction.followup.send(f"**{i} seconds left to hold**", ephemeral=True)
-        # Exhale (6 seconds)
-        await interaction.followup.send("🌿 **Exhale...** Slowly breathe out.", ephemeral=True)
-        for i in range(6, 0, -1):
-            await asyncio.sleep(1)
-            await interaction.followup.send(f"**{i} seconds left to exhale**", ephemeral=True)
-        await interaction.followup.send("🌟 **Fantastic! You completed the breathing exercise.**", ephemeral=True)
-
-class MusicButton(Button):
+        super().__init__(timeout=None)
+        for custom_id, label in MENU.items():
+            self.add_item(FeatureButton(custom_id, label))
+
+async def send_feature(feature, heading, interaction, reply):
+    content = await interaction.client.button_manager.get_feature_content(feature, str(interaction.user.id))
+    await reply.send(f"{heading} {content}")
+
+BREATHING_FINISHED = "🌟 **Fantastic! You completed the breathing exercise.**"
+
+def breathing_steps(start):
+    """(offset, text) steps for one session; the countdowns use Discord's live relative timestamps."""
+    inhale_end, hold_end, exhale_end = start + 7, start + 10, start + 16
+    return [
+        (1, f"🌿 **Inhale...** Take a deep breath in.\nHold <t:{int(inhale_end)}:R>"),
+        (7, f"🌿 **Hold your breath...**\nExhale <t:{int(hold_end)}:R>"),
+        (10, f"🌿 **Exhale...** Slowly breathe out.\nDone <t:{int(exhale_end)}:R>"),
+        (16, BREATHING_FINISHED),
+    ]
+
+class StopBreathingButton(Button):
     def __init__(self):
-        super().__init__(label="Sounds of Music", style=discord.ButtonStyle.primary, custom_id="music")
+        super().__init__(label="Stop", style=discord.ButtonStyle.secondary)
+        self.session = None
     async def callback(self, interaction: discord.Interaction):
-        await interaction.response.defer(ephemeral=True)
-        musics = await button_manager.get_mistral_response("Give me two therapy music links.")
-        await interaction.followup.send(f"🎼 **Sounds of music:** {musics}", ephemeral=True)
+        if self.session is not None:
+            self.session.cancel()
+        await interaction.response.edit_message(content="🌿 Breathing exercise stopped. Come back anytime.", view=None)
 
-class ArtButton(Button):
-    def __init__(self):
-        super().__init__(label="Peaceful Art", style=discord.ButtonStyle.primary, custom_id="art")
-    async def callback(self, interaction: discord.Interaction):
-        await interaction.response.defer(ephemeral=True)
-        arts = await button_manager.get_mistral_response("Give me two peaceful art links.")
-        await interaction.followup.send(f"🎼 **Peaceful art:** {arts}", ephemeral=True)
+async def start_breathing(interaction, reply):
+    # One message, edited once per phase by the shared timeline instead of ~20 followups
+    stop = StopBreathingButton()
+    view = View()
+    view.add_item(stop)
+    await reply.send("🌿 **Breathing Exercise Started!**", view=view)
 
-class MindfulButton(Button):
-    def __init__(self):
-        super().__init__(label="Mindfulness Practice", style=discord.ButtonStyle.primary, custom_id="mindful")
-    async def callback(self, interaction: discord.Interaction):
-        await interaction.response.defer(ephemeral=True)
-        minds = await button_manager.get_mistral_response("Give me simple mindful tips (not about he breathing and five sense).")
-        await interaction.followup.send(f"🎼 **Mindfulness practice:** {minds}", ephemeral=True)
+    async def render(text, last):
+        await reply.edit(content=text, view=None if last else view)
+
+    stop.session = interaction.client.timeline.start(TimelineSession(breathing_steps(time.time()), render))
 
 gratitude_prompts = [
     "🌿 What is one thing you appreciate about yourself today? Take a moment to reflect on your strengths and how they empower you.",
@@ -119,38 +140,201 @@ gratitude_prompts = [
     "🌿 What is one challenge that helped you grow? Gratitude is also about appreciating the lessons we learn from difficulties."
 ]
 
-class GratitudeButton(Button):
-    def __init__(self):
-        super().__init__(label="Gratitude and Appreciation", style=discord.ButtonStyle.primary, custom_id="gratitude")
+async def send_gratitude(interaction, reply):
+    # Select a random gratitude and appreciation prompt from the above list
+    await reply.send(f"**Gratitude and Appreciation:** {random.choice(gratitude_prompts)}")
+
+class JournalPageButton(discord.ui.DynamicItem[Button],
+                        template=r"logs:(?P<user>[0-9]+):(?P<direction>[on]):(?P<before>[0-9]*):(?P<query>[^:]*:[^:]*:[^:]*)"):
+    """A !logs page button. The custom_id carries the user, the query and the page to show, so whichever
+    worker gets the click can rebuild the button; the page is rendered by the worker that owns the user."""
+    def __init__(self, user_id, query, older, before, disabled=False):
+        self.user_id = user_id
+        self.query = query
+        self.before = before  # `before` of the page to show; None for the newest
+        cursor = "" if before is None else before
+        super().__init__(Button(label="◀ Older" if older else "Newer ▶", style=discord.ButtonStyle.secondary,
+                                disabled=disabled,
+                                custom_id=f"logs:{user_id}:{'o' if older else 'n'}:{cursor}:{query.key()}"))
+
+    @classmethod
+    async def from_custom_id(cls, interaction, item, match):
+        before = int(match["before"]) if match["before"] else None
+        return cls(match["user"], JournalQuery.from_key(match["query"]), match["direction"] == "o", before)
+
+    async def interaction_check(self, interaction: discord.Interaction):
+        return str(interaction.user.id) == self.user_id
 
     async def callback(self, interaction: discord.Interaction):
-        await interaction.response.defer(ephemeral=True)
-        # Select a random gratitude and appreciation prompt from the above list
-        gratitude_prompt = random.choice(gratitude_prompts)
-        await interaction.followup.send(f"**Gratitude and Appreciation:** {gratitude_prompt}", ephemeral=True)
-
-class GroundButton(Button):
-    def __init__(self):
-        super().__init__(label="Five Senses Grounding ", style=discord.ButtonStyle.primary, custom_id="ground")
-    async def callback(self, interaction: discord.Interaction):
-        await interaction.response.defer(ephemeral=True)
-        grounds = await button_manager.get_mistral_response("Give me five-sense grounding technique.")
-        await interaction.followup.send(f"🎼 **Five sense grounding:** {grounds}", ephemeral=True)
-
-class DiscordBot(commands.Bot):
-    def __init__(self):
+        page = await interaction.client.journal_page(self.user_id, self.query, self.before)
+        if page is None:
+            await interaction.response.send_message("I couldn't load that page just now, please try again.",
+                                                    ephemeral=True)
+            return
+        text, older, newer = page
+        await interaction.response.edit_message(content=text or "No journal entries match that.",
+                                                view=journal_pages(self.user_id, self.query, self.before, older, newer))
+
+def journal_pages(user_id, query, before, older, newer):
+    """!logs buttons for the page ending at `before`, see journal.render_page. Fully dynamic, so no view is kept."""
+    view = View(timeout=None)
+    view.add_item(JournalPageButton(user_id, query, True, older, disabled=older is None))
+    view.add_item(JournalPageButton(user_id, query, False, newer, disabled=before is None))
+    return view
+
+class DiscordBot(commands.AutoShardedBot):
+    def __init__(self, worker=0, workers=1, **options):
+        # options: shard_ids/shard_count when this process runs part of a sharded deployment
         super().__init__(
             command_prefix=commands.when_mentioned_or(PREFIX),
-            intents=intents
+            intents=intents,
+            **options
         )
         self.logger = logger
-
-        # Set up managers and agents
-        self.user_manager = UserManager()
-        self.therapy_agent = TherapyAgent(self.user_manager)
-        self.onboarding_manager = OnboardingManager(self.user_manager, self.therapy_agent)
-
-
+        self.worker = worker
+        self.workers = workers
+
+        # Set up managers and agents; they all share one LLM gateway
+        self.gateway = get_gateway()
+        storage = RemoteStorage(worker, lost=self._storage_lost) if workers > 1 else open_storage()
+        self.user_manager = UserManager(storage=storage, gateway=self.gateway)
+        self.therapy_agent = TherapyAgent(self.user_manager, gateway=self.gateway)
+        self.onboarding_manager = OnboardingManager(self.user_manager, self.therapy_agent, gateway=self.gateway)
+        self.button_manager = ButtonManager(gateway=self.gateway)
+        # Drives every running breathing exercise from one timer wheel
+        self.timeline = TimelineScheduler()
+        # Runs feature menu clicks, routed by custom_id, within Discord's acknowledgement deadline
+        self.interactions = InteractionDispatcher()
+        for feature, heading in FEATURE_HEADINGS.items():
+            self.interactions.register(feature, functools.partial(send_feature, feature, heading))
+        self.interactions.register("breathe", start_breathing)
+        self.interactions.register("gratitude", send_gratitude)
+        self.menu = None  # FeatureButtons, built in setup_hook; views need the running loop
+        # Runs each user's messages in order, different users in parallel
+        self.dispatcher = UserDispatcher()
+        # Renders !moodchart in worker processes, off the event loop
+        self.chart_renderer = MoodChartRenderer()
+        # Sends messages from users other workers own over to them
+        self.router = (ShardRouter(worker, workers, self.handle_relayed, lost=self._state_server_lost)
+                       if workers > 1 else None)
+        self.shards_launched = False  # set by connect; close() only closes shards that were started
+        self.stop_task = None
+        self.main_loop = None  # for callbacks from other threads; set in setup_hook
+
+        self._time_discord_requests()
+        self._register_gauges()
+        self.metrics_server = None
+        self.loop_lag_task = None
+        self.warm_up_task = None
+        self.ready_at = None  # seconds from startup to the first on_ready
+        self.add_listener(self._record_ready, "on_ready")
+
+    def _time_discord_requests(self):
+        # Every REST call (sends, replies, edits) goes through HTTPClient.request
+        request = self.http.request
+
+        async def timed_request(route, **kwargs):
+            with metrics.DISCORD_SECONDS.time(method=route.method, route=route.path):
+                return await request(route, **kwargs)
+
+        self.http.request = timed_request
+
+    def _register_gauges(self):
+        metrics.REGISTRY.gauge("therabot_dispatcher_active_users", "Users with a live message queue",
+                               lambda: len(self.dispatcher.queues))
+        metrics.REGISTRY.gauge("therabot_dispatcher_queued", "Messages waiting behind a user's earlier ones",
+                               lambda: self.dispatcher.stats()["queued"])
+        metrics.REGISTRY.gauge("therabot_dispatcher_wait_seconds", "Recent queue wait time percentiles",
+                               lambda: {(("quantile", q),): self.dispatcher.stats()[f"wait_p{q[2:]}"]
+                                        for q in ("0.50", "0.99")})
+        metrics.REGISTRY.gauge("therabot_extract_local_hits", "Onboarding answers parsed without the LLM",
+                               lambda: {(("field", f),): n for f, n in self.onboarding_manager.extractor.hits.items()})
+        metrics.REGISTRY.gauge("therabot_extract_local_misses", "Onboarding answers sent to the LLM",
+                               lambda: {(("field", f),): n for f, n in self.onboarding_manager.extractor.misses.items()})
+        metrics.REGISTRY.gauge("therabot_button_pool_size", "Pre-generated entries ready per feature",
+                               lambda: {(("feature", f),): len(p.entries) for f, p in self.button_manager.pools.items()})
+        metrics.REGISTRY.gauge("therabot_interactions_in_flight", "Button clicks still being answered",
+                               lambda: len(self.interactions.in_flight))
+        metrics.REGISTRY.gauge("therabot_llm_queued", "LLM calls waiting for admission, by priority",
+                               lambda: {(("priority", name),): n for name, n in
+                                        zip(PRIORITY_NAMES, self.gateway.admission.queued)})
+        metrics.REGISTRY.gauge("therabot_llm_route_p95_seconds", "Recent p95 latency per route, the hedge delay",
+                               lambda: {(("kind", k), ("model", m), ("phase", p)): stats.quantile(0.95)
+                                        for (k, m, p), stats in self.gateway.latency.items()})
+        metrics.REGISTRY.gauge("therabot_llm_budget_users", "Users who made LLM calls today, by budget level",
+                               lambda: {(("level", level),): n for level, n in self.gateway.usage.users_by_level().items()})
+        metrics.REGISTRY.gauge("therabot_llm_tokens_today", "LLM tokens used since midnight",
+                               lambda: self.gateway.usage.spent_today()[0])
+        metrics.REGISTRY.gauge("therabot_sessions", "User sessions in memory, by tier",
+                               lambda: {(("tier", "live"),): len(self.user_manager.sessions.live),
+                                        (("tier", "cold"),): len(self.user_manager.sessions.cold)})
+        metrics.REGISTRY.gauge("therabot_sessions_cold_bytes", "Compressed size of spilled sessions",
+                               lambda: self.user_manager.sessions.cold_bytes)
+        metrics.REGISTRY.gauge("therabot_users", "Users in memory with a profile", lambda: len(self.user_manager.user_profiles))
+        metrics.REGISTRY.gauge("therabot_time_to_ready_seconds", "Seconds from process start to the first on_ready",
+                               lambda: self.ready_at if self.ready_at is not None else "NaN")
+
+    async def setup_hook(self):
+        self.main_loop = asyncio.get_running_loop()
+        # Every menu message shares this view, and the buttons on menus sent before a restart keep working
+        self.menu = FeatureButtons()
+        self.add_view(self.menu)
+        self.add_dynamic_items(JournalPageButton)
+        if self.router is not None:
+            await self.router.start()
+        # One endpoint per worker: METRICS_PORT, METRICS_PORT + 1, ...
+        port = int(metrics.METRICS_PORT) + self.worker if metrics.METRICS_PORT else None
+        self.metrics_server = await metrics.start_metrics_server(port=port)
+        self.loop_lag_task = asyncio.create_task(metrics.monitor_loop_lag())
+        # Runs while the gateway connects instead of delaying it
+        self.warm_up_task = asyncio.create_task(self._warm_up())
+
+    async def _warm_up(self):
+        # Build the Mistral client off the event loop, then pre-generate button content before the first click
+        await self.gateway.warm_up()
+        self.button_manager.start()
+
+    async def _record_ready(self):
+        # A listener rather than on_ready, which create_bot overrides with @bot.event
+        if self.ready_at is None:
+            self.ready_at = time.perf_counter() - STARTED_AT
+            self.logger.info(f"Ready {self.ready_at:.2f}s after startup")
+
+    async def connect(self, *, reconnect=True):
+        self.shards_launched = True
+        await super().connect(reconnect=reconnect)
+
+    def _state_server_lost(self):
+        # Without the state server this worker can neither relay nor save; exiting lets the launcher see it
+        if self.stop_task is None:
+            self.stop_task = asyncio.create_task(self.close())
+
+    def _storage_lost(self):
+        # Called on a storage thread
+        if self.main_loop is not None:
+            self.main_loop.call_soon_threadsafe(self._state_server_lost)
+
+    async def close(self):
+        if self.shards_launched:
+            await super().close()
+        else:
+            # Shards never launched (benchmarks, a failed login); AutoShardedClient.close needs their queue
+            await self._connection.close()
+            await self.http.close()
+        for task in (self.loop_lag_task, self.warm_up_task):
+            if task is not None:
+                task.cancel()
+        if self.metrics_server is not None:
+            self.metrics_server.close()
+        if self.router is not None:
+            await self.router.close()
+        await self.dispatcher.close()
+        await self.gateway.aclose()
+        self.chart_renderer.close()
+        # Flush buffered writes before the process exits
+        self.user_manager.storage.close()
+        if metrics.TRACE_WRITER is not None:
+            metrics.TRACE_WRITER.close()
 
     async def on_ready(self):
         self.logger.info("-------------------")
@@ -169,6 +353,21 @@ class DiscordBot(commands.Bot):
         )
 
     async def on_message(self, message: discord.Message):
+        # Commands included: only the owner worker has the user's state
+        if self.router is not None and not message.author.bot and not self.router.owns(str(message.author.id)):
+            await self.router.forward(str(message.author.id), self.message_payload(message))
+            return
+
+        if not message.author.bot:
+            try:
+                # Off the event loop, before commands and handlers look the user up
+                await self.user_manager.sessions.preload(str(message.author.id))
+            except StorageUnavailable as e:
+                self.logger.error(f"Couldn't load user {message.author.id}: {e}")
+                crisis = detect_crisis(message.content)
+                await message.reply(crisis_resources(crisis) if crisis else STORAGE_UNAVAILABLE_REPLY)
+                return
+
         await self.process_commands(message)
 
         # Ignore messages from self or other bots
@@ -182,21 +381,110 @@ class DiscordBot(commands.Bot):
         self.logger.info(f"Message from {message.author}: {message.content}")
         user_id = str(message.author.id)
 
+        # Checked before queueing, so resources go out right away even if the user's queue is backed up
+        crisis = detect_crisis(message.content)
+        if crisis:
+            metrics.CRISIS_MATCHES.inc(category=crisis[0])
+            self.logger.warning(f"Crisis phrases ({', '.join(crisis)}) from user {user_id}")
+            await message.reply(crisis_resources(crisis))
+        self.dispatcher.submit(user_id, self.handle_message, message, crisis, urgent=bool(crisis))
+
+    def message_payload(self, message: discord.Message):
+        """The parts of a message another worker needs to rebuild it (see message_from_payload)."""
+        author = message.author
+        return {
+            "id": str(message.id),
+            "channel_id": str(message.channel.id),
+            "guild_id": str(message.guild.id) if message.guild else None,
+            "guild_name": message.guild.name if message.guild else None,
+            "channel_type": message.channel.type.value,
+            "content": message.content,
+            "timestamp": message.created_at.isoformat(),
+            "author": {"id": str(author.id), "username": author.name, "discriminator": author.discriminator,
+                       "global_name": author.global_name, "avatar": None, "bot": author.bot},
+            "type": 0, "attachments": [], "embeds": [], "mentions": [], "mention_roles": [],
+            "pinned": False, "mention_everyone": False, "tts": False, "edited_timestamp": None,
+        }
+
+    def message_from_payload(self, payload):
+        # The channel may be on a shard this worker doesn't run; a partial one is enough to reply through REST
+        guild_id = int(payload["guild_id"]) if payload["guild_id"] else None
+        channel = self.get_partial_messageable(int(payload["channel_id"]), guild_id=guild_id,
+                                               type=discord.ChannelType(payload["channel_type"]))
+        message = discord.Message(state=self._connection, channel=channel, data=payload)
+        if guild_id is not None and message.guild is None:
+            # Not in this worker's cache either; a partial guild still tells commands and checks it isn't a DM
+            message.guild = discord.Guild(data={"id": guild_id, "name": payload.get("guild_name") or ""},
+                                          state=self._connection)
+        return message
+
+    async def handle_relayed(self, payload):
+        """A message another worker received for a user this worker owns, or a request about that user."""
+        if payload.get("kind") == "journal_page":
+            query = JournalQuery.from_key(payload["query"])
+            await self.user_manager.sessions.preload(payload["user_id"])
+            return self.user_manager.mood_log_page(payload["user_id"], query, payload["before"])
+        await self.on_message(self.message_from_payload(payload))
+
+    async def journal_page(self, user_id, query, before=None):
+        """(text, older, newer) of a !logs page, from the worker that owns the user; None if it didn't answer."""
+        if self.router is None or self.router.owns(user_id):
+            try:
+                await self.user_manager.sessions.preload(user_id)
+            except StorageUnavailable as e:
+                logger.warning(f"No !logs page for user {user_id}: {e}")
+                return None
+            return self.user_manager.mood_log_page(user_id, query, before)
+        try:
+            return await self.router.call(user_id, {"kind": "journal_page", "user_id": user_id,
+                                                    "query": query.key(), "before": before})
+        except asyncio.TimeoutError:
+            logger.warning(f"No !logs page from the owner of user {user_id} in time")
+            return None
+
+    async def handle_message(self, message: discord.Message, crisis=()):
+        user_id = str(message.author.id)
+        with metrics.trace("message", user=user_id):
+            start = time.perf_counter()
+            outcome = "error"
+            try:
+                outcome = await self._handle_message(message, user_id, crisis)
+            finally:
+                metrics.MESSAGE_SECONDS.observe(time.perf_counter() - start, outcome=outcome)
+
+    async def _handle_message(self, message: discord.Message, user_id, crisis=()):
+        """Run the conversation state machine; returns which path the message took."""
+        if crisis:
+            # Straight to a reply: no onboarding question, journal offer or pending yes/no prompt in the way
+            if self.user_manager.is_onboarded(user_id):
+                self.user_manager.update_state(user_id, awaiting_mood_journal=False, awaiting_exercise_decision=False)
+            await self._therapy_reply(message, user_id, crisis=True)
+            return "crisis"
+
         # Check if user needs onboarding
-        if self.onboarding_manager.needs_onboarding(user_id):
-            await self.onboarding_manager.handle_onboarding(message)
-            return
+        with metrics.STATE_SECONDS.time(lookup="onboarding"):
+            needs_onboarding = self.onboarding_manager.needs_onboarding(user_id)
+        if needs_onboarding:
+            step = self.onboarding_manager.pending_onboarding.get(user_id, "intro")
+            with metrics.ONBOARDING_SECONDS.time(step=step):
+                await self.onboarding_manager.handle_onboarding(message)
+            return "onboarding"
 
         # Get profile and state
-        profile = self.user_manager.user_profiles.get(user_id)
-        state = self.user_manager.user_states[user_id]
+        with metrics.STATE_SECONDS.time(lookup="profile_state"):
+            profile = self.user_manager.user_profiles.get(user_id)
+            state = self.user_manager.user_states[user_id]
 
         # Handle journaling
         if state.get("awaiting_mood_journal", False):
             if message.content.lower() in ["yes", "y"]:
-                mood = await self.user_manager.get_mood(user_id)
+                # Usually already computed in the background when the offer went out
+                mood, synthesis = await self.user_manager.analyze_for_journal(user_id)
+                if mood is None:
+                    # Still awaiting_mood_journal, so the next "yes" tries again
+                    await message.reply("I couldn't read your mood just now 😔 Say yes again in a moment to log it.")
+                    return "journal"
                 profile = self.user_manager.user_profiles[user_id]
-                synthesis = await self.user_manager.summarize_conversation(user_id)
                 name = profile.get("name")
                 age = profile.get("age")
                 location = profile.get("location")
@@ -204,63 +492,68 @@ class DiscordBot(commands.Bot):
                 self.user_manager.log_mood(user_id, mood, synthesis)
                 await message.reply(f"📓 Mood logged! \n User: {name} | {age} | {location} \n Mood: {mood} \n Summary: {synthesis}")
 
-                if mood in ["Sad", "Stressed", "Anxious", "Frustrated", "Angry"]:
+                if mood in NEGATIVE_MOODS:
                     await message.reply("Would you like to try some exercises? (yes/no)")
-                    state["awaiting_exercise_decision"] = True
                 else:
                     await message.reply(
                         "Would you like to continue our conversation or try exercises? (continue/exercises)")
-                    state["awaiting_exercise_decision"] = True
 
-                state["awaiting_mood_journal"] = False
-            return
+                self.user_manager.update_state(user_id, awaiting_exercise_decision=True, awaiting_mood_journal=False)
+            return "journal"
 
         elif state.get("awaiting_exercise_decision", False):
             if message.content.lower() in ["yes", "exercises"]:
-                await message.reply("Here's a menu of helpful exercises 🌸", view=FeatureButtons())
+                await message.reply("Here's a menu of helpful exercises 🌸", view=self.menu)
             else:
                 await message.reply("No problem! I'm here whenever you need me 😊")
-            state["awaiting_exercise_decision"] = False
-            return
+            self.user_manager.update_state(user_id, awaiting_exercise_decision=False)
+            return "exercise_decision"
 
         # Normal conversation flow
         message_count = self.user_manager.increment_message_count(user_id)
         # Mood journaling offer
         if message_count % 3 == 0:
+            # Speculatively classify and summarize while the user reads the question
+            self.user_manager.prefetch_journal(user_id)
             await message.reply("Would you like to log your mood in the journal? (yes/no)")
-            state["awaiting_mood_journal"] = True
-            state["awaiting_exercise_decision"] = False
-            return
+            self.user_manager.update_state(user_id, awaiting_mood_journal=True, awaiting_exercise_decision=False)
+            return "journal_offer"
 
-        response = await self.therapy_agent.run(message, user_id)
-        # Run the therapy agent
-        await message.reply(response)
+        await self._therapy_reply(message, user_id)
+        return "therapy"
 
-        self.user_manager.add_to_conversation(user_id, message.content, response)
+    async def _therapy_reply(self, message: discord.Message, user_id, crisis=False):
+        # Run the therapy agent
+        if STREAM_REPLIES:
+            response = await stream_reply(message, self.therapy_agent.stream(message, user_id, crisis))
+        else:
+            response = await self.therapy_agent.run(message, user_id, crisis)
+            await message.reply(response)
 
+        # A busy or over-budget stand-in isn't a turn; recorded, it would be summarized, indexed and fed back
+        if not isinstance(response, CannedReply):
+            self.user_manager.add_to_conversation(user_id, message.content, response)
 
 
-if __name__ == "__main__":
-    load_dotenv()
-    token = os.getenv("DISCORD_TOKEN")
 
-    bot = DiscordBot()
 
-    button_manager = ButtonManager()
+def create_bot(**options):
+    """DiscordBot with the ! commands registered; options go to DiscordBot."""
+    bot = DiscordBot(**options)
 
     # Command to Show Feature Buttons
     @bot.command(name="menu")
     async def show_menu(ctx):
         """Displays interactive buttons for features."""
         await ctx.send("**🌸 **This is your quiet corner to relax and refresh; and to reconnect with yourself.** 🌸\n\n"
-                       "**Click the button to access a feature:", view=FeatureButtons())
+                       "**Click the button to access a feature:", view=bot.menu)
 
         # Command to Show Mood Journal Logs
 
 
     @bot.command(name="logs")
-    async def show_logs(ctx):
-        """Displays user's mood journal logs."""
+    async def show_logs(ctx, *args):
+        """Displays user's mood journal logs, newest first: `!logs [mood] [30d | from-date [to-date]]`."""
         user_id = str(ctx.author.id)
 
         # Check if user is onboarded first
@@ -268,15 +561,43 @@ if __name__ == "__main__":
             await ctx.send("👋 Let's get to know each other first! Type anything to start onboarding.")
             return
 
-        logs = bot.user_manager.get_mood_logs(user_id)
+        if user_id not in bot.user_manager.mood_journal:
+            await ctx.send("You don't have any mood logs yet! 📓")
+            return
+
+        try:
+            query = JournalQuery.parse(args)
+        except ValueError as e:
+            await ctx.send(str(e))
+            return
 
-        # Split into multiple messages if too long (Discord limit is 2000 characters)
-        if len(logs) <= 2000:
-            await ctx.send(logs)
+        # Only the newest page is rendered now; the buttons render the others on demand
+        text, older, _ = bot.user_manager.mood_log_page(user_id, query)
+        if text is None:
+            await ctx.send(f"No journal entries match that. You can filter by a mood ({', '.join(MOOD_LABELS)}), "
+                           "`30d` or dates like `!logs 2024-05-01 2024-05-31`.")
+        elif older is None:
+            await ctx.send(text)
         else:
-            chunks = [logs[i:i + 2000] for i in range(0, len(logs), 2000)]
-            for chunk in chunks:
-                await ctx.send(chunk)
+            await ctx.send(text, view=journal_pages(user_id, query, None, older, None))
+
+
+    @bot.command(name="moodchart")
+    async def show_mood_chart(ctx):
+        """Plots user's mood journal over time."""
+        user_id = str(ctx.author.id)
+
+        if not bot.user_manager.is_onboarded(user_id):
+            await ctx.send("👋 Let's get to know each other first! Type anything to start onboarding.")
+            return
+
+        entries = bot.user_manager.mood_journal.get(user_id, [])
+        if not entries:
+            await ctx.send("You don't have any mood logs yet! 📓")
+            return
+
+        png = await bot.chart_renderer.get_chart(user_id, entries)
+        await ctx.send("📈 Here's how your mood has been trending:", file=discord.File(io.BytesIO(png), filename="moodchart.png"))
 
 
     @bot.command(name="helpme")
@@ -285,7 +606,8 @@ if __name__ == "__main__":
         await ctx.send(
             "**Available Commands:**\n"
             "`!menu` - Explore wellness activities 🌸\n"
-            "`!logs` - View your mood journal entries 📓\n"
+            "`!logs` - View your mood journal entries 📓 (`!logs stressed`, `!logs 30d`, `!logs 2024-05-01 2024-05-31`)\n"
+            "`!moodchart` - See your mood over time 📈\n"
             "`!helpme` - Show this help message"
         )
     # Bot Ready Event
@@ -293,6 +615,40 @@ if __name__ == "__main__":
     async def on_ready():
         print(f"Logged in as {bot.user}")
 
-    bot.run(token)
+    return bot
+
 
+def run_worker(token, worker, workers, shard_ids, shard_count):
+    """Entry point of one worker process in a sharded deployment."""
+    create_bot(worker=worker, workers=workers, shard_ids=shard_ids, shard_count=shard_count).run(token)
+
+
+async def run_sharded(token, workers):
+    """Run the state server here and the shards in `workers` worker processes, until they all exit."""
+    shard_count = workers * SHARDS_PER_WORKER
+    server = await StateServer(open_storage(), workers).start()
+    spawn = multiprocessing.get_context("spawn")  # fresh interpreters; forking a running event loop isn't safe
+    processes = [spawn.Process(target=run_worker, name=f"therabot-worker-{w}",
+                               args=(token, w, workers, list(range(w, shard_count, workers)), shard_count))
+                 for w in range(workers)]
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            await asyncio.to_thread(process.join)
+    finally:
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+        await server.close()
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    token = os.getenv("DISCORD_TOKEN")
 
+    if WORKERS > 1:
+        discord.utils.setup_logging()
+        asyncio.run(run_sharded(token, WORKERS))
+    else:
+        create_bot().run(token)
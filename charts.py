@@ -0,0 +1,91 @@
+# Mood trend charts for !moodchart
+#
+# Rendering happens in a process pool so matplotlib never blocks the event
+# loop, and matplotlib is only imported inside the worker processes. PNGs are
+# cached per user and keyed on the journal length: the journal is append-only,
+# so the cached chart stays valid until log_mood adds an entry.
+
+import os
+import io
+import asyncio
+import logging
+import datetime
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+logger = logging.getLogger("discord")
+
+CHART_WORKERS = int(os.getenv("CHART_WORKERS", "2"))
+CHART_CACHE_SIZE = 256  # users whose latest chart is kept in memory
+
+# Low to high, so the line goes up when the user feels better
+MOOD_SCALE = ["Angry", "Frustrated", "Sad", "Anxious", "Stressed", "Neutral", "Calm", "Happy", "Excited"]
+
+
+def render_mood_chart(points):
+    """Render [(ISO timestamp, mood), ...] to PNG bytes. Runs in a worker process."""
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    import matplotlib.dates as mdates
+
+    times = [datetime.datetime.fromisoformat(ts) for ts, _ in points]
+    levels = [MOOD_SCALE.index(mood) if mood in MOOD_SCALE else MOOD_SCALE.index("Neutral") for _, mood in points]
+
+    fig, ax = plt.subplots(figsize=(8, 4), dpi=100)
+    ax.plot(times, levels, marker="o", color="#7aa874", linewidth=2)
+    ax.set_yticks(range(len(MOOD_SCALE)))
+    ax.set_yticklabels(MOOD_SCALE)
+    ax.set_ylim(-0.5, len(MOOD_SCALE) - 0.5)
+    ax.xaxis.set_major_formatter(mdates.DateFormatter("%b %d"))
+    ax.set_title("Your mood over time")
+    ax.grid(axis="y", alpha=0.3)
+    fig.autofmt_xdate()
+    fig.tight_layout()
+
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format="png")
+    plt.close(fig)
+    return buffer.getvalue()
+
+
+class MoodChartRenderer:
+    def __init__(self, workers=CHART_WORKERS):
+        self.workers = workers
+        self.executor = None  # started on the first chart request
+        self.cache = OrderedDict()  # user_id -> (journal length, png), least recently used first
+        self.inflight = {}  # (user_id, journal length) -> future, so concurrent requests share one render
+
+    def _pool(self):
+        if self.executor is None:
+            # spawn: the bot has threads (storage writer), which don't mix with fork
+            self.executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+        return self.executor
+
+    async def get_chart(self, user_id, entries):
+        """PNG bytes for the user's journal entries, from cache when nothing was logged since."""
+        version = len(entries)
+        cached = self.cache.get(user_id)
+        if cached is not None and cached[0] == version:
+            self.cache.move_to_end(user_id)
+            return cached[1]
+
+        key = (user_id, version)
+        future = self.inflight.get(key)
+        if future is None:
+            points = [(entry["timestamp"], entry["mood"]) for entry in entries]
+            future = asyncio.get_running_loop().run_in_executor(self._pool(), render_mood_chart, points)
+            self.inflight[key] = future
+            future.add_done_callback(lambda _: self.inflight.pop(key, None))
+
+        png = await asyncio.shield(future)
+        self.cache[user_id] = (version, png)
+        self.cache.move_to_end(user_id)
+        while len(self.cache) > CHART_CACHE_SIZE:
+            self.cache.popitem(last=False)
+        return png
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,91 @@
+# Pre-generated content pools for the feature buttons
+#
+# Button content (affirmations, self-care tips, ...) doesn't depend on the
+# user, so it is generated ahead of time. Clicks take from the pool; a
+# background task tops it back up once it drops below the low-water mark.
+
+import os
+import re
+import time
+import asyncio
+import logging
+from collections import deque
+
+logger = logging.getLogger("discord")
+
+POOL_SIZE = int(os.getenv("BUTTON_POOL_SIZE", "5"))
+POOL_LOW_WATER = int(os.getenv("BUTTON_POOL_LOW_WATER", "2"))
+POOL_TTL = float(os.getenv("BUTTON_POOL_TTL", str(6 * 60 * 60)))  # seconds an entry stays servable
+RECENT_SERVED = 50  # remember this many served entries so they aren't handed out again
+REFILL_COOLDOWN = 30.0  # seconds to wait after a failed refill
+
+
+def _normalize(text):
+    """Key used to spot duplicates that differ only in case, spacing or punctuation."""
+    return re.sub(r"[\W_]+", " ", text.lower()).strip()
+
+
+class ContentPool:
+    """Pool of ready-made responses produced by the coroutine function `generate`."""
+
+    def __init__(self, name, generate, size=POOL_SIZE, low_water=POOL_LOW_WATER, ttl=POOL_TTL):
+        self.name = name
+        self.generate = generate
+        self.size = size
+        self.low_water = low_water
+        self.ttl = ttl
+
+        self.entries = deque()  # (created_at, text), oldest first
+        self.keys = set()  # normalized text of everything in entries
+        self.served = deque(maxlen=RECENT_SERVED)
+        self._refill_task = None
+        self._retry_at = 0.0
+
+        self.hits = 0
+        self.misses = 0
+
+    def _expire(self):
+        cutoff = time.monotonic() - self.ttl
+        while self.entries and self.entries[0][0] < cutoff:
+            _, text = self.entries.popleft()
+            self.keys.discard(_normalize(text))
+
+    def take(self):
+        """Pop a fresh entry, or None if the pool is empty. Never waits."""
+        self._expire()
+        text = None
+        if self.entries:
+            _, text = self.entries.popleft()
+            key = _normalize(text)
+            self.keys.discard(key)
+            self.served.append(key)
+            self.hits += 1
+        else:
+            self.misses += 1
+
+        if len(self.entries) < self.low_water:
+            self.start_refill()
+        return text
+
+    def start_refill(self):
+        if self._refill_task is not None or time.monotonic() < self._retry_at:
+            return
+        self._refill_task = asyncio.get_running_loop().create_task(self._refill())
+
+    async def _refill(self):
+        attempts = 0
+        try:
+            # Duplicates don't count, so cap the attempts instead of looping forever
+            while len(self.entries) < self.size and attempts < self.size * 2:
+                attempts += 1
+                text = (await self.generate()).strip()
+                key = _normalize(text)
+                if not key or key in self.keys or key in self.served:
+                    continue
+                self.entries.append((time.monotonic(), text))
+                self.keys.add(key)
+        except Exception as e:
+            self._retry_at = time.monotonic() + REFILL_COOLDOWN
+            logger.warning(f"Refilling {self.name} pool failed: {e!r}")
+        finally:
+            self._refill_task = None
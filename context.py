@@ -0,0 +1,119 @@
+# Rolling, token-bounded conversation context
+#
+# Keeps the rendered "User: ...\nBot: ..." transcript for one user up to date
+# as turns are added, instead of re-joining the whole history on every call.
+# Once the recent turns go over the token budget, the oldest ones are folded
+# into a running summary in the background, so the prompt stays bounded no
+# matter how long the conversation gets.
+
+import os
+import asyncio
+import logging
+from collections import deque
+
+logger = logging.getLogger("discord")
+
+TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "2000"))  # tokens of verbatim turns to keep
+CHARS_PER_TOKEN = 4  # rough estimate; good enough for budgeting without a tokenizer
+
+
+def estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def render_turn(user_msg, bot_msg):
+    return f"User: {user_msg}\nBot: {bot_msg}"
+
+
+class ConversationContext:
+    """Rendered transcript of one conversation: running summary + recent turns.
+
+    `summarize(previous_summary, transcript)` is a coroutine that returns the
+    new summary; it is only ever called from a background task.
+    """
+
+    def __init__(self, summarize, budget=TOKEN_BUDGET):
+        self.summarize = summarize
+        self.budget = budget
+
+        self.summary = ""
+        self.covered = 0  # turns folded into the summary
+        self.folding = []  # rendered turns handed to the summarizer but not merged yet
+        self.window = deque()  # (rendered turn, tokens), oldest first
+        self.window_tokens = 0
+        self.version = 0  # bumped on every change, so callers can cache on it
+        self._text = ""
+        self._fold_task = None
+
+    def add(self, user_msg, bot_msg):
+        """Append one turn; O(turn) apart from the occasional fold."""
+        line = render_turn(user_msg, bot_msg)
+        tokens = estimate_tokens(line)
+        self.window.append((line, tokens))
+        self.window_tokens += tokens
+        self._text = f"{self._text}\n{line}" if self._text else line
+        self.version += 1
+
+        if self.window_tokens > self.budget:
+            self._start_fold()
+
+    def restore(self, summary, turns, covered=0):
+        """Start from a summary of the first `covered` turns plus the (user_msg, bot_msg) turns after it."""
+        self.summary = summary
+        self.covered = covered
+        for user_msg, bot_msg in turns:
+            self.add(user_msg, bot_msg)
+        self._rebuild()
+
+    @property
+    def busy(self):
+        """True while a fold is waiting on the summarizer."""
+        return self._fold_task is not None
+
+    def render(self):
+        """The transcript to put in a prompt; cached between changes."""
+        return self._text
+
+    def _rebuild(self):
+        parts = []
+        if self.summary:
+            parts.append(f"Summary of the earlier conversation: {self.summary}")
+        parts.extend(self.folding)
+        parts.extend(line for line, _ in self.window)
+        self._text = "\n".join(parts)
+
+    def _start_fold(self):
+        if self._fold_task is not None:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return  # no loop yet (e.g. loading history at startup); the next add() retries
+
+        # Fold down to half the budget so folds don't happen on every turn
+        while self.window_tokens > self.budget // 2 and len(self.window) > 1:
+            line, tokens = self.window.popleft()
+            self.window_tokens -= tokens
+            self.folding.append(line)
+        if self.folding:
+            self._fold_task = loop.create_task(self._fold())
+
+    async def _fold(self):
+        folding = list(self.folding)
+        try:
+            summary = await self.summarize(self.summary, "\n".join(folding))
+        except Exception as e:
+            # Keep the turns verbatim and try again on a later add()
+            self._fold_task = None
+            logger.warning(f"Conversation summary failed, will retry: {e!r}")
+            return
+
+        self._fold_task = None
+        self.summary = summary.strip()
+        self.covered += len(folding)
+        del self.folding[:len(folding)]
+        self._rebuild()
+        self.version += 1
+        # Turns kept arriving while we waited on the summary
+        if self.window_tokens > self.budget:
+            self._start_fold()
@@ -0,0 +1,155 @@
+# Crisis detection before any LLM call
+#
+# Every incoming message is scanned for self-harm and suicide phrases with an
+# Aho-Corasick automaton: one pass over the words no matter how many phrases
+# there are. On a match on_message sends hotline resources right away, and the
+# message jumps ahead of the user's queue instead of waiting for an LLM reply
+# that may or may not mention a hotline.
+#
+# A suicide phrase right after a negation ("I don't want to die", "I'm not
+# suicidal") doesn't count. Only the words just before the phrase are looked
+# at, so "I don't know why I want to die" still matches, and phrases that are
+# negative themselves ("don't want to live") aren't affected.
+
+import re
+
+# category -> phrases, matched on whole words after normalize(); a trailing
+# "*" matches any word ending ("suicid*" covers suicide, suicidal, ...)
+PHRASES = {
+    "suicide": [
+        "suicid*", "kill myself", "killing myself", "end my life", "ending my life", "end it all",
+        "take my own life", "want to die", "wanna die", "wish i was dead", "wish i were dead",
+        "better off dead", "better off without me", "no reason to live", "nothing to live for",
+        "don't want to be alive", "dont want to be alive", "don't want to live", "dont want to live",
+        "don't want to be here anymore", "dont want to be here anymore", "not worth living", "kms",
+        "unalive myself", "goodbye forever", "jump off a bridge", "hang myself", "shoot myself",
+        "overdose", "overdosing", "planning my death", "write my suicide note",
+    ],
+    "self_harm": [
+        "self harm*", "selfharm*", "hurt myself", "hurting myself", "cut myself", "cutting myself",
+        "cutting again", "burn myself", "burning myself", "starve myself", "punish myself",
+    ],
+    "abuse": [
+        "he hits me", "she hits me", "they hit me", "being abused", "abusing me", "afraid to go home",
+        "scared to go home", "threatened to kill me",
+    ],
+}
+NEGATABLE = {"suicide"}  # categories whose phrases a negation right before them cancels
+
+CRISIS_RESOURCES = (
+    "💛 I'm really glad you told me, and I want to make sure you're safe right now.\n\n"
+    "If you're in immediate danger, please call your local emergency number (911 in the US).\n"
+    "- **988 Suicide & Crisis Lifeline** (US): call or text **988**, or chat at https://988lifeline.org\n"
+    "- **Crisis Text Line**: text **HOME** to **741741** (US/CA), **85258** (UK)\n"
+    "{extra}"
+    "- Outside the US: https://findahelpline.com lists free, confidential lines in your country\n\n"
+    "You don't have to go through this alone. I'm still here and want to keep talking with you."
+)
+ABUSE_RESOURCES = "- **National Domestic Violence Hotline** (US): call **1-800-799-7233** or text **START** to **88788**\n"
+
+_NON_WORD = re.compile(r"[^a-z0-9']+")
+# "kms" is "kill myself", but "5 kms" / "ten kms" is a distance
+_COUNTED_KMS = re.compile(
+    r"(?<= )(\d+|one|two|three|four|five|six|seven|eight|nine|ten|eleven|twelve|fifteen|twenty|thirty|"
+    r"forty|fifty|hundred|few|several|many|more|couple|of) kms(?= )")
+# The end of the words before a phrase, if they negate it; "why not" and "can't" don't
+_NEGATION = re.compile(
+    r"(?:^| )(?:(?<!why )not|never|don't|dont|doesn't|doesnt|didn't|didnt|won't|wont|wouldn't|wouldnt)"
+    r"(?: really| ever| even| going to| gonna)?$")
+NEGATION_WORDS = 4  # words before a phrase checked for a negation
+
+
+def normalize(text):
+    """Lowercase words separated by single spaces, padded with a space on both ends."""
+    return " " + _NON_WORD.sub(" ", text.lower().replace("’", "'")).strip() + " "
+
+
+class CrisisMatcher:
+    """Aho-Corasick automaton over PHRASES (or any {category: [phrase]} dict).
+
+    It steps over words rather than characters: phrases are whole words
+    anyway, and a message is ~5x fewer words than characters. A stem ("suicid*")
+    is handled by rewriting every word that starts with it to "suicid*" first.
+    """
+
+    def __init__(self, phrases=PHRASES, negatable=NEGATABLE):
+        # State 0 is the root; goto[s] maps a word to the next state
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [()]  # (category, length in words) of the phrases that end in each state
+        self.negatable = negatable
+        stems = set()
+        for category, patterns in phrases.items():
+            for pattern in patterns:
+                words = normalize(pattern.rstrip("*")).split()
+                if pattern.endswith("*"):
+                    stems.add(words[-1])
+                    words[-1] += "*"
+                self._insert(words, category)
+        self._link()
+        self.stem = re.compile(r"\b(" + "|".join(map(re.escape, sorted(stems))) + r")[a-z0-9']*") if stems else None
+
+    def _insert(self, words, category):
+        state = 0
+        for word in words:
+            nxt = self.goto[state].get(word)
+            if nxt is None:
+                nxt = len(self.goto)
+                self.goto[state][word] = nxt
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append(())
+            state = nxt
+        if (category, len(words)) not in self.output[state]:
+            self.output[state] += ((category, len(words)),)
+
+    def _link(self):
+        # Breadth-first, so each state's fail target is finished before its children need it
+        queue = list(self.goto[0].values())
+        for state in queue:
+            for word, nxt in self.goto[state].items():
+                queue.append(nxt)
+                fallback = self.fail[state]
+                while fallback and word not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[nxt] = self.goto[fallback].get(word, 0)
+                self.output[nxt] += tuple(c for c in self.output[self.fail[nxt]] if c not in self.output[nxt])
+        # Fill in missing transitions so scanning never walks fail links: one dict lookup per word
+        for state in queue:
+            for word, nxt in self.goto[self.fail[state]].items():
+                self.goto[state].setdefault(word, nxt)
+
+    def scan(self, text):
+        """Categories matched in text, in order of first appearance; empty if none."""
+        text = _COUNTED_KMS.sub(r"\1 km", normalize(text))
+        if self.stem is not None:
+            text = self.stem.sub(r"\1*", text)
+        goto, output = self.goto, self.output
+        state = 0
+        found = ()
+        words = text.split()
+        for i, word in enumerate(words):
+            state = goto[state].get(word, 0)
+            for category, length in output[state]:
+                if category in found or (category in self.negatable and self._negated(words, i + 1 - length)):
+                    continue
+                found += (category,)
+        return found
+
+    @staticmethod
+    def _negated(words, start):
+        """Whether the words just before words[start] negate the phrase starting there."""
+        return _NEGATION.search(" ".join(words[max(0, start - NEGATION_WORDS):start])) is not None
+
+
+MATCHER = CrisisMatcher()
+
+
+def detect(text):
+    """Crisis categories in a message (e.g. ("suicide",)), or () for none."""
+    return MATCHER.scan(text)
+
+
+def resources(categories):
+    """Hotline message for the categories detect() found."""
+    return CRISIS_RESOURCES.format(extra=ABUSE_RESOURCES if "abuse" in categories else "")
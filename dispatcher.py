@@ -0,0 +1,108 @@
+# Per-user message dispatcher
+#
+# Each user gets an async queue drained by its own worker task, so one
+# user's messages are handled strictly in order (the on_message state
+# machine never interleaves with itself) while different users run fully
+# in parallel. Only urgent jobs (crisis messages) may jump the queue.
+# Workers exit and their queues are dropped after sitting idle.
+
+import os
+import time
+import asyncio
+import logging
+import itertools
+from collections import deque
+
+logger = logging.getLogger("discord")
+
+IDLE_TIMEOUT = float(os.getenv("DISPATCHER_IDLE_TIMEOUT", "300"))  # seconds before an idle queue is reaped
+WAIT_SAMPLES = 1000  # recent queue wait times kept for percentiles
+
+
+class UserDispatcher:
+    def __init__(self, idle_timeout=IDLE_TIMEOUT):
+        self.idle_timeout = idle_timeout
+        self.queues = {}  # user_id -> asyncio.PriorityQueue of pending jobs
+        self.workers = {}  # user_id -> worker task
+
+        self.processed = 0
+        self.failed = 0
+        self.reaped = 0
+        self.waits = deque(maxlen=WAIT_SAMPLES)  # seconds each job sat in its queue
+        self.max_wait = 0.0
+        self._seq = itertools.count()  # FIFO order among jobs of the same priority
+
+    def submit(self, user_id, handler, *args, urgent=False):
+        """Queue `handler(*args)` behind the user's earlier messages.
+
+        Urgent jobs (crisis messages) go ahead of the user's other queued
+        jobs, though never interrupt the one already running. Returns a
+        future that resolves with the handler's result once it has run (None
+        if it raised; the error is logged here).
+        """
+        queue = self.queues.get(user_id)
+        if queue is None:
+            queue = self.queues[user_id] = asyncio.PriorityQueue()
+            self.workers[user_id] = asyncio.create_task(self._work(user_id, queue), name=f"user-{user_id}")
+
+        future = asyncio.get_running_loop().create_future()
+        queue.put_nowait((0 if urgent else 1, next(self._seq), time.monotonic(), handler, args, future))
+        return future
+
+    async def _work(self, user_id, queue):
+        while True:
+            try:
+                _, _, enqueued, handler, args, future = await asyncio.wait_for(queue.get(), self.idle_timeout)
+            except asyncio.TimeoutError:
+                # Nothing can be queued between the timeout and here (no await), so this is safe
+                if queue.empty():
+                    del self.queues[user_id]
+                    del self.workers[user_id]
+                    self.reaped += 1
+                    return
+                continue
+
+            wait = time.monotonic() - enqueued
+            self.waits.append(wait)
+            self.max_wait = max(self.max_wait, wait)
+            result = None
+            try:
+                result = await handler(*args)
+                self.processed += 1
+            except Exception:
+                self.failed += 1
+                logger.exception(f"Handler for user {user_id} failed")
+            if not future.done():
+                future.set_result(result)
+
+    def depth(self, user_id):
+        queue = self.queues.get(user_id)
+        return queue.qsize() if queue else 0
+
+    def stats(self):
+        """Snapshot of queue depth and wait time for logging or metrics."""
+        waits = sorted(self.waits)
+
+        def percentile(p):
+            return waits[min(len(waits) - 1, int(p * len(waits)))] if waits else 0.0
+
+        return {
+            "active_users": len(self.queues),
+            "queued": sum(q.qsize() for q in self.queues.values()),
+            "max_depth": max((q.qsize() for q in self.queues.values()), default=0),
+            "processed": self.processed,
+            "failed": self.failed,
+            "reaped": self.reaped,
+            "wait_p50": percentile(0.50),
+            "wait_p99": percentile(0.99),
+            "wait_max": self.max_wait,
+        }
+
+    async def close(self):
+        """Cancel every worker; messages still queued are dropped."""
+        workers = list(self.workers.values())
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        self.queues.clear()
+        self.workers.clear()
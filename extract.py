@@ -0,0 +1,329 @@
+# Local fast path for onboarding answers
+#
+# Most onboarding answers are trivial ("Mark", "20", "sf"), so they are parsed
+# locally first. Each parser returns (value, confidence); OnboardingManager
+# only falls back to the EXTRACT_INFO_PROMPT LLM call when the confidence is
+# below LOCAL_CONFIDENCE.
+
+import os
+import re
+
+from mood import FEELING_WORDS
+
+LOCAL_CONFIDENCE = float(os.getenv("EXTRACT_LOCAL_CONFIDENCE", "0.8"))
+
+MIN_AGE = 5
+MAX_AGE = 120
+
+UNITS = {
+    "zero": 0, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7,
+    "eight": 8, "nine": 9, "ten": 10, "eleven": 11, "twelve": 12, "thirteen": 13,
+    "fourteen": 14, "fifteen": 15, "sixteen": 16, "seventeen": 17, "eighteen": 18, "nineteen": 19,
+}
+TENS = {
+    "twenty": 20, "thirty": 30, "forty": 40, "fourty": 40, "fifty": 50,
+    "sixty": 60, "seventy": 70, "eighty": 80, "ninety": 90,
+}
+
+US_STATES = {
+    "al": "Alabama", "ak": "Alaska", "az": "Arizona", "ar": "Arkansas", "ca": "California",
+    "co": "Colorado", "ct": "Connecticut", "de": "Delaware", "fl": "Florida", "ga": "Georgia",
+    "hi": "Hawaii", "id": "Idaho", "il": "Illinois", "in": "Indiana", "ia": "Iowa",
+    "ks": "Kansas", "ky": "Kentucky", "la": "Louisiana", "me": "Maine", "md": "Maryland",
+    "ma": "Massachusetts", "mi": "Michigan", "mn": "Minnesota", "ms": "Mississippi", "mo": "Missouri",
+    "mt": "Montana", "ne": "Nebraska", "nv": "Nevada", "nh": "New Hampshire", "nj": "New Jersey",
+    "nm": "New Mexico", "ny": "New York", "nc": "North Carolina", "nd": "North Dakota", "oh": "Ohio",
+    "ok": "Oklahoma", "or": "Oregon", "pa": "Pennsylvania", "ri": "Rhode Island", "sc": "South Carolina",
+    "sd": "South Dakota", "tn": "Tennessee", "tx": "Texas", "ut": "Utah", "vt": "Vermont",
+    "va": "Virginia", "wa": "Washington", "wv": "West Virginia", "wi": "Wisconsin", "wy": "Wyoming",
+    "dc": "District of Columbia",
+}
+# Abbreviations that are also everyday words; alone they are left to the LLM
+AMBIGUOUS_STATES = {"hi", "id", "in", "me", "oh", "ok", "or"}
+
+# Canonical location -> aliases people actually type
+PLACES = {
+    "San Francisco, CA": ["sf", "san francisco", "san fran", "frisco", "bay area", "the bay"],
+    "New York City, NY": ["nyc", "new york city", "new york", "manhattan", "the big apple"],
+    "Brooklyn, NY": ["brooklyn"],
+    "Los Angeles, CA": ["la", "l.a.", "los angeles"],
+    "San Jose, CA": ["san jose", "sj"],
+    "Palo Alto, CA": ["palo alto", "stanford"],
+    "Oakland, CA": ["oakland"],
+    "Berkeley, CA": ["berkeley"],
+    "San Diego, CA": ["san diego"],
+    "Sacramento, CA": ["sacramento"],
+    "Seattle, WA": ["seattle"],
+    "Portland, OR": ["portland", "pdx"],
+    "Chicago, IL": ["chicago", "chi-town", "chitown"],
+    "Boston, MA": ["boston"],
+    "Washington, DC": ["washington dc", "washington d.c.", "dc", "d.c."],
+    "Philadelphia, PA": ["philadelphia", "philly"],
+    "Austin, TX": ["austin", "atx"],
+    "Houston, TX": ["houston"],
+    "Dallas, TX": ["dallas"],
+    "Miami, FL": ["miami"],
+    "Atlanta, GA": ["atlanta", "atl"],
+    "Denver, CO": ["denver"],
+    "Phoenix, AZ": ["phoenix"],
+    "Las Vegas, NV": ["las vegas", "vegas"],
+    "New Orleans, LA": ["new orleans", "nola"],
+    "Nashville, TN": ["nashville"],
+    "Minneapolis, MN": ["minneapolis"],
+    "Detroit, MI": ["detroit"],
+    "Salt Lake City, UT": ["salt lake city", "slc"],
+    "Pittsburgh, PA": ["pittsburgh"],
+    "Toronto, Canada": ["toronto"],
+    "Vancouver, Canada": ["vancouver"],
+    "Montreal, Canada": ["montreal"],
+    "Mexico City, Mexico": ["mexico city", "cdmx"],
+    "London, UK": ["london"],
+    "Paris, France": ["paris"],
+    "Berlin, Germany": ["berlin"],
+    "Dublin, Ireland": ["dublin"],
+    "Amsterdam, Netherlands": ["amsterdam"],
+    "Madrid, Spain": ["madrid"],
+    "Rome, Italy": ["rome"],
+    "Tokyo, Japan": ["tokyo"],
+    "Seoul, South Korea": ["seoul"],
+    "Beijing, China": ["beijing"],
+    "Shanghai, China": ["shanghai"],
+    "Hong Kong": ["hong kong", "hk"],
+    "Singapore": ["singapore"],
+    "Mumbai, India": ["mumbai", "bombay"],
+    "Bangalore, India": ["bangalore", "bengaluru"],
+    "Delhi, India": ["delhi", "new delhi"],
+    "Sydney, Australia": ["sydney"],
+    "Melbourne, Australia": ["melbourne"],
+    "United States": ["usa", "us", "the us", "the states", "america", "united states"],
+    "United Kingdom": ["uk", "the uk", "united kingdom", "england", "britain"],
+    "Canada": ["canada"],
+    "India": ["india"],
+    "Australia": ["australia"],
+    "Germany": ["germany"],
+    "France": ["france"],
+}
+
+# Normalized alias -> canonical location, built once at import
+LOCATION_INDEX = {alias: place for place, aliases in PLACES.items() for alias in aliases}
+for _abbr, _state in US_STATES.items():
+    LOCATION_INDEX.setdefault(_state.lower(), _state)
+    if _abbr not in AMBIGUOUS_STATES:
+        LOCATION_INDEX.setdefault(_abbr, _state)  # "ca", "ny"; "la" stays Los Angeles
+
+# What may follow the comma in "city, region": states (as their abbreviation) and countries
+REGIONS = {}
+for _abbr, _state in US_STATES.items():
+    REGIONS[_abbr] = REGIONS[_state.lower()] = _abbr.upper()
+for _place, _aliases in PLACES.items():
+    if ", " in _place:
+        _region = _place.split(", ")[1]
+        if _region.lower() not in US_STATES:
+            REGIONS.setdefault(_region.lower(), _region)  # "Japan", "UK"
+    else:
+        for _alias in _aliases:
+            REGIONS.setdefault(_alias, _place)  # "usa" -> "United States"
+
+# "strong" prefixes make it unambiguous that a name follows; "I'm ..." could be
+# "I'm tired" and "it's ..." / "this is ..." could be "it's complicated"
+NAME_PREFIXES = re.compile(
+    r"^(?:(?:hi|hello|hey)[,!.]?\s+)?"
+    r"(?:(?P<strong>my name is|my name's|name's|name is|call me)|i'm|im|i am|it's|its|this is)\s+",
+    re.IGNORECASE)
+LOCATION_PREFIXES = re.compile(
+    r"^(?:(?:i'm|im|i am|i)\s+)?(?:currently\s+)?"
+    r"(?:(?:live|living|based|located|staying|from)\s+(?:in\s+|at\s+|out of\s+|near\s+)?|in\s+)",
+    re.IGNORECASE)
+NAME_TOKEN = re.compile(r"^[^\W\d_][^\W\d_'\-]*(?:['\-][^\W\d_]+)*$")
+
+# Words that show up alone in onboarding answers but are never names
+NOT_NAMES = {
+    "hi", "hello", "hey", "yes", "no", "yeah", "nope", "ok", "okay", "sure", "thanks", "thank",
+    "you", "me", "my", "name", "is", "the", "a", "an", "i", "im", "what", "why", "who", "how",
+    "good", "fine", "great", "bad", "sad", "tired", "here", "not", "none", "nothing", "idk",
+    "anonymous", "skip", "lol", "hmm", "um", "uh",
+    # Interjections and refusals, which phone keyboards capitalize like a name
+    "nah", "pass", "later", "bye", "help", "maybe", "sorry", "stop", "wait", "huh", "yep", "yup",
+    "please", "pls", "cancel", "quit", "exit", "nevermind", "nvm", "dunno", "private", "secret", "rather",
+    "prefer", "test", "testing", "bot", "cool", "nice", "wow", "omg", "haha", "lmao", "k", "kk", "oops",
+    "whatever", "busy", "again", "back", "start", "menu", "hiya", "yo", "sup", "morning", "evening",
+}
+# A lone capitalized word without "I'm"/"my name is" is only taken locally if
+# it's a common first name; anything else ("Nah", "Zephyr") goes to the LLM
+FIRST_NAMES = set("""
+aaron abby adam adrian ahmed aiden aisha alan alex alexa alexander alexis ali alice alicia alison amanda amber
+amelia amir amy ana andre andrea andrew andy angela anna anne anthony anya arjun ashley ava ben benjamin beth
+bianca blake brandon brian brittany caleb cameron carlos carmen caroline casey catherine charles charlie chen
+chloe chris christian christina christopher claire cody connor daniel david diana diego dylan eli elijah
+elizabeth ella ellie emily emma eric erin ethan eva evan fatima felix fiona gabriel george grace hannah harry
+hassan henry holly ian isaac isabel isabella jack jacob jake james jamie jane jasmine jason jay jen jenna
+jennifer jeremy jess jessica jin joe john jonathan jordan jose joseph josh joshua julia julian justin kai
+karen kate katie kayla kevin kim kyle laura lauren leah leo liam lily linda lisa logan lucas lucy luis luke
+maria mark marcus mary matt matthew max maya megan mei mia michael michelle mike mohammed molly nathan nicole
+nina noah nora olivia omar oscar owen paul peter priya rachel raj rebecca richard riley robert ryan sam samuel
+sara sarah scott sean sebastian sofia sophia sophie stephanie steven taylor thomas tim tom tyler victoria
+william wei yuki zach zoe
+""".split())
+# "Depressed", "stressed out": an answer about how they feel, not who they are
+MOOD_WORDS = {word for words in FEELING_WORDS.values() for word in words}
+
+# A number is an age only next to one of these ("I'm 23", "23 years old")...
+AGE_CONTEXT = re.compile(r"\b(?:i'm|im|i am|turning|turned|age|aged):?\s+\d{1,3}\b|\b\d{1,3}\s*(?:years?|yrs?|yo|y/o)\b")
+# ...and never in a year or a percentage ("born in 99", "100 percent sure")
+NOT_AGE = re.compile(r"\bborn\s+in\s+'?\d|\d\s*(?:%|percent\b)")
+
+
+def _clean(text):
+    return text.strip().strip(".!?").strip()
+
+
+def parse_number_words(text):
+    """'twenty one', 'twenty-one', 'eighteen' -> int; None if it isn't only number words."""
+    words = re.split(r"[\s\-]+", text.lower().replace(" and ", " "))
+    words = [w for w in words if w]
+    if not words:
+        return None
+    total = 0
+    current = 0
+    for word in words:
+        if word in UNITS:
+            if current % 10 or (current and current < 20):
+                return None  # "one two", "twelve three"
+            current += UNITS[word]
+        elif word in TENS:
+            if current:
+                return None
+            current = TENS[word]
+        elif word == "hundred" and current:
+            total += current * 100
+            current = 0
+        else:
+            return None
+    return total + current
+
+
+def parse_age(text):
+    text = _clean(text)
+    lower = text.lower()
+
+    if re.fullmatch(r"\d{1,3}", lower):
+        age, confidence = int(lower), 0.95  # a bare answer to "How old are you?"
+    elif NOT_AGE.search(lower):
+        return None, 0.0
+    else:
+        digits = re.findall(r"\b\d{1,3}\b", lower)
+        stripped = re.sub(r"^(?:i'm|im|i am|i'm turning|turning|age|aged)\s+|\s*(?:years old|year old|yrs old|yrs|yo|y/o)$",
+                          "", lower).strip()
+        if len(digits) == 1:
+            age = int(digits[0])
+            if stripped == digits[0]:
+                confidence = 0.95
+            elif AGE_CONTEXT.search(lower):
+                confidence = 0.85
+            else:
+                return None, 0.0
+        else:
+            age = parse_number_words(stripped)
+            if age is None:
+                return None, 0.0
+            confidence = 0.9
+
+    if not MIN_AGE <= age <= MAX_AGE:
+        return None, 0.0
+    return age, confidence
+
+
+def parse_location(text):
+    text = _clean(text)
+    lower = LOCATION_PREFIXES.sub("", text.lower()).strip(" .!,")
+    had_prefix = lower != text.lower().strip(" .!,")
+
+    if lower in LOCATION_INDEX:
+        return LOCATION_INDEX[lower], 0.95
+
+    # "Austin, TX" / "portland, oregon" / "kyoto, japan"; any other "X, Y" ("nowhere, really") is left to the LLM
+    match = re.fullmatch(r"([a-z .'\-]+),\s*([a-z .]+)", lower)
+    if match:
+        city, region = match.group(1).strip(), match.group(2).strip()
+        region = REGIONS.get(region) or REGIONS.get(region.replace(".", ""))
+        if region:
+            return f"{city.title()}, {region}", 0.9
+
+    # An unknown place name after "I live in" is probably right, but let the LLM normalize it
+    if had_prefix and re.fullmatch(r"[a-z .'\-]{2,40}", lower):
+        return lower.title(), 0.6
+    return None, 0.0
+
+
+def _capitalize_name(token):
+    if any(c.isupper() for c in token):
+        return token  # keep the user's own casing ("McKenzie")
+    return re.sub(r"(^|['\-])(\w)", lambda m: m.group(1) + m.group(2).upper(), token)
+
+
+def parse_name(text):
+    text = _clean(text)
+    match = NAME_PREFIXES.match(text)
+    rest = text[match.end():] if match else text
+    tokens = rest.split()
+
+    if not 1 <= len(tokens) <= 3:
+        return None, 0.0
+    if any(not NAME_TOKEN.match(t) or t.lower() in NOT_NAMES for t in tokens):
+        return None, 0.0
+    if not (match and match.group("strong")) and any(t.lower() in MOOD_WORDS for t in tokens):
+        return None, 0.0  # "my name is Joy" is fine, "Joy" alone could be either
+
+    name = " ".join(_capitalize_name(t) for t in tokens)
+    if match and match.group("strong"):
+        return name, 0.95
+    if match:
+        # "I'm tired" vs. "I'm Sam": trust it only if they capitalized it
+        return name, 0.85 if tokens[0][0].isupper() else 0.6
+    if len(tokens) > 1:
+        # "Mark Smith" or "going to bed": the LLM tells them apart, the guess is kept only if it looks like a name
+        return (name, 0.6) if all(t[0].isupper() for t in tokens) else (None, 0.0)
+    if tokens[0].islower():
+        return name, 0.7  # "sf", "brb": a lone lowercase word is as likely a non-answer
+    if tokens[0].lower() not in FIRST_NAMES:
+        return name, 0.7  # "Nah", "Later": capitalized by the keyboard, not because it's a name
+    return name, 0.9
+
+
+PARSERS = {
+    "name": parse_name,
+    "age": parse_age,
+    "location": parse_location,
+}
+
+
+class LocalExtractor:
+    """Tries the local parsers and keeps hit-rate counters per field."""
+
+    def __init__(self, threshold=LOCAL_CONFIDENCE):
+        self.threshold = threshold
+        self.hits = {field: 0 for field in PARSERS}
+        self.misses = {field: 0 for field in PARSERS}
+
+    def extract(self, field, text):
+        """Return the value if the local parser is confident enough, otherwise None."""
+        value, confidence = PARSERS[field](text)
+        if value is not None and confidence >= self.threshold:
+            self.hits[field] += 1
+            return value
+        self.misses[field] += 1
+        return None
+
+    def guess(self, field, text):
+        """The local parse whatever its confidence; for when the LLM can't be asked."""
+        return PARSERS[field](text)[0]
+
+    def stats(self):
+        return {
+            field: {
+                "hits": self.hits[field],
+                "misses": self.misses[field],
+                "hit_rate": self.hits[field] / max(1, self.hits[field] + self.misses[field]),
+            }
+            for field in PARSERS
+        }
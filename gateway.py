@@ -0,0 +1,591 @@
+# Shared gateway for every Mistral call the bot makes
+#
+# One Mistral client (and one pooled HTTP connection pool) is shared by all
+# managers. Calls go through a global and a per-model concurrency cap and a
+# token bucket, are retried with jittered exponential backoff on 429/5xx and
+# network errors, and are bounded by a per-call deadline. Replies can also be
+# streamed token by token.
+#
+# Concurrency slots and rate-limit tokens are handed out by priority (crisis >
+# therapy > onboarding > journaling > buttons). Each priority has a bounded
+# queue and a maximum wait; calls that would overflow it, or can no longer
+# finish before their deadline, fail fast with Overloaded so callers can fall
+# back to degraded content instead of queueing without bound.
+#
+# Each call kind is routed to a model (small for JSON extraction, moods and
+# buttons, large for therapy). Calls with a fallback model are hedged: once a
+# call has run longer than its route's recent p95, the same request goes to
+# the fallback model too and whichever answers first wins. A losing completion
+# is left to finish, since it's billed either way, and its usage is recorded.
+#
+# Every response's token usage and cost go to a UsageLedger (usage.py), by
+# kind, model and user. Users past their daily token budget are moved to the
+# cheaper model, then refused with OverBudget.
+#
+# mistralai (and the HTTP pool) are only imported and built on first use: the
+# import alone takes a large share of the bot's cold start.
+
+import os
+import time
+import heapq
+import random
+import asyncio
+import logging
+import itertools
+import threading
+from collections import deque
+from contextlib import AsyncExitStack
+
+import metrics
+from usage import DOWNGRADE, EXHAUSTED, UsageLedger
+
+logger = logging.getLogger("discord")
+
+LARGE_MODEL = os.getenv("MISTRAL_LARGE_MODEL", "mistral-large-latest")
+SMALL_MODEL = os.getenv("MISTRAL_SMALL_MODEL", "mistral-small-latest")
+MISTRAL_MODEL = LARGE_MODEL  # for calls whose kind has no route
+
+
+def _price(name, default):
+    prompt, completion = os.getenv(name, default).split(",")
+    return float(prompt), float(completion)
+
+
+# USD per million prompt and completion tokens
+MODEL_PRICES = {
+    LARGE_MODEL: _price("MISTRAL_LARGE_PRICE", "2,6"),
+    SMALL_MODEL: _price("MISTRAL_SMALL_PRICE", "0.2,0.6"),
+}
+
+MAX_CONCURRENCY = int(os.getenv("MISTRAL_MAX_CONCURRENCY", "16"))  # in-flight calls overall
+MODEL_CONCURRENCY = int(os.getenv("MISTRAL_MODEL_CONCURRENCY", "8"))  # in-flight calls per model
+RATE_LIMIT = float(os.getenv("MISTRAL_RATE_LIMIT", "5"))  # requests per second
+RATE_BURST = int(os.getenv("MISTRAL_RATE_BURST", "10"))
+MAX_RETRIES = int(os.getenv("MISTRAL_MAX_RETRIES", "3"))
+CALL_TIMEOUT = float(os.getenv("MISTRAL_TIMEOUT", "30"))  # seconds, including queueing and retries
+
+BACKOFF_BASE = 0.5  # seconds
+BACKOFF_CAP = 8.0
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# Call kind -> priority, lower is served first
+PRIORITIES = {
+    "crisis": 0,
+    "therapy": 1,
+    "extract": 2,
+    "mood": 3, "synthesis": 3, "summary": 3, "other": 3,
+    "button": 4,
+}
+PRIORITY_NAMES = ["crisis", "therapy", "onboarding", "journaling", "buttons"]
+QUEUE_LIMITS = [None, 100, 50, 50, 10]  # waiting calls per priority; None is unbounded
+MAX_WAIT = [None, 15.0, 10.0, 10.0, 2.0]  # seconds a call may wait for admission; None waits until its deadline
+SERVICE_EWMA = 0.2  # smoothing of the expected call duration used for deadline checks
+
+# Call kind -> (model, fallback model to hedge with or None)
+ROUTES = {
+    "crisis": (LARGE_MODEL, SMALL_MODEL),
+    "therapy": (LARGE_MODEL, SMALL_MODEL),
+    "synthesis": (LARGE_MODEL, SMALL_MODEL),
+    "summary": (SMALL_MODEL, LARGE_MODEL),
+    "extract": (SMALL_MODEL, LARGE_MODEL),
+    "mood": (SMALL_MODEL, LARGE_MODEL),
+    "button": (SMALL_MODEL, None),  # generated in the background, nobody is waiting on it
+    "other": (MISTRAL_MODEL, None),
+}
+HEDGING = os.getenv("MISTRAL_HEDGING", "1") != "0"
+HEDGE_QUANTILE = float(os.getenv("MISTRAL_HEDGE_QUANTILE", "0.95"))
+HEDGE_MIN_SAMPLES = 20  # no hedging until a route has this many timings
+HEDGE_MIN_DELAY = 0.05  # seconds
+LATENCY_SAMPLES = 500  # recent timings kept per route
+
+
+class Overloaded(Exception):
+    """An LLM call was shed instead of queued: its queue was full or it couldn't finish in time."""
+
+
+class OverBudget(Overloaded):
+    """An LLM call was refused because its user, or the whole process, used up today's token budget."""
+
+
+class LatencyStats:
+    """Recent latencies of one route (kind, model, phase), for picking hedge delays."""
+
+    def __init__(self, samples=LATENCY_SAMPLES):
+        self.samples = deque(maxlen=samples)
+        self.count = 0
+        self._sorted = None  # cached sorted copy, dropped on every new sample
+
+    def observe(self, seconds):
+        self.samples.append(seconds)
+        self.count += 1
+        self._sorted = None
+
+    def quantile(self, q):
+        if not self.samples:
+            return None
+        if self._sorted is None:
+            self._sorted = sorted(self.samples)
+        return self._sorted[min(len(self._sorted) - 1, int(q * len(self._sorted)))]
+
+    def hedge_delay(self):
+        """Seconds to wait before hedging, or None while there is too little data."""
+        if len(self.samples) < HEDGE_MIN_SAMPLES:
+            return None
+        return max(HEDGE_MIN_DELAY, self.quantile(HEDGE_QUANTILE))
+
+
+class TokenBucket:
+    """Async token bucket: `rate` tokens per second, up to `capacity` banked."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def take(self):
+        """Take a token and return 0, or return the seconds until one is available."""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+
+class AdmissionQueue:
+    """Hands out concurrency slots, each with a rate-limit token, by priority.
+
+    Waiters are served lowest priority number first, FIFO within a priority.
+    A call also needs one of its model's slots; a waiter whose model is at
+    its cap is skipped without holding a global slot, so one saturated model
+    doesn't starve the others.
+    """
+
+    def __init__(self, slots, bucket, model_slots=MODEL_CONCURRENCY):
+        self.free = slots
+        self.model_slots = model_slots
+        self.model_free = {}  # model -> free slots, for models that have been used
+        self.bucket = bucket
+        self.waiting = []  # heap of (priority, seq, call deadline, future, kind, model)
+        self.queued = [0] * len(PRIORITY_NAMES)  # live waiters per priority
+        self.expected = 1.0  # seconds an admitted call usually takes (EWMA)
+        self._seq = itertools.count()
+        self._timer = None
+
+    async def acquire(self, kind, deadline, model=None):
+        """Wait for a slot; raises Overloaded if the call should be shed. Pair with release()."""
+        priority = PRIORITIES.get(kind, PRIORITIES["other"])
+        loop = asyncio.get_running_loop()
+        if self.free and self._model_free(model) and not self.waiting and not self.bucket.take():
+            self._grant(model)
+            return
+
+        limit = QUEUE_LIMITS[priority]
+        if limit is not None and self.queued[priority] >= limit:
+            self._shed(kind, "queue_full")
+        max_wait = MAX_WAIT[priority]
+        give_up = deadline if max_wait is None else min(deadline, loop.time() + max_wait)
+
+        future = loop.create_future()
+        entry = (priority, next(self._seq), deadline, future, kind, model)
+        heapq.heappush(self.waiting, entry)
+        self.queued[priority] += 1
+        timer = loop.call_later(max(0.0, give_up - loop.time()), self._expire, future, kind)
+        self._pump()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release(model=model)  # granted just as the caller gave up
+            raise
+        finally:
+            timer.cancel()
+            self.queued[priority] -= 1
+            if not future.done() or future.cancelled() or future.exception() is not None:
+                self._discard(entry)
+
+    def idle(self):
+        """True if a call could be admitted right now without making anyone wait."""
+        return self.free > 0 and not self.waiting
+
+    def release(self, seconds=None, model=None):
+        """Return a slot; `seconds` is how long the call held it, if it ran."""
+        if seconds is not None:
+            self.expected += SERVICE_EWMA * (seconds - self.expected)
+        self.free += 1
+        self.model_free[model] = self._model_free(model) + 1
+        self._pump()
+
+    def _model_free(self, model):
+        return self.model_free.get(model, self.model_slots)
+
+    def _grant(self, model):
+        self.free -= 1
+        self.model_free[model] = self._model_free(model) - 1
+
+    def _discard(self, entry):
+        # Drop a waiter that expired or was cancelled at once, wherever it is
+        # in the heap, so it doesn't keep idle() false until it reaches the top
+        try:
+            self.waiting.remove(entry)
+        except ValueError:
+            return  # already popped by _pump
+        heapq.heapify(self.waiting)
+        self._pump()
+
+    def _shed(self, kind, reason):
+        metrics.LLM_SHED.inc(kind=kind, reason=reason)
+        raise Overloaded(f"{kind} call shed ({reason})")
+
+    def _expire(self, future, kind):
+        if not future.done():
+            metrics.LLM_SHED.inc(kind=kind, reason="wait")
+            future.set_exception(Overloaded(f"{kind} call waited too long for a slot"))
+
+    def _wake(self):
+        self._timer = None
+        self._pump()
+
+    def _pump(self):
+        loop = asyncio.get_running_loop()
+        blocked = []  # waiters whose model is at its cap; they keep their place in line
+        try:
+            while self.free and self.waiting:
+                _, _, deadline, future, kind, model = self.waiting[0]
+                if future.done():  # expired or cancelled while queued
+                    heapq.heappop(self.waiting)
+                    continue
+                if not self._model_free(model):
+                    blocked.append(heapq.heappop(self.waiting))
+                    continue
+                # Don't spend a slot on a call that can't finish before its deadline anyway
+                if deadline - loop.time() < self.expected:
+                    heapq.heappop(self.waiting)
+                    metrics.LLM_SHED.inc(kind=kind, reason="deadline")
+                    future.set_exception(Overloaded("call can't finish before its deadline"))
+                    continue
+                wait = self.bucket.take()
+                if wait:
+                    if self._timer is None:
+                        self._timer = loop.call_later(wait, self._wake)
+                    return
+                heapq.heappop(self.waiting)
+                self._grant(model)
+                future.set_result(None)
+        finally:
+            for entry in blocked:
+                heapq.heappush(self.waiting, entry)
+
+
+def _status_code(error):
+    status = getattr(error, "status_code", None)
+    if status is None and getattr(error, "raw_response", None) is not None:
+        status = error.raw_response.status_code
+    return status
+
+
+def _is_retryable(error):
+    import httpx  # already loaded by the time a call has failed
+    if isinstance(error, (httpx.TransportError, asyncio.TimeoutError)):
+        return True
+    return _status_code(error) in RETRY_STATUSES
+
+
+def _retry_after(error):
+    """Seconds the server asked us to wait, if it sent a Retry-After header."""
+    response = getattr(error, "raw_response", None)
+    if response is None:
+        return None
+    try:
+        return float(response.headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class LLMGateway:
+    def __init__(self, api_key=None, server_url=None):
+        self.api_key = api_key or os.getenv("MISTRAL_API_KEY")
+        self.server_url = server_url or os.getenv("MISTRAL_SERVER_URL") or None
+        self.http = None
+        self._client = None
+        self._client_lock = threading.Lock()  # warm_up() builds the client on a worker thread
+
+        self.bucket = TokenBucket(RATE_LIMIT, RATE_BURST)
+        self.admission = AdmissionQueue(MAX_CONCURRENCY, self.bucket)
+        self.latency = {}  # (kind, model, phase) -> LatencyStats; phase is "complete" or "first_token"
+        self.usage = UsageLedger(MODEL_PRICES)
+        self._losers = set()  # hedge legs that lost but are left to finish
+
+    @property
+    def client(self):
+        """The Mistral client, imported and constructed on first use."""
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    import httpx
+                    from mistralai import Mistral
+
+                    # Keep-alive pool sized to the concurrency cap so connections get reused
+                    self.http = httpx.AsyncClient(
+                        follow_redirects=True,
+                        limits=httpx.Limits(max_connections=MAX_CONCURRENCY,
+                                            max_keepalive_connections=MAX_CONCURRENCY),
+                    )
+                    self._client = Mistral(api_key=self.api_key, server_url=self.server_url,
+                                           async_client=self.http)
+        return self._client
+
+    async def warm_up(self):
+        """Build the client on a worker thread so the first user message doesn't pay for the import."""
+        await asyncio.to_thread(lambda: self.client)
+
+    def route_stats(self, kind, model, phase):
+        key = (kind, model, phase)
+        if key not in self.latency:
+            self.latency[key] = LatencyStats()
+        return self.latency[key]
+
+    async def _send(self, model, kind, deadline, messages, kwargs):
+        await self.admission.acquire(kind, deadline, model)
+        start = time.monotonic()
+        try:
+            return await self.client.chat.complete_async(model=model, messages=messages, **kwargs)
+        finally:
+            self.admission.release(time.monotonic() - start, model)
+
+    async def _open_stream(self, model, kind, deadline, messages, kwargs):
+        # The slots stay held until the caller has drained the stream. Streams
+        # last as long as the reader takes, so they don't feed the duration estimate.
+        await self.admission.acquire(kind, deadline, model)
+        slots = AsyncExitStack()
+        slots.callback(self.admission.release, model=model)
+        try:
+            stream = await self.client.chat.stream_async(model=model, messages=messages, **kwargs)
+        except BaseException:
+            await slots.aclose()
+            raise
+        return stream, slots
+
+    async def _start_stream(self, model, kind, deadline, messages, kwargs):
+        """Open a stream and read its first event: (stream, slots, events, first event or None)."""
+        stream, slots = await self._open_stream(model, kind, deadline, messages, kwargs)
+        events = aiter(stream)
+        try:
+            first = await anext(events, None)
+        except BaseException:
+            await stream.response.aclose()
+            await slots.aclose()
+            raise
+        return stream, slots, events, first
+
+    def check_budget(self, kind, user_id):
+        """The user's budget level for a `kind` call; raises OverBudget if it would be refused.
+
+        Callers check before batching an item, and send a downgraded user's
+        item on its own, so their level doesn't apply to the whole batch.
+        """
+        return self._check_level(kind, user_id)
+
+    def _check_level(self, kind, user_id):
+        level = self.usage.level(kind, user_id)
+        if level == EXHAUSTED:
+            metrics.LLM_SHED.inc(kind=kind, reason="budget")
+            raise OverBudget(f"{kind} call refused: daily token budget used up")
+        return level
+
+    def _budgeted(self, kind, model, user_id):
+        """(model, whether to hedge) for a call, after budgets; raises OverBudget once they're used up."""
+        route = ROUTES.get(kind, ROUTES["other"])
+        level = self._check_level(kind, user_id)
+        if level == DOWNGRADE:
+            metrics.LLM_DOWNGRADES.inc(kind=kind)
+            cheaper = min((m for m in route if m is not None), key=lambda m: sum(MODEL_PRICES.get(m, (0, 0))))
+            return model or cheaper, False
+        return model or route[0], True
+
+    async def _hedged(self, kind, model, phase, attempt, discard=None, hedge=True, finish=False):
+        """Run attempt(model); if it outlives the route's p95, race attempt(fallback) against it.
+
+        Returns (model that answered, result). A leg that loses the race but
+        answers anyway is passed to discard(model, result); with `finish`, a
+        losing leg still running is left to do so in the background instead of
+        being cancelled. Hedges are only sent while the admission queue is
+        idle, so they never push a waiting call further back.
+        """
+        loop = asyncio.get_running_loop()
+        fallback = ROUTES.get(kind, ROUTES["other"])[1] if HEDGING and hedge else None
+
+        async def timed(model):
+            start = loop.time()
+            try:
+                result = await attempt(model)
+            except asyncio.CancelledError:
+                # A lost race still tells us the call took at least this long
+                self.route_stats(kind, model, phase).observe(loop.time() - start)
+                raise
+            self.route_stats(kind, model, phase).observe(loop.time() - start)
+            return result
+
+        delay = self.route_stats(kind, model, phase).hedge_delay()
+        if fallback is None or fallback == model or delay is None:
+            return model, await timed(model)
+
+        tasks = {asyncio.ensure_future(timed(model)): model}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if done or not self.admission.idle():
+                first = next(iter(tasks))
+                return model, await first
+            metrics.LLM_HEDGES.inc(kind=kind, model=fallback)
+            tasks[asyncio.ensure_future(timed(fallback))] = fallback
+            pending, error = set(tasks), None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                answered = [task for task in done if task.exception() is None]
+                if answered:
+                    winner = answered[0]
+                    if discard is not None:
+                        for task in answered[1:]:
+                            await discard(tasks[task], task.result())
+                        if finish:
+                            for task in pending:
+                                self._settle(task, tasks.pop(task), discard)
+                    metrics.LLM_HEDGE_WINS.inc(kind=kind, model=tasks[winner])
+                    return tasks[winner], winner.result()
+                error = error or next(iter(done)).exception()
+            raise error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    def _settle(self, task, model, discard):
+        """Hand a losing leg's result to discard(model, result) once it finishes."""
+        async def settle():
+            try:
+                result = await task
+            except Exception:
+                return  # failed or ran out of time; nothing came back to account for
+            await discard(model, result)
+
+        loser = asyncio.ensure_future(settle())
+        self._losers.add(loser)
+        loser.add_done_callback(self._losers.discard)
+
+    async def _retrying(self, model, kind, deadline, attempt_call):
+        """Await attempt_call() until it succeeds, retrying retryable errors until the deadline."""
+        loop = asyncio.get_running_loop()
+        attempt = 0
+        while True:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                raise asyncio.TimeoutError(f"Mistral call to {model} ran past its deadline")
+            try:
+                return await asyncio.wait_for(attempt_call(), remaining)
+            except Exception as e:
+                if not _is_retryable(e) or attempt >= MAX_RETRIES:
+                    raise
+                # Full jitter, but never sooner than the server asked for
+                delay = random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+                delay = max(delay, _retry_after(e) or 0)
+                if loop.time() + delay >= deadline:
+                    raise
+                attempt += 1
+                reason = _status_code(e) or type(e).__name__
+                metrics.LLM_RETRIES.inc(kind=kind, reason=reason)
+                logger.warning(f"Mistral call to {model} failed ({reason}), retry {attempt} in {delay:.2f}s")
+                await asyncio.sleep(delay)
+
+    async def complete(self, messages, model=None, timeout=CALL_TIMEOUT, kind="other", user_id=None, **kwargs):
+        """Run chat.complete_async with retries; raises once `timeout` seconds have passed.
+
+        `kind` names the prompt type (therapy, mood, extract, ...); it picks
+        the model from ROUTES unless `model` is given, and labels metrics.
+        `user_id` is who the call is for, if anyone: usage is charged to them
+        and their budget applies. For a batch it's the list of its items'
+        users, who share the cost.
+        """
+        loop = asyncio.get_running_loop()
+        model, hedge = self._budgeted(kind, model, user_id)
+        start = loop.time()
+        deadline = start + timeout
+
+        def attempt(model):
+            return self._retrying(model, kind, deadline, lambda: self._send(model, kind, deadline, messages, kwargs))
+
+        async def discard(model, response):
+            self.usage.record(kind, model, response.usage, user_id)
+
+        try:
+            model, response = await self._hedged(kind, model, "complete", attempt, discard, hedge, finish=True)
+        except Exception as e:
+            metrics.LLM_ERRORS.inc(kind=kind, reason=_status_code(e) or type(e).__name__)
+            raise
+        finally:
+            metrics.LLM_SECONDS.observe(loop.time() - start, kind=kind, model=model)
+        self.usage.record(kind, model, response.usage, user_id)
+        return response
+
+    async def stream(self, messages, model=None, timeout=CALL_TIMEOUT, kind="other", user_id=None, **kwargs):
+        """Yield content deltas from chat.stream_async as they arrive.
+
+        Opening the stream and getting its first event is retried (and
+        hedged) like complete(); once tokens have been yielded a failure is
+        raised to the caller, since the partial text is already out.
+        """
+        loop = asyncio.get_running_loop()
+        model, hedge = self._budgeted(kind, model, user_id)
+        start = loop.time()
+        deadline = start + timeout
+
+        def attempt(model):
+            return self._retrying(
+                model, kind, deadline, lambda: self._start_stream(model, kind, deadline, messages, kwargs))
+
+        async def discard(model, started):
+            await started[0].response.aclose()
+            await started[1].aclose()
+
+        try:
+            model, (stream, slots, events, event) = await self._hedged(kind, model, "first_token", attempt, discard, hedge)
+        except Exception as e:
+            metrics.LLM_ERRORS.inc(kind=kind, reason=_status_code(e) or type(e).__name__)
+            raise
+
+        usage = None
+        try:
+            while event is not None:
+                usage = event.data.usage or usage  # only the last chunk carries it
+                if event.data.choices:
+                    delta = event.data.choices[0].delta.content
+                    if isinstance(delta, str) and delta:
+                        yield delta
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    raise asyncio.TimeoutError(f"Mistral stream from {model} ran past its deadline")
+                event = await asyncio.wait_for(anext(events, None), remaining)
+        except Exception as e:
+            metrics.LLM_ERRORS.inc(kind=kind, reason=_status_code(e) or type(e).__name__)
+            raise
+        finally:
+            await stream.response.aclose()
+            await slots.aclose()
+            metrics.LLM_SECONDS.observe(loop.time() - start, kind=kind, model=model)
+            self.usage.record(kind, model, usage, user_id)
+
+    async def aclose(self):
+        if self.http is not None:
+            await self.http.aclose()
+
+
+_gateway = None
+
+
+def get_gateway():
+    """Process-wide gateway shared by every manager that isn't handed one explicitly."""
+    global _gateway
+    if _gateway is None:
+        _gateway = LLMGateway()
+    return _gateway
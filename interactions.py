@@ -0,0 +1,139 @@
+# Central handling for component interactions (the feature menu's buttons)
+#
+# Discord drops an interaction that isn't acknowledged within 3 seconds of
+# the click. Handlers answer through a Reply: if the answer is ready in time
+# it goes out as the interaction's response, and otherwise the dispatcher
+# defers ("thinking...") just before the deadline, so a slow LLM call turns
+# into a followup instead of a failed interaction. A second click on the same
+# button by the same user while the first is still in flight is acknowledged
+# silently instead of starting another call. Click-to-acknowledgement and
+# click-to-answer latency go to the metrics.
+#
+# Handlers are registered by custom_id; persistent views route clicks here, so
+# a button works on any message that carries its custom_id, across restarts.
+
+import os
+import time
+import asyncio
+import logging
+
+import discord
+
+import metrics
+
+logger = logging.getLogger("discord")
+
+ACK_DEADLINE = float(os.getenv("INTERACTION_ACK_DEADLINE", "2.0"))  # seconds after the click; Discord allows 3
+ERROR_REPLY = "Sorry, that didn't work this time. Please try again in a moment 💛"
+
+
+class Reply:
+    """Answers one interaction: the response while it's still open, followups after that."""
+
+    def __init__(self, interaction, ephemeral=True):
+        self.interaction = interaction
+        self.ephemeral = ephemeral
+        self.lock = asyncio.Lock()  # the deadline's defer and the handler's answer must not cross
+        self.acked_at = None
+        self.answered_at = None
+        self.deferred = False
+        self.message = None  # the followup holding the answer, when it went out after a defer
+
+    def _ack(self):
+        if self.acked_at is None:
+            self.acked_at = time.perf_counter()
+
+    async def send(self, content=None, **kwargs):
+        async with self.lock:
+            if not self.interaction.response.is_done():
+                await self.interaction.response.send_message(content, ephemeral=self.ephemeral, **kwargs)
+            else:
+                message = await self.interaction.followup.send(content, ephemeral=self.ephemeral, wait=True, **kwargs)
+                if self.message is None:
+                    self.message = message
+            self._ack()
+            if self.answered_at is None:
+                self.answered_at = time.perf_counter()
+
+    async def edit(self, **kwargs):
+        """Edit the answer: the response, or after a defer the followup, not the "thinking..." message."""
+        if self.message is not None:
+            await self.message.edit(**kwargs)
+        else:
+            await self.interaction.edit_original_response(**kwargs)
+
+    async def defer(self):
+        async with self.lock:
+            if not self.interaction.response.is_done():
+                await self.interaction.response.defer(ephemeral=self.ephemeral, thinking=True)
+                self.deferred = True
+                self._ack()
+
+
+class InteractionDispatcher:
+    def __init__(self, ack_deadline=ACK_DEADLINE):
+        self.ack_deadline = ack_deadline
+        self.handlers = {}  # custom_id -> async handler(interaction, reply)
+        self.in_flight = set()  # (user id, custom_id) being handled
+        self.deduplicated = 0
+        self.deferred = 0
+
+    def register(self, custom_id, handler):
+        self.handlers[custom_id] = handler
+
+    def _age(self, interaction):
+        """Seconds since the click, from the interaction's snowflake time (clamped, clocks differ)."""
+        created_at = getattr(interaction, "created_at", None)
+        age = (discord.utils.utcnow() - created_at).total_seconds() if created_at is not None else 0.0
+        return min(max(age, 0.0), self.ack_deadline)
+
+    async def dispatch(self, interaction, custom_id):
+        """Run the handler registered for custom_id on this click."""
+        handler = self.handlers.get(custom_id)
+        if handler is None:
+            logger.warning(f"No handler for interaction {custom_id!r}")
+            return
+        age = self._age(interaction)
+        start = time.perf_counter() - age  # latencies are measured from the click
+        key = (interaction.user.id, custom_id)
+        if key in self.in_flight:
+            # Acknowledge without a visible message; the first click's answer is still coming
+            self.deduplicated += 1
+            metrics.INTERACTIONS.inc(custom_id=custom_id, outcome="duplicate")
+            try:
+                await interaction.response.defer()
+            except discord.HTTPException:
+                pass
+            return
+
+        self.in_flight.add(key)
+        reply = Reply(interaction)
+        task = asyncio.ensure_future(handler(interaction, reply))
+        outcome = "ok"
+        try:
+            done, _ = await asyncio.wait({task}, timeout=self.ack_deadline - age)
+            if not done:
+                await reply.defer()
+                self.deferred += 1
+            await task
+            if reply.deferred:
+                outcome = "deferred"
+        except discord.NotFound:
+            outcome = "expired"  # acknowledged too late; Discord already showed the click as failed
+            logger.warning(f"Interaction {custom_id!r} expired before it was acknowledged")
+        except Exception:
+            outcome = "error"
+            logger.exception(f"Interaction {custom_id!r} failed")
+            try:
+                await reply.send(ERROR_REPLY)
+            except discord.HTTPException:
+                pass
+        finally:
+            if not task.done():
+                task.cancel()
+            self.in_flight.discard(key)
+            metrics.INTERACTIONS.inc(custom_id=custom_id, outcome=outcome)
+            if reply.acked_at is not None:
+                metrics.INTERACTION_SECONDS.observe(reply.acked_at - start, custom_id=custom_id, phase="ack")
+            if reply.answered_at is not None:
+                metrics.INTERACTION_SECONDS.observe(reply.answered_at - start, custom_id=custom_id, phase="answer")
@@ -0,0 +1,152 @@
+# Paged, filtered views of a mood journal for !logs
+#
+# A journal is append-only and in time order, so a date range is two bisects
+# on the timestamps and a page is the run of matching entries that ends at a
+# cursor (the position just past the page's newest entry). Every page holds
+# PAGE_ENTRIES entries (summaries are clipped harder to fit one message), so a
+# cursor and the query are all it takes to rebuild a page and its neighbours,
+# and the page buttons carry them in their custom_id. Mood filters go through
+# per-mood position lists, built on first use and extended as entries are
+# appended. Rendering formats only the page's entries, so a !logs page costs
+# the same for a user with ten entries as for one with ten thousand.
+
+import bisect
+import datetime
+
+from mood import MOOD_LABELS
+
+PAGE_ENTRIES = 5
+PAGE_CHARS = 1900  # below Discord's 2000-character limit
+SUMMARY_CHARS = 600  # longest summary shown; longer ones are clipped
+MIN_SUMMARY_CHARS = 80  # how far summaries may be clipped to fit a full page into one message
+
+
+class JournalQuery:
+    """Which entries !logs shows: one mood and/or a date range."""
+
+    def __init__(self, mood=None, since=None, until=None):
+        self.mood = mood
+        self.since = since  # ISO date, inclusive
+        self.until = until  # ISO date, exclusive
+
+    @classmethod
+    def parse(cls, args, today=None):
+        """From !logs arguments: a mood, `30d` for the last 30 days, or a start and optional end date (YYYY-MM-DD).
+
+        Raises ValueError with a message for the user if an argument isn't one of those.
+        """
+        today = today or datetime.date.today()
+        mood, dates = None, []
+        for arg in args:
+            if arg.capitalize() in MOOD_LABELS:
+                mood = arg.capitalize()
+            elif arg[:-1].isdigit() and arg[-1:].lower() == "d":
+                dates = [today - datetime.timedelta(days=int(arg[:-1]))]
+            else:
+                try:
+                    dates.append(datetime.date.fromisoformat(arg))
+                except ValueError:
+                    raise ValueError(f"I don't understand `{arg}`; try a mood, `30d` or a date like "
+                                     f"`{today.isoformat()}`.") from None
+        if len(dates) > 2:
+            raise ValueError("Give at most two dates: where to start and where to stop.")
+        since = dates[0].isoformat() if dates else None
+        until = (dates[1] + datetime.timedelta(days=1)).isoformat() if len(dates) == 2 else None
+        return cls(mood, since, until)
+
+    def key(self):
+        """Compact form for a custom_id; from_key reverses it."""
+        return f"{self.mood or ''}:{self.since or ''}:{self.until or ''}"
+
+    @classmethod
+    def from_key(cls, key):
+        mood, since, until = key.split(":")
+        return cls(mood or None, since or None, until or None)
+
+    def describe(self):
+        text = f"{self.mood} entries" if self.mood else "Entries"
+        if self.since:
+            text += f" since {self.since}"
+        if self.until:
+            last_day = datetime.date.fromisoformat(self.until) - datetime.timedelta(days=1)
+            text += f" through {last_day.isoformat()}"
+        return text
+
+
+class JournalIndex:
+    """Positions in one user's journal by time and by mood."""
+
+    def __init__(self, entries):
+        self.entries = entries  # the journal list itself; log_mood keeps appending to it
+        self.by_mood = {}  # mood -> positions, ascending
+        self.indexed = 0  # entries already in by_mood
+
+    def _catch_up(self):
+        for position in range(self.indexed, len(self.entries)):
+            self.by_mood.setdefault(self.entries[position]["mood"], []).append(position)
+        self.indexed = len(self.entries)
+
+    def span(self, since=None, until=None):
+        """[lo, hi) positions of the entries timestamped from `since` up to `until`."""
+        key = lambda entry: entry["timestamp"]
+        lo = bisect.bisect_left(self.entries, since, key=key) if since else 0
+        hi = bisect.bisect_left(self.entries, until, key=key) if until else len(self.entries)
+        return lo, max(lo, hi)
+
+    def page(self, query, before=None, limit=PAGE_ENTRIES):
+        """(positions, older, total): the newest `limit` entries matching `query` below position `before`.
+
+        `older` is how many matching entries come before the page and `total` how many match in all.
+        """
+        lo, hi = self.span(query.since, query.until)
+        end = hi if before is None else max(lo, min(hi, before))
+        if query.mood is None:
+            start = max(lo, end - limit)
+            return list(range(start, end)), start - lo, hi - lo
+        self._catch_up()
+        positions = self.by_mood.get(query.mood, [])
+        first, last = bisect.bisect_left(positions, lo), bisect.bisect_left(positions, hi)
+        stop = bisect.bisect_left(positions, end)
+        start = max(first, stop - limit)
+        return positions[start:stop], start - first, last - first
+
+    def newer(self, query, before, limit=PAGE_ENTRIES):
+        """`before` of the page just newer than the one ending at `before`; None if that's the newest page."""
+        lo, hi = self.span(query.since, query.until)
+        if query.mood is None:
+            end = max(lo, before) + limit
+            return end if end < hi else None
+        self._catch_up()
+        positions = self.by_mood.get(query.mood, [])
+        stop = bisect.bisect_left(positions, max(lo, before)) + limit
+        return positions[stop] if stop < bisect.bisect_left(positions, hi) else None
+
+
+def format_entry(position, entry, summary_chars=SUMMARY_CHARS):
+    summary = str(entry["synthesis"])
+    if len(summary) > summary_chars:
+        summary = summary[:summary_chars].rsplit(" ", 1)[0] + "…"
+    return (f"📅 **Entry {position + 1}** · {entry['timestamp'][:16].replace('T', ' ')}\n"
+            f"- Mood: {entry['mood']}\n"
+            f"- Summary: {summary}\n")
+
+
+def render_page(index, query, header, before=None):
+    """(text, older, newer) for one !logs page; text is None if nothing matches.
+
+    `older` and `newer` are the `before` of the neighbouring pages: older is None on the oldest page, and newer
+    is None when the newer page is the newest one (or, with `before` None, this page already is).
+    """
+    positions, older, total = index.page(query, before)
+    if not positions:
+        return None, None, None
+    footer = f"_{query.describe()}: {older + 1}–{older + len(positions)} of {total}_"
+    summary_chars = SUMMARY_CHARS
+    while True:
+        blocks = [format_entry(position, index.entries[position], summary_chars) for position in positions]
+        text = "\n".join([header, *blocks, footer])
+        if len(text) <= PAGE_CHARS or summary_chars <= MIN_SUMMARY_CHARS:
+            break
+        summary_chars = max(MIN_SUMMARY_CHARS, summary_chars * 3 // 4)
+    newer = index.newer(query, before) if before is not None else None
+    return text, positions[0] if older else None, newer
@@ -0,0 +1,138 @@
+# Long-term memory for therapy replies
+#
+# Past turns and journal syntheses are embedded locally (hashed word, bigram
+# and prefix features, no model download) into NumPy arrays, one index per
+# user. A reply only pulls the few snippets most similar to the new message
+# into the prompt, so recall reaches back over the whole history while the
+# prompt stays a fixed size.
+
+import os
+import re
+import hashlib
+import functools
+
+import numpy as np
+
+EMBED_DIM = 1024
+MEMORY_TOP_K = int(os.getenv("MEMORY_TOP_K", "4"))
+RECENT_TURNS = int(os.getenv("MEMORY_RECENT_TURNS", "3"))  # latest turns sent verbatim instead of searched
+MIN_SIMILARITY = float(os.getenv("MEMORY_MIN_SIMILARITY", "0.15"))
+SNIPPET_CHARS = 500  # longest snippet put into a prompt
+PREFIX_LEN = 5  # "stressed", "stressful" and "stress" share a feature
+NAME_WEIGHT = 2.0
+
+TOKEN = re.compile(r"[A-Za-z0-9']+")
+STOPWORDS = {
+    "a", "an", "the", "and", "or", "but", "if", "so", "to", "of", "in", "on", "at", "for", "with", "about",
+    "is", "am", "are", "was", "were", "be", "been", "being", "it", "it's", "this", "that", "i", "i'm", "i've",
+    "me", "my", "you", "your", "we", "they", "he", "she", "just", "really", "very", "do", "did", "have", "has",
+    "had", "what", "how", "when", "than", "then", "there", "its", "as", "by", "from", "up", "out", "too",
+    "again", "today", "got", "get", "feel", "feeling", "think", "like", "know", "can", "can't", "don't", "not",
+}
+
+
+@functools.lru_cache(maxsize=65536)
+def _bucket(feature):
+    """(column, sign) for a feature; signed hashing keeps collisions from only adding up."""
+    h = int.from_bytes(hashlib.blake2b(feature.encode(), digest_size=8).digest(), "little")
+    return h % EMBED_DIM, 1.0 if h >> 63 else -1.0
+
+
+def _features(text):
+    words = [w for w in TOKEN.findall(text.replace("’", "'")) if w.lower() not in STOPWORDS]
+    tokens = [w.lower() for w in words]
+    # Capitalized words are mostly names (people, pets, places), which is what recall hinges on
+    features = [(t, NAME_WEIGHT if w[0].isupper() else 1.0) for w, t in zip(words, tokens)]
+    features += [("~" + t[:PREFIX_LEN], 0.5) for t in tokens if len(t) > PREFIX_LEN]
+    features += [(f"{a} {b}", 0.5) for a, b in zip(tokens, tokens[1:])]
+    return features
+
+
+def _sparse(text):
+    """(columns, values) of the unit-length embedding of text."""
+    row = {}
+    for feature, weight in _features(text):
+        col, sign = _bucket(feature)
+        row[col] = row.get(col, 0.0) + sign * weight
+    cols = np.fromiter(row.keys(), dtype=np.int16, count=len(row))
+    values = np.fromiter(row.values(), dtype=np.float32, count=len(row))
+    norm = np.linalg.norm(values)
+    return cols, values / norm if norm > 0 else values
+
+
+def embed(text):
+    """Dense unit-length embedding of text, shape (EMBED_DIM,)."""
+    vector = np.zeros(EMBED_DIM, dtype=np.float32)
+    cols, values = _sparse(text)
+    vector[cols] = values
+    return vector
+
+
+class MemoryIndex:
+    """Embedded snippets for one user; grows in place as turns are added.
+
+    Embeddings have a few dozen non-zeros out of EMBED_DIM, so they are kept
+    as one flat array of (column, value) pairs with a start offset per entry.
+    """
+
+    def __init__(self, capacity=16):
+        self.cols = np.zeros(capacity * 16, dtype=np.int16)
+        self.values = np.zeros(capacity * 16, dtype=np.float32)
+        self.starts = np.zeros(capacity, dtype=np.int64)  # offset of each entry's first pair
+        self.turns = np.zeros(capacity, dtype=np.int32)  # conversation turn number, -1 for journal entries
+        self.snippets = []
+        self.count = 0
+        self.nnz = 0
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def nbytes(self):
+        return self.cols.nbytes + self.values.nbytes + self.starts.nbytes + self.turns.nbytes
+
+    def extend(self, texts, snippets, turns):
+        """Index several entries at once; `texts` is what gets embedded, `snippets` what a search returns."""
+        rows = [_sparse(text) for text in texts]
+        if not rows:
+            return
+        # An entry needs at least one pair for reduceat; a zero value scores 0 like an empty row would
+        rows = [(cols, values) if len(cols) else (np.zeros(1, np.int16), np.zeros(1, np.float32)) for cols, values in rows]
+        lengths = np.array([len(cols) for cols, _ in rows])
+        count, nnz = self.count + len(rows), self.nnz + int(lengths.sum())
+        if count > len(self.starts):
+            capacity = max(count, 2 * len(self.starts))
+            self.starts = np.resize(self.starts, capacity)
+            self.turns = np.resize(self.turns, capacity)
+        if nnz > len(self.cols):
+            capacity = max(nnz, 2 * len(self.cols))
+            self.cols = np.resize(self.cols, capacity)
+            self.values = np.resize(self.values, capacity)
+
+        self.cols[self.nnz:nnz] = np.concatenate([cols for cols, _ in rows])
+        self.values[self.nnz:nnz] = np.concatenate([values for _, values in rows])
+        self.starts[self.count:count] = self.nnz + np.concatenate([[0], np.cumsum(lengths)[:-1]])
+        self.turns[self.count:count] = list(turns)
+        self.snippets += [s if len(s) <= SNIPPET_CHARS else s[:SNIPPET_CHARS] + "…" for s in snippets]
+        self.count, self.nnz = count, nnz
+
+    def add(self, text, snippet, turn=-1):
+        self.extend([text], [snippet], [turn])
+
+    def search(self, query, k=MEMORY_TOP_K, before_turn=None):
+        """Up to k snippets most similar to query, best first.
+
+        Turns from `before_turn` on are skipped, since the caller already has
+        the recent ones verbatim.
+        """
+        if self.count == 0:
+            return []
+        # Cosine similarity of every entry at once: gather the query at each pair's column, sum per entry
+        pairs = embed(query)[self.cols[:self.nnz]] * self.values[:self.nnz]
+        scores = np.add.reduceat(pairs, self.starts[:self.count])
+        if before_turn is not None:
+            scores[self.turns[:self.count] >= before_turn] = -1.0
+        k = min(k, self.count)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [self.snippets[i] for i in top if scores[i] >= MIN_SIMILARITY]
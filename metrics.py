@@ -0,0 +1,311 @@
+# Hot-path metrics and tracing
+#
+# Small in-process registry of counters, histograms and gauges, exported in
+# the Prometheus text format from a local HTTP endpoint (METRICS_PORT). When
+# THERABOT_TRACE_LOG is set, every handled message also writes one JSON line
+# with the timed spans (LLM calls, Discord requests, ...) it went through;
+# a background thread does the writing, so the event loop never waits on it.
+
+import os
+import json
+import time
+import queue
+import asyncio
+import logging
+import threading
+import contextvars
+
+logger = logging.getLogger("discord")
+
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = os.getenv("METRICS_PORT", "9108")  # empty disables the endpoint
+TRACE_LOG = os.getenv("THERABOT_TRACE_LOG", "")  # path of the JSONL trace log; empty disables it
+
+# Seconds; LLM and Discord calls land in the upper half, state lookups in the lower
+BUCKETS = (0.00001, 0.0001, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"') for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+class Counter:
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self.values = {}  # label key -> count
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        lines += [f"{self.name}{_format_labels(key)} {value}" for key, value in self.values.items()]
+        return lines
+
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+
+
+class Histogram:
+    def __init__(self, name, help, buckets=BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self.series = {}  # label key -> [bucket counts..., sum, count]
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        series = self.series.get(key)
+        if series is None:
+            series = self.series[key] = [0] * (len(self.buckets) + 2)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[i] += 1
+                break
+        series[-2] += value
+        series[-1] += 1
+
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.span(self.name, value, labels)
+
+    def time(self, **labels):
+        """Context manager that observes the time spent inside it."""
+        return _Timer(self, labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, series in self.series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(key, [('le', bound)])} {cumulative}")
+            lines.append(f"{self.name}_bucket{_format_labels(key, [('le', '+Inf')])} {series[-1]}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {series[-2]}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {series[-1]}")
+        return lines
+
+
+class Gauge:
+    """Value read at scrape time from `read()`: a number, or a dict of label dict items -> number."""
+
+    def __init__(self, name, help, read):
+        self.name = name
+        self.help = help
+        self.read = read
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        try:
+            value = self.read()
+        except Exception as e:
+            logger.warning(f"Reading gauge {self.name} failed: {e!r}")
+            return lines
+        if isinstance(value, dict):
+            lines += [f"{self.name}{_format_labels(key)} {v}" for key, v in value.items()]
+        else:
+            lines.append(f"{self.name} {value}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+
+    def counter(self, name, help):
+        return self.metrics.setdefault(name, Counter(name, help))
+
+    def histogram(self, name, help, buckets=BUCKETS):
+        return self.metrics.setdefault(name, Histogram(name, help, buckets))
+
+    def gauge(self, name, help, read):
+        # Re-registering replaces the reader, e.g. when a new bot instance is built
+        self.metrics[name] = Gauge(name, help, read)
+        return self.metrics[name]
+
+    def render(self):
+        lines = []
+        for metric in self.metrics.values():
+            lines += metric.render()
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+ONBOARDING_SECONDS = REGISTRY.histogram("therabot_onboarding_step_seconds", "Time to handle one onboarding step")
+LLM_SECONDS = REGISTRY.histogram("therabot_llm_call_seconds", "LLM call latency including queueing and retries")
+LLM_ERRORS = REGISTRY.counter("therabot_llm_errors_total", "LLM calls that failed after retries")
+LLM_RETRIES = REGISTRY.counter("therabot_llm_retries_total", "LLM call attempts that were retried")
+LLM_SHED = REGISTRY.counter("therabot_llm_shed_total", "LLM calls refused under overload instead of queued")
+LLM_HEDGES = REGISTRY.counter("therabot_llm_hedges_total", "Second requests sent to a fallback model for slow calls")
+LLM_HEDGE_WINS = REGISTRY.counter("therabot_llm_hedge_wins_total", "Hedged calls, by the model that answered first")
+LLM_TOKENS = REGISTRY.counter("therabot_llm_tokens_total", "Tokens reported by the API")
+LLM_COST = REGISTRY.counter("therabot_llm_cost_usd_total", "Estimated LLM spend from reported tokens and MODEL_PRICES")
+LLM_DOWNGRADES = REGISTRY.counter("therabot_llm_downgrades_total", "Calls moved to a cheaper model by a token budget")
+LLM_BATCH_SIZE = REGISTRY.histogram("therabot_llm_batch_size", "Requests sent together in one batched LLM call",
+                                    buckets=(1, 2, 4, 8, 16, 32))
+LLM_BATCH_FALLBACKS = REGISTRY.counter("therabot_llm_batch_fallbacks_total",
+                                       "Batched items retried as single calls after an unusable batch answer")
+INTERACTIONS = REGISTRY.counter("therabot_interactions_total", "Button clicks handled, by outcome")
+INTERACTION_SECONDS = REGISTRY.histogram("therabot_interaction_seconds",
+                                         "Click to acknowledgement (ack) and to the answer (answer)")
+DISCORD_SECONDS = REGISTRY.histogram("therabot_discord_request_seconds", "Discord REST request latency")
+CRISIS_MATCHES = REGISTRY.counter("therabot_crisis_matches_total", "Messages that matched crisis phrases")
+SHARD_FORWARDS = REGISTRY.counter("therabot_shard_forwards_total", "Messages relayed to the worker that owns their author")
+STATE_SECONDS = REGISTRY.histogram("therabot_state_lookup_seconds", "Time to look up a user's profile and state")
+MESSAGE_SECONDS = REGISTRY.histogram("therabot_message_seconds", "Time to handle one message, by outcome")
+LOOP_LAG_SECONDS = REGISTRY.histogram("therabot_event_loop_lag_seconds", "How late a periodic loop wakeup fired")
+
+
+def record_usage(kind, model, usage):
+    """Add a response's token usage to the counters; usage may be None."""
+    if usage is None:
+        return
+    LLM_TOKENS.inc(usage.prompt_tokens or 0, kind=kind, model=model, direction="prompt")
+    LLM_TOKENS.inc(usage.completion_tokens or 0, kind=kind, model=model, direction="completion")
+
+
+class Trace:
+    def __init__(self, name, attrs):
+        self.name = name
+        self.attrs = attrs
+        self.started = time.time()
+        self.start = time.perf_counter()
+        self.spans = []
+
+    def span(self, name, seconds, labels):
+        self.spans.append({"name": name, "seconds": round(seconds, 6), **labels})
+
+
+class TraceWriter:
+    """Appends trace records to a JSONL file from its own thread, in batches of whatever has queued up."""
+
+    def __init__(self, path):
+        self.path = path
+        self.queue = queue.SimpleQueue()
+        self.thread = None
+
+    def write(self, record):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, name="trace-writer", daemon=True)
+            self.thread.start()
+        self.queue.put(record)
+
+    def _run(self):
+        with open(self.path, "a") as f:
+            while True:
+                records = [self.queue.get()]
+                while not self.queue.empty():
+                    records.append(self.queue.get())
+                f.writelines(json.dumps(record) + "\n" for record in records if record is not None)
+                f.flush()
+                if None in records:
+                    return
+
+    def close(self):
+        """Write out what's queued and stop the thread."""
+        if self.thread is not None:
+            self.queue.put(None)
+            self.thread.join()
+            self.thread = None
+
+
+TRACE_WRITER = TraceWriter(TRACE_LOG) if TRACE_LOG else None
+
+
+class trace:
+    """Collect the spans observed inside this block into one trace log line.
+
+    Spans from tasks started inside the block land in the same trace, since
+    asyncio copies the context into new tasks.
+    """
+
+    def __init__(self, name, **attrs):
+        self.name = name
+        self.attrs = attrs
+
+    def __enter__(self):
+        if not TRACE_LOG:
+            self.token = None
+            return None
+        self.trace = Trace(self.name, self.attrs)
+        self.token = _current_trace.set(self.trace)
+        return self.trace
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.token is None:
+            return
+        _current_trace.reset(self.token)
+        record = {
+            "trace": self.name,
+            "at": self.trace.started,
+            "seconds": round(time.perf_counter() - self.trace.start, 6),
+            "error": exc_type.__name__ if exc_type else None,
+            **self.attrs,
+            "spans": list(self.trace.spans),  # tasks started in the block may still add spans
+        }
+        TRACE_WRITER.write(record)
+
+
+async def monitor_loop_lag(interval=0.25):
+    """Record how late each wakeup is; a blocked event loop shows up as lag."""
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        LOOP_LAG_SECONDS.observe(max(0.0, loop.time() - start - interval))
+
+
+async def _serve_metrics(reader, writer):
+    try:
+        request_line = await reader.readline()
+        while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+            pass
+        path = request_line.split()[1] if len(request_line.split()) > 1 else b"/"
+        if path == b"/metrics":
+            status, body = "200 OK", REGISTRY.render().encode()
+        else:
+            status, body = "404 Not Found", b"try /metrics\n"
+        writer.write(f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4\r\n"
+                     f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body)
+        await writer.drain()
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+async def start_metrics_server(host=METRICS_HOST, port=METRICS_PORT):
+    """Serve GET /metrics; returns the server, or None if METRICS_PORT is empty or the port can't be bound."""
+    if not port:
+        return None
+    try:
+        server = await asyncio.start_server(_serve_metrics, host, int(port))
+    except OSError as e:
+        # Metrics are optional; a port another process holds mustn't keep the bot from starting
+        logger.warning(f"Metrics endpoint disabled, can't listen on {host}:{port}: {e}")
+        return None
+    logger.info(f"Metrics available at http://{host}:{port}/metrics")
+    return server
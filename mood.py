@@ -0,0 +1,29 @@
+# Mood labels shared by the LLM prompt, the journal and analytics
+#
+# MOOD_PROMPT asks the LLM for one of MOOD_LABELS, and on_message offers an
+# exercise after one of NEGATIVE_MOODS. FEELING_WORDS are the words people use
+# to name each mood; onboarding uses them to tell "Stressed" from a name.
+
+# Same labels, same order as MOOD_PROMPT
+MOOD_LABELS = ["Happy", "Sad", "Stressed", "Anxious", "Frustrated", "Angry", "Calm", "Excited", "Neutral"]
+# Moods after which on_message offers an exercise
+NEGATIVE_MOODS = ["Sad", "Stressed", "Anxious", "Frustrated", "Angry"]
+
+# label -> single words that name the feeling
+FEELING_WORDS = {
+    "Happy": ("happy", "glad", "great", "amazing", "wonderful", "awesome", "joy", "joyful", "grateful",
+              "thankful", "good", "proud", "fantastic", "delighted", "cheerful"),
+    "Sad": ("sad", "unhappy", "depressed", "down", "lonely", "alone", "crying", "hurt", "heartbroken", "grieving",
+            "hopeless", "empty", "miserable", "upset", "lost", "worthless", "bad", "awful", "terrible", "blue",
+            "disappointed"),
+    "Stressed": ("stressed", "stress", "overwhelmed", "busy", "exhausted", "tired", "burnout", "swamped",
+                 "overworked", "drained"),
+    "Anxious": ("anxious", "anxiety", "nervous", "worried", "scared", "afraid", "panicking", "uneasy", "restless",
+                "overthinking", "terrified", "tense", "insecure"),
+    "Frustrated": ("frustrated", "annoyed", "irritated", "stuck", "ugh", "useless"),
+    "Angry": ("angry", "mad", "furious", "pissed", "livid", "outraged", "resentful", "betrayed"),
+    "Calm": ("calm", "relaxed", "peaceful", "content", "chill", "serene", "rested", "okay", "fine", "balanced",
+             "grounded", "relieved"),
+    "Excited": ("excited", "thrilled", "stoked", "pumped", "hyped", "ecstatic", "eager"),
+    "Neutral": ("normal", "meh", "alright", "ok", "whatever"),
+}
@@ -0,0 +1,277 @@
+# Memory-bounded store for per-user state
+#
+# Everything UserManager keeps about a user (profile, state, mood journal,
+# transcript, onboarding stage, and the caches built from them) lives in one
+# slotted Session instead of being spread over half a dozen dicts. Sessions
+# idle for SESSION_IDLE_TTL, or the least recently used ones once more than
+# SESSION_MAX_LIVE are in memory, are spilled: their data is serialized and
+# zlib-compressed into a cold tier and their caches dropped. The next access
+# rehydrates them transparently, so memory follows the number of active users
+# instead of everyone who ever said hi.
+#
+# With a durable storage backend nothing is loaded up front: a user the store
+# doesn't hold is looked up in storage on first access, and the cold tier is
+# only a cache of the SESSION_MAX_COLD most recently spilled sessions, since
+# storage already has everything in them. The one thing storage doesn't have
+# is an unfinished onboarding, which starts over if its session is dropped.
+# Handlers call preload() first, so the lookup runs off the event loop, and
+# users storage doesn't have (yet) are remembered so new users don't cost a
+# lookup on every message until they've onboarded.
+#
+# UserManager exposes dict-like views over the store (user_profiles,
+# user_states, ...), so callers read and write them exactly as before.
+
+import os
+import json
+import time
+import zlib
+import asyncio
+from collections import OrderedDict
+from collections.abc import MutableMapping
+
+from storage import StorageUnavailable
+
+SESSION_MAX_LIVE = int(os.getenv("SESSION_MAX_LIVE", "5000"))  # sessions kept uncompressed
+SESSION_IDLE_TTL = float(os.getenv("SESSION_IDLE_TTL", "1800"))  # seconds before an idle session is spilled
+SESSION_MAX_COLD = int(os.getenv("SESSION_MAX_COLD", "50000"))  # spilled sessions cached with durable storage
+SESSION_MAX_MISSING = 10000  # users remembered as not in storage
+SESSION_LOAD_TIMEOUT = float(os.getenv("SESSION_LOAD_TIMEOUT", "5.0"))  # seconds preload() waits on storage
+SESSION_MIN_IDLE = 60.0  # never spill a session used more recently than this; a handler may still hold it
+EVICT_BATCH = 16  # most sessions spilled per access, so one access never pays for a big backlog
+COMPRESS_LEVEL = 6
+
+# Fields written to the cold tier, in serialized order; the rest are caches rebuilt on demand
+PERSISTED = ("profile", "state", "journal", "turns", "stage", "summary")
+FLAGS = {name: 1 << i for i, name in enumerate(PERSISTED)}
+
+
+class Session:
+    """One user's data; a field is None when the user has none of it."""
+
+    __slots__ = PERSISTED + ("context", "memory", "journal_index", "prefetch", "last_seen")
+
+    def __init__(self, profile=None, state=None, journal=None, turns=None, stage=None, summary=None):
+        self.profile = profile  # name, age, location
+        self.state = state  # message count, awaiting_* flags
+        self.journal = journal  # mood entries
+        self.turns = turns  # [(user_msg, bot_msg)]
+        self.stage = stage  # onboarding stage while onboarding
+        self.summary = summary  # (rolling summary, turns it covers) saved from a spilled context
+        self.context = None  # ConversationContext
+        self.memory = None  # MemoryIndex
+        self.journal_index = None  # JournalIndex
+        self.prefetch = None  # (context version, journal analysis task)
+        self.last_seen = 0.0
+
+    def busy(self):
+        """True while background work (a summary fold, a journal prefetch) still points at this session."""
+        if self.prefetch is not None and not self.prefetch[1].done():
+            return True
+        return self.context is not None and self.context.busy
+
+
+class SessionStore:
+    def __init__(self, storage=None, max_live=SESSION_MAX_LIVE, max_cold=SESSION_MAX_COLD,
+                 idle_ttl=SESSION_IDLE_TTL, min_idle=SESSION_MIN_IDLE, clock=time.monotonic):
+        # Only a durable backend can give back what the store lets go of
+        self.storage = storage if getattr(storage, "durable", False) else None
+        self.max_live = max_live
+        self.max_cold = max_cold
+        self.idle_ttl = idle_ttl
+        self.min_idle = min_idle
+        self.clock = clock
+        self.live = OrderedDict()  # user_id -> Session, least recently used first
+        self.cold = OrderedDict()  # user_id -> (FLAGS of the fields present, compressed JSON), oldest spill first
+        self.cold_bytes = 0
+        self.missing = OrderedDict()  # user_id -> None for users storage doesn't have, oldest first
+        self.spills = 0
+        self.rehydrations = 0
+        self.loads = 0
+        self.drops = 0
+
+    def get(self, user_id, create=False):
+        """The user's session, rehydrated or loaded from storage if need be; None if there is none and not `create`."""
+        now = self.clock()
+        session = self.live.get(user_id)
+        if session is not None:
+            self.live.move_to_end(user_id)
+        else:
+            frozen = self.cold.pop(user_id, None)
+            if frozen is not None:
+                self.cold_bytes -= len(frozen[1])
+                session = self._thaw(frozen[1])
+                self.rehydrations += 1
+            elif self.storage is not None and user_id not in self.missing and (
+                    session := self._found(user_id, self.storage.load_user(user_id))) is not None:
+                self.loads += 1
+            elif create:
+                self.missing.pop(user_id, None)
+                session = Session()
+            else:
+                return None
+            self.live[user_id] = session
+        session.last_seen = now
+        self._evict(now)
+        return session
+
+    def has(self, user_id, field):
+        """Whether the user has `field`, without rehydrating them."""
+        session = self.live.get(user_id)
+        if session is not None:
+            return getattr(session, field) is not None
+        frozen = self.cold.get(user_id)
+        if frozen is not None:
+            return bool(frozen[0] & FLAGS.get(field, 0))
+        if self.storage is None or user_id in self.missing:
+            return False
+        session = self.get(user_id)  # they're about to be used anyway
+        return session is not None and getattr(session, field) is not None
+
+    async def preload(self, user_id, timeout=SESSION_LOAD_TIMEOUT):
+        """Look a user the store doesn't hold up in storage on a thread; raises StorageUnavailable if that fails.
+
+        Without it the first access to them would block the event loop on the lookup.
+        """
+        if self.storage is None or user_id in self.live or user_id in self.cold or user_id in self.missing:
+            return
+        try:
+            data = await asyncio.wait_for(asyncio.to_thread(self.storage.load_user, user_id), timeout)
+        except TimeoutError:
+            raise StorageUnavailable(f"Looking up user {user_id} took over {timeout}s") from None
+        if user_id in self.live or user_id in self.cold:
+            return  # created meanwhile; what's in memory is newer
+        session = self._found(user_id, data)
+        if session is not None:
+            self.loads += 1
+            session.last_seen = self.clock()
+            self.live[user_id] = session
+            self._evict(session.last_seen)
+
+    def ids(self, field):
+        """Ids of the users in memory that have `field`."""
+        yield from [uid for uid, session in self.live.items() if getattr(session, field) is not None]
+        flag = FLAGS.get(field, 0)
+        yield from [uid for uid, (flags, _) in self.cold.items() if flags & flag]
+
+    def field(self, name):
+        return SessionField(self, name)
+
+    def spill_idle(self):
+        """Spill everything past its idle time now rather than on the next access."""
+        while self._evict(self.clock()):
+            pass
+
+    def stats(self):
+        return {"live": len(self.live), "cold": len(self.cold), "cold_bytes": self.cold_bytes,
+                "spills": self.spills, "rehydrations": self.rehydrations, "loads": self.loads, "drops": self.drops,
+                "missing": len(self.missing)}
+
+    def _evict(self, now):
+        """Spill up to EVICT_BATCH sessions from the LRU end; returns how many went."""
+        spilled = 0
+        for _ in range(EVICT_BATCH):
+            if not self.live:
+                break
+            user_id, session = next(iter(self.live.items()))
+            idle = now - session.last_seen
+            if idle < self.min_idle or (idle < self.idle_ttl and len(self.live) <= self.max_live):
+                break
+            if session.busy():
+                self.live.move_to_end(user_id)
+                continue
+            del self.live[user_id]
+            context = session.context
+            if context is not None and context.summary and session.summary != (context.summary, context.covered):
+                # Keep the rolling summary, so rehydrating doesn't fold the whole history again
+                session.summary = (context.summary, context.covered)
+                if self.storage is not None:
+                    self.storage.put_summary(user_id, *session.summary)
+            self._freeze(user_id, session)
+            self.spills += 1
+            spilled += 1
+        return spilled
+
+    def _freeze(self, user_id, session):
+        values = [getattr(session, name) for name in PERSISTED]
+        flags = sum(FLAGS[name] for name, value in zip(PERSISTED, values) if value is not None)
+        data = zlib.compress(json.dumps(values, separators=(",", ":")).encode(), COMPRESS_LEVEL)
+        self.cold[user_id] = (flags, data)
+        self.cold_bytes += len(data)
+        if self.storage is not None:
+            while len(self.cold) > self.max_cold:
+                _, (_, dropped) = self.cold.popitem(last=False)
+                self.cold_bytes -= len(dropped)
+                self.drops += 1
+
+    def _found(self, user_id, data):
+        """The session for what load_user returned; None, remembered, if storage has nothing on them."""
+        profile, state, journal, turns, summary = data
+        if profile is None and state is None and journal is None and turns is None:
+            self.missing[user_id] = None
+            if len(self.missing) > SESSION_MAX_MISSING:
+                self.missing.popitem(last=False)
+            return None
+        return self._session(profile, state, journal, turns, None, summary)
+
+    @classmethod
+    def _thaw(cls, data):
+        return cls._session(*json.loads(zlib.decompress(data)))
+
+    @staticmethod
+    def _session(profile, state, journal, turns, stage, summary):
+        # JSON and SQLite hand back lists and rows where the session keeps tuples
+        if turns is not None:
+            turns = [tuple(turn) for turn in turns]
+        return Session(profile, state, journal, turns, stage, tuple(summary) if summary else None)
+
+
+class SessionField(MutableMapping):
+    """Dict-like view of one Session field across users; a missing key is a None field."""
+
+    def __init__(self, store, name):
+        self.store = store
+        self.name = name
+
+    def _read(self, session):
+        return getattr(session, self.name)
+
+    def _write(self, session, value):
+        setattr(session, self.name, value)
+
+    def __getitem__(self, user_id):
+        session = self.store.get(user_id)
+        value = None if session is None else self._read(session)
+        if value is None:
+            raise KeyError(user_id)
+        return value
+
+    def __setitem__(self, user_id, value):
+        self._write(self.store.get(user_id, create=True), value)
+
+    def __delitem__(self, user_id):
+        session = self.store.get(user_id)
+        if session is None or getattr(session, self.name) is None:
+            raise KeyError(user_id)
+        setattr(session, self.name, None)
+
+    def __contains__(self, user_id):
+        return self.store.has(user_id, self.name)
+
+    def __iter__(self):
+        return self.store.ids(self.name)
+
+    def __len__(self):
+        return sum(1 for _ in self.store.ids(self.name))
+
+
+class ConversationField(SessionField):
+    """user_conversations keeps its {"conversation": [...]} shape on top of Session.turns."""
+
+    def __init__(self, store):
+        super().__init__(store, "turns")
+
+    def _read(self, session):
+        return None if session.turns is None else {"conversation": session.turns}
+
+    def _write(self, session, value):
+        session.turns = value["conversation"]
@@ -0,0 +1,393 @@
+# Shared user state for sharded deployments
+#
+# With THERABOT_WORKERS > 1, bot.py runs the Discord shards in several worker
+# processes. Every user has one owner worker (rendezvous hashing on the user
+# id), which alone holds that user's session in memory, so per-user state
+# needs no cross-process locking. A message that arrives on another worker's
+# shard (all DMs arrive on shard 0, for one) is relayed to the owner, and a
+# worker that needs something only the owner has (a !logs page for a button
+# click) asks it with ShardRouter.call.
+#
+# The launcher process runs a StateServer on a Unix socket. It owns the real
+# storage backend (one SQLite writer for the whole deployment), looks users
+# up for the worker that owns them when it first needs them, applies the
+# mutations workers send it through RemoteStorage, and relays messages between
+# workers for ShardRouter.
+# Frames are one JSON object per line.
+
+import os
+import json
+import time
+import socket
+import asyncio
+import hashlib
+import logging
+
+import metrics
+from storage import BufferedStorage, StorageUnavailable
+
+logger = logging.getLogger("discord")
+
+STATE_SOCKET = os.getenv("THERABOT_STATE_SOCKET", "therabot-state.sock")
+STREAM_LIMIT = 64 * 1024 * 1024  # largest frame; a user lookup with a long history is one frame
+WRITE_OPS = {"clear_turns", "put_profile", "put_state", "append_mood", "append_turn", "put_summary"}
+CALL_TIMEOUT = float(os.getenv("THERABOT_CALL_TIMEOUT", "2.0"))  # seconds; within Discord's interaction deadline
+RECONNECT_ATTEMPTS = 5  # before a worker that lost the state server gives up
+RECONNECT_DELAY = 0.5  # seconds before the first attempt, doubling after each
+
+
+def owner(user_id, workers):
+    """Index of the worker that owns user_id.
+
+    Rendezvous hashing: each worker scores the user and the highest score
+    wins, so going from N to N+1 workers only moves the users the new worker
+    now wins, about 1/(N+1) of them.
+    """
+    if workers == 1:
+        return 0
+    scores = [hashlib.blake2b(f"{worker}:{user_id}".encode(), digest_size=8).digest() for worker in range(workers)]
+    return max(range(workers), key=scores.__getitem__)
+
+
+def _frame(obj):
+    return json.dumps(obj, separators=(",", ":")).encode() + b"\n"
+
+
+class StateServer:
+    def __init__(self, storage, workers, path=STATE_SOCKET):
+        self.storage = storage
+        self.workers = workers
+        self.path = path
+        self.routes = {}  # worker index -> writer of its router connection
+        self.server = None
+        self.relayed = 0
+
+    async def start(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)  # left over from a run that didn't shut down cleanly
+        self.server = await asyncio.start_unix_server(self._serve, self.path, limit=STREAM_LIMIT)
+        logger.info(f"State server listening on {self.path} for {self.workers} workers")
+        return self
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        for writer in self.routes.values():
+            writer.close()
+        self.storage.close()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+    async def _serve(self, reader, writer):
+        worker = None
+        try:
+            while line := await reader.readline():
+                try:
+                    frame = json.loads(line)
+                    if frame["op"] == "route":
+                        worker = frame["worker"]
+                        self.routes[worker] = writer
+                    else:
+                        await self._handle(frame, writer)
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    raise
+                except Exception:
+                    # One bad frame or failed write mustn't cost the worker its connection
+                    logger.exception(f"State server couldn't handle a frame from worker {worker}: {line[:200]!r}")
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            if worker is not None and self.routes.get(worker) is writer:
+                del self.routes[worker]
+            writer.close()
+
+    async def _handle(self, frame, writer):
+        op = frame["op"]
+        if op == "write":
+            for name, *args in frame["ops"]:
+                if name in WRITE_OPS:
+                    getattr(self.storage, name)(*args)
+        elif op == "forward":
+            target = self.routes.get(frame["to"])
+            if target is None:
+                logger.warning(f"Dropping message for worker {frame['to']}: not connected")
+                return
+            try:
+                target.write(_frame({"op": "message", "user": frame.get("user"), "message": frame["message"]}))
+                await target.drain()
+            except ConnectionError as e:  # the target's connection, not the sender's
+                logger.warning(f"Dropping message for worker {frame['to']}: {e!r}")
+                return
+            self.relayed += 1
+        elif op == "load_user":
+            # A flush and a few queries; off the loop, which relays every worker's messages
+            try:
+                reply = {"op": "user", "data": await asyncio.to_thread(self.storage.load_user, frame["user"])}
+            except Exception as e:
+                logger.exception(f"Couldn't look up user {frame['user']}")
+                reply = {"op": "user", "error": repr(e)}  # the worker still gets an answer, in step
+            writer.write(_frame(reply))
+            await writer.drain()
+
+
+class RemoteStorage(BufferedStorage):
+    """Storage backend of a worker process: looks users up and writes through the state server.
+
+    If the connection drops, lookups fail fast with StorageUnavailable and write batches wait in `unsent`
+    while it reconnects on later flushes, backing off like ShardRouter. After RECONNECT_ATTEMPTS failures
+    it gives up and calls `lost()` (on whichever thread noticed).
+    """
+
+    def __init__(self, worker, path=STATE_SOCKET, lost=None, **kwargs):
+        self.worker = worker
+        self.path = path
+        self.lost = lost
+        self.sock = self.file = None
+        self.unsent = []  # write frames not sent yet, oldest first
+        self.failures = 0  # reconnect attempts since the connection went
+        self.retry_at = 0.0
+        self.gone = False  # gave up reconnecting
+        self._connect()
+        super().__init__(**kwargs)
+
+    def _connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(CALL_TIMEOUT)  # a state server that stops answering fails lookups instead of hanging them
+        try:
+            sock.connect(self.path)
+        except OSError:
+            sock.close()
+            raise
+        self.sock, self.file = sock, sock.makefile("rwb")
+
+    def _disconnect(self, error):
+        # A late answer would be read as the next lookup's, so a connection that failed once is done
+        logger.error(f"Worker {self.worker} lost its storage connection to the state server: {error!r}")
+        self._close()
+        self.retry_at = time.monotonic() + RECONNECT_DELAY
+
+    def _reconnect(self):
+        """Try again if it's time to; raises StorageUnavailable while there's no connection."""
+        if self.file is not None:
+            return
+        if self.gone or time.monotonic() < self.retry_at:
+            raise StorageUnavailable("No connection to the state server")
+        try:
+            self._connect()
+        except OSError as e:
+            self.failures += 1
+            logger.warning(f"Worker {self.worker} storage reconnect attempt {self.failures} failed: {e!r}")
+            if self.failures >= RECONNECT_ATTEMPTS:
+                self.gone = True
+                logger.critical(f"Worker {self.worker} couldn't reach the state server again, "
+                                f"holding {len(self.unsent)} unsent write batches")
+                if self.lost is not None:
+                    self.lost()
+            self.retry_at = time.monotonic() + RECONNECT_DELAY * 2 ** self.failures
+            raise StorageUnavailable(f"Couldn't reconnect to the state server: {e!r}") from e
+        self.failures = 0
+        logger.info(f"Worker {self.worker} reconnected its storage to the state server")
+
+    def load_user(self, user_id):
+        """(profile, state, journal, turns, (summary, covered)) of one user; None for what they don't have."""
+        with self._flush_lock:  # our buffered writes go out first, and the writer thread stays off the socket
+            self._flush()
+            if self.unsent:
+                raise StorageUnavailable("Earlier writes are still waiting for the state server")
+            self._reconnect()
+            try:
+                self.file.write(_frame({"op": "load_user", "user": user_id}))
+                self.file.flush()
+                line = self.file.readline()
+                if not line:
+                    raise ConnectionError("connection closed")
+            except OSError as e:  # ConnectionError and the socket timeout included
+                self._disconnect(e)
+                raise StorageUnavailable(f"State server didn't look up user {user_id}: {e!r}") from e
+            reply = json.loads(line)
+            if "error" in reply:
+                raise StorageUnavailable(f"State server couldn't look up user {user_id}: {reply['error']}")
+            return reply["data"]
+
+    def _write(self, profiles, states, moods, turns, summaries, cleared):
+        ops = ([["clear_turns", uid] for uid in cleared]
+               + [["put_profile", uid, p] for uid, p in profiles.items()]
+               + [["put_state", uid, st] for uid, st in states.items()]
+               + [["append_mood", uid, entry] for uid, entry in moods]
+               + [["append_turn", *turn] for turn in turns]
+               + [["put_summary", uid, *summary] for uid, summary in summaries.items()])
+        self.unsent.append(_frame({"op": "write", "ops": ops}))
+
+    def _flush(self):
+        super()._flush()
+        if not self.unsent:
+            return
+        try:
+            self._reconnect()
+            while self.unsent:
+                self.file.write(self.unsent[0])
+                self.file.flush()
+                del self.unsent[0]
+        except StorageUnavailable:
+            pass  # they go out after a reconnect
+        except OSError as e:
+            self._disconnect(e)
+
+    def close(self):
+        super().close()
+        if self.unsent:
+            logger.error(f"Worker {self.worker} stopped with {len(self.unsent)} write batches the state server never got")
+
+    def _close(self):
+        if self.file is not None:
+            try:
+                self.file.close()
+            except OSError:
+                pass  # its buffer was for the connection that broke
+            self.sock.close()
+            self.sock = self.file = None
+
+
+class ShardRouter:
+    """A worker's link for relaying messages to the worker that owns their author.
+
+    `deliver(payload)` is called for every message another worker relays here; for a call(), what it returns
+    goes back to the caller. Calls are answered as they arrive, while messages run in a task per user (in
+    order for that user), so a slow reply or command never holds up the relays behind it. If the state server
+    goes away the router reconnects, and calls `lost()` if it can't.
+    """
+
+    def __init__(self, worker, workers, deliver, path=STATE_SOCKET, lost=None):
+        self.worker = worker
+        self.workers = workers
+        self.deliver = deliver
+        self.lost = lost
+        self.path = path
+        self.writer = None
+        self.task = None
+        self.connected = asyncio.Event()
+        self.forwarded = 0
+        self.received = 0
+        self.reconnects = 0
+        self.calls = {}  # call id -> future for the owner's answer
+        self.next_call = 0
+        self.deliveries = {}  # user id -> task delivering that user's latest relayed message
+
+    async def start(self):
+        reader = await self._connect()
+        self.task = asyncio.create_task(self._run(reader))
+
+    async def _connect(self):
+        reader, self.writer = await asyncio.open_unix_connection(self.path, limit=STREAM_LIMIT)
+        self.writer.write(_frame({"op": "route", "worker": self.worker}))
+        await self.writer.drain()
+        self.connected.set()
+        return reader
+
+    def owns(self, user_id):
+        return owner(user_id, self.workers) == self.worker
+
+    async def forward(self, user_id, payload):
+        """Relay a message payload to the worker that owns user_id."""
+        self.forwarded += 1
+        metrics.SHARD_FORWARDS.inc(worker=self.worker)
+        await self._send(owner(user_id, self.workers), payload, user_id)
+
+    async def call(self, user_id, payload, timeout=CALL_TIMEOUT):
+        """Relay a request to the worker that owns user_id and wait for its answer (None if it failed)."""
+        self.next_call += 1
+        call_id = self.next_call
+        future = self.calls[call_id] = asyncio.get_running_loop().create_future()
+        try:
+            async with asyncio.timeout(timeout):
+                await self.forward(user_id, {**payload, "reply_to": [self.worker, call_id]})
+                return await future
+        finally:
+            del self.calls[call_id]
+
+    async def _send(self, worker, payload, user_id=None):
+        await self.connected.wait()  # while reconnecting
+        self.writer.write(_frame({"op": "forward", "to": worker, "user": user_id, "message": payload}))
+        await self.writer.drain()
+
+    async def _run(self, reader):
+        while True:
+            try:
+                await self._receive(reader)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                pass
+            logger.error(f"Worker {self.worker} lost its connection to the state server, reconnecting")
+            self.connected.clear()
+            self.writer.close()
+            # Their answers went out on the old connection, if at all
+            for future in self.calls.values():
+                if not future.done():
+                    future.set_result(None)
+            reader = await self._reconnect()
+            if reader is None:
+                logger.critical(f"Worker {self.worker} couldn't reach the state server again, stopping")
+                if self.lost is not None:
+                    self.lost()
+                return
+
+    async def _reconnect(self):
+        for attempt in range(RECONNECT_ATTEMPTS):
+            await asyncio.sleep(RECONNECT_DELAY * 2 ** attempt)
+            try:
+                reader = await self._connect()
+            except OSError as e:
+                logger.warning(f"Worker {self.worker} reconnect attempt {attempt + 1} failed: {e!r}")
+                continue
+            self.reconnects += 1
+            logger.info(f"Worker {self.worker} reconnected to the state server")
+            return reader
+        return None
+
+    async def _receive(self, reader):
+        while line := await reader.readline():
+            self.received += 1
+            frame = json.loads(line)
+            payload = frame["message"]
+            if payload.get("kind") == "reply":
+                future = self.calls.get(payload["id"])
+                if future is not None and not future.done():
+                    future.set_result(payload["result"])
+            elif "reply_to" in payload:
+                await self._answer(payload)
+            else:
+                self._queue_delivery(frame.get("user"), payload)
+
+    async def _answer(self, payload):
+        result = None
+        try:
+            result = await self.deliver(payload)
+        except Exception:
+            logger.exception("Failed to answer a relayed call")
+        worker, call_id = payload["reply_to"]
+        await self._send(worker, {"kind": "reply", "id": call_id, "result": result})
+
+    def _queue_delivery(self, user_id, payload):
+        # Chained on the user's previous delivery, so their messages still reach on_message in order
+        previous = self.deliveries.get(user_id)
+        task = asyncio.create_task(self._deliver_after(previous, payload))
+        self.deliveries[user_id] = task
+        task.add_done_callback(lambda t: self.deliveries.get(user_id) is t and self.deliveries.pop(user_id))
+
+    async def _deliver_after(self, previous, payload):
+        if previous is not None:
+            await asyncio.wait([previous])
+        try:
+            await self.deliver(payload)
+        except Exception:
+            logger.exception("Failed to handle a relayed message")
+
+    async def close(self):
+        tasks = list(self.deliveries.values())
+        if self.task is not None:
+            tasks.append(self.task)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if self.writer is not None:
+            self.writer.close()
@@ -0,0 +1,287 @@
+# Durable storage backends for UserManager
+#
+# UserManager keeps recently active users in memory (sessions.SessionStore)
+# so the hot path never touches disk. A durable backend loads a user's data
+# the first time they're needed (load_user) and receives every mutation
+# afterwards. It buffers the mutations and a background writer thread hands
+# them on in periodic batches (write-behind): SQLiteStorage commits them in one
+# transaction, shared_state.RemoteStorage sends them to the state server of a
+# sharded deployment.
+
+import os
+import json
+import sqlite3
+import logging
+import threading
+
+logger = logging.getLogger("discord")
+
+DB_PATH = os.getenv("THERABOT_DB", "therabot.db")
+FLUSH_INTERVAL = float(os.getenv("THERABOT_FLUSH_INTERVAL", "1.0"))  # seconds
+MAX_PENDING = 1000  # flush early once this many mutations are buffered
+
+
+
+class StorageUnavailable(Exception):
+    """The backend couldn't look a user up (in time); nothing was loaded."""
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS profiles (
+    user_id TEXT PRIMARY KEY,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS states (
+    user_id TEXT PRIMARY KEY,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS mood_journal (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    mood TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS mood_journal_user ON mood_journal (user_id, id);
+CREATE TABLE IF NOT EXISTS conversation_turns (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT NOT NULL,
+    user_msg TEXT,
+    bot_msg TEXT
+);
+CREATE INDEX IF NOT EXISTS conversation_turns_user ON conversation_turns (user_id, id);
+CREATE TABLE IF NOT EXISTS summaries (
+    user_id TEXT PRIMARY KEY,
+    summary TEXT NOT NULL,
+    covered INTEGER NOT NULL
+);
+"""
+
+
+class MemoryStorage:
+    """Keeps nothing: state lives only in UserManager's sessions and is lost on restart."""
+
+    durable = False  # so the session store never drops what it holds
+
+    def load(self):
+        return {}, {}, {}, {}
+
+    def load_user(self, user_id):
+        return None, None, None, None, None
+
+    def put_profile(self, user_id, profile):
+        pass
+
+    def put_state(self, user_id, state):
+        pass
+
+    def append_mood(self, user_id, entry):
+        pass
+
+    def append_turn(self, user_id, user_msg, bot_msg):
+        pass
+
+    def put_summary(self, user_id, summary, covered):
+        pass
+
+    def clear_turns(self, user_id):
+        pass
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class BufferedStorage:
+    """Write-behind buffer shared by the durable backends; subclasses implement load_user, _write and _close.
+
+    Mutations are only queued on the calling thread; serialization and I/O
+    happen on the writer thread. Profile and state upserts are coalesced per
+    user, so a user sending ten messages between flushes costs one state row
+    write, not ten.
+    """
+
+    durable = True
+
+    def __init__(self, flush_interval=FLUSH_INTERVAL):
+        self.flush_interval = flush_interval
+
+        self._lock = threading.Lock()  # guards the pending buffers
+        self._flush_lock = threading.Lock()  # held while a batch is on its way, so load_user never overtakes it
+        self._profiles = {}  # user_id -> latest profile snapshot
+        self._states = {}  # user_id -> latest state snapshot
+        self._summaries = {}  # user_id -> latest (summary, turns it covers)
+        self._cleared = set()  # users whose stored conversation and summary go before this batch's turns
+        self._moods = []  # pending journal rows
+        self._turns = []  # pending conversation rows
+        self._pending = 0
+
+        self._wakeup = threading.Event()
+        self._closed = False
+        self._writer = threading.Thread(target=self._run, name="storage-writer", daemon=True)
+        self._writer.start()
+
+    def put_profile(self, user_id, profile):
+        with self._lock:
+            self._profiles[user_id] = dict(profile)
+            self._queued()
+
+    def put_state(self, user_id, state):
+        with self._lock:
+            self._states[user_id] = dict(state)
+            self._queued()
+
+    def append_mood(self, user_id, entry):
+        with self._lock:
+            self._moods.append((user_id, entry))
+            self._queued()
+
+    def append_turn(self, user_id, user_msg, bot_msg):
+        with self._lock:
+            self._turns.append((user_id, user_msg, bot_msg))
+            self._queued()
+
+    def put_summary(self, user_id, summary, covered):
+        with self._lock:
+            self._summaries[user_id] = (summary, covered)
+            self._queued()
+
+    def clear_turns(self, user_id):
+        """Forget the user's conversation and summary; turns appended afterwards are kept."""
+        with self._lock:
+            self._turns = [turn for turn in self._turns if turn[0] != user_id]
+            self._summaries.pop(user_id, None)
+            self._cleared.add(user_id)
+            self._queued()
+
+    def _queued(self):
+        self._pending += 1
+        if self._pending >= MAX_PENDING:
+            self._wakeup.set()
+
+    def flush(self):
+        """Hand every buffered mutation to _write in one batch."""
+        with self._flush_lock:
+            self._flush()
+
+    def _flush(self):
+        # Callers hold _flush_lock
+        with self._lock:
+            if not self._pending:
+                return
+            profiles, self._profiles = self._profiles, {}
+            states, self._states = self._states, {}
+            summaries, self._summaries = self._summaries, {}
+            cleared, self._cleared = self._cleared, set()
+            moods, self._moods = self._moods, []
+            turns, self._turns = self._turns, []
+            self._pending = 0
+        self._write(profiles, states, moods, turns, summaries, cleared)
+
+    def _run(self):
+        while not self._closed:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def close(self):
+        """Stop the writer thread and flush whatever is still buffered."""
+        if self._closed:
+            return
+        self._closed = True
+        self._wakeup.set()
+        self._writer.join()
+        self.flush()
+        self._close()
+
+
+class SQLiteStorage(BufferedStorage):
+    """SQLite (WAL mode) backend; each flush is one transaction."""
+
+    def __init__(self, path=DB_PATH, flush_interval=FLUSH_INTERVAL):
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self._db_lock = threading.Lock()  # serializes use of the connection
+        super().__init__(flush_interval)
+
+    def load(self):
+        """Read everything back as {user_id: ...} dicts of profiles, states, journals and conversations."""
+        with self._db_lock:
+            profiles = {uid: json.loads(data) for uid, data in
+                        self.conn.execute("SELECT user_id, data FROM profiles")}
+            states = {uid: json.loads(data) for uid, data in
+                      self.conn.execute("SELECT user_id, data FROM states")}
+
+            journal = {}
+            for uid, data in self.conn.execute("SELECT user_id, data FROM mood_journal ORDER BY id"):
+                journal.setdefault(uid, []).append(json.loads(data))
+
+            conversations = {uid: {"conversation": []} for uid in profiles}
+            for uid, user_msg, bot_msg in self.conn.execute(
+                    "SELECT user_id, user_msg, bot_msg FROM conversation_turns ORDER BY id"):
+                conversations.setdefault(uid, {"conversation": []})["conversation"].append((user_msg, bot_msg))
+
+        logger.info(f"Loaded {len(profiles)} users from {self.path}")
+        return profiles, states, journal, conversations
+
+    def load_user(self, user_id):
+        """(profile, state, journal, turns, (summary, covered)) of one user; None for what they don't have."""
+        self.flush()  # a user spilled a moment ago may still have writes in the buffer
+        with self._db_lock:
+            row = self.conn.execute("SELECT data FROM profiles WHERE user_id = ?", (user_id,)).fetchone()
+            profile = json.loads(row[0]) if row else None
+            row = self.conn.execute("SELECT data FROM states WHERE user_id = ?", (user_id,)).fetchone()
+            state = json.loads(row[0]) if row else None
+            journal = [json.loads(data) for data, in self.conn.execute(
+                "SELECT data FROM mood_journal WHERE user_id = ? ORDER BY id", (user_id,))]
+            turns = self.conn.execute(
+                "SELECT user_msg, bot_msg FROM conversation_turns WHERE user_id = ? ORDER BY id", (user_id,)).fetchall()
+            summary = self.conn.execute(
+                "SELECT summary, covered FROM summaries WHERE user_id = ?", (user_id,)).fetchone()
+        # Onboarded users always have a (maybe empty) conversation, like load() gives them
+        return profile, state, journal or None, turns if turns or profile is not None else None, summary
+
+    def _write(self, profiles, states, moods, turns, summaries, cleared):
+        with self._db_lock:
+            try:
+                self.conn.execute("BEGIN")
+                self.conn.executemany("DELETE FROM conversation_turns WHERE user_id = ?", [(uid,) for uid in cleared])
+                self.conn.executemany("DELETE FROM summaries WHERE user_id = ?", [(uid,) for uid in cleared])
+                self.conn.executemany(
+                    "INSERT INTO profiles (user_id, data) VALUES (?, ?) "
+                    "ON CONFLICT(user_id) DO UPDATE SET data = excluded.data",
+                    [(uid, json.dumps(p)) for uid, p in profiles.items()])
+                self.conn.executemany(
+                    "INSERT INTO states (user_id, data) VALUES (?, ?) "
+                    "ON CONFLICT(user_id) DO UPDATE SET data = excluded.data",
+                    [(uid, json.dumps(st)) for uid, st in states.items()])
+                self.conn.executemany(
+                    "INSERT INTO mood_journal (user_id, timestamp, mood, data) VALUES (?, ?, ?, ?)",
+                    [(uid, e["timestamp"], e["mood"], json.dumps(e)) for uid, e in moods])
+                self.conn.executemany(
+                    "INSERT INTO conversation_turns (user_id, user_msg, bot_msg) VALUES (?, ?, ?)", turns)
+                self.conn.executemany(
+                    "INSERT INTO summaries (user_id, summary, covered) VALUES (?, ?, ?) "
+                    "ON CONFLICT(user_id) DO UPDATE SET summary = excluded.summary, covered = excluded.covered",
+                    [(uid, summary, covered) for uid, (summary, covered) in summaries.items()])
+                self.conn.execute("COMMIT")
+            except sqlite3.Error as e:
+                self.conn.execute("ROLLBACK")
+                dropped = len(profiles) + len(states) + len(moods) + len(turns) + len(summaries) + len(cleared)
+                logger.error(f"Storage flush failed, dropping {dropped} writes: {e}")
+
+    def _close(self):
+        with self._db_lock:
+            self.conn.close()
+
+
+def open_storage(path=DB_PATH):
+    """Pick a backend from THERABOT_DB; an empty value keeps everything in memory."""
+    if not path:
+        return MemoryStorage()
+    return SQLiteStorage(path)
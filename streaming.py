@@ -0,0 +1,58 @@
+# Progressive Discord replies for streamed LLM output
+#
+# A placeholder reply goes out immediately and is edited as tokens arrive.
+# Edits are coalesced to one per EDIT_INTERVAL so a fast stream doesn't run
+# into Discord's message edit rate limits.
+
+import os
+import asyncio
+import logging
+
+import discord
+
+logger = logging.getLogger("discord")
+
+EDIT_INTERVAL = float(os.getenv("STREAM_EDIT_INTERVAL", "1.2"))  # seconds between edits of one message
+MAX_MESSAGE_LENGTH = 2000  # Discord's per-message limit
+PLACEHOLDER = "💭 ..."
+CURSOR = " ▌"
+ERROR_REPLY = "Sorry, I lost my train of thought 😔 Could you say that again?"
+
+
+async def stream_reply(message: discord.Message, chunks, interval=EDIT_INTERVAL):
+    """Reply to `message` with text from the async iterable `chunks`, editing as it grows.
+
+    Returns the full text once the stream is finished. Text past Discord's
+    2000 character limit continues in a follow-up message.
+    """
+    loop = asyncio.get_running_loop()
+    reply = await message.reply(PLACEHOLDER)
+    text = ""
+    offset = 0  # where the current reply's part of the text starts
+    shown = 0  # how much of the text the current reply displays
+    last_edit = float("-inf")  # so the first token is shown right away
+
+    try:
+        async for chunk in chunks:
+            text = text + chunk if text else chunk  # a lone chunk keeps its type (agent.CannedReply)
+
+            # Close out full messages and continue in a new one
+            while len(text) - offset > MAX_MESSAGE_LENGTH:
+                await reply.edit(content=text[offset:offset + MAX_MESSAGE_LENGTH])
+                offset += MAX_MESSAGE_LENGTH
+                reply = await message.channel.send(PLACEHOLDER)
+                shown = offset
+                last_edit = loop.time()
+
+            if len(text) > shown and loop.time() - last_edit >= interval:
+                await reply.edit(content=text[offset:][:MAX_MESSAGE_LENGTH - len(CURSOR)] + CURSOR)
+                shown = len(text)
+                last_edit = loop.time()
+    except Exception:
+        # Leave whatever made it out, minus the cursor
+        await reply.edit(content=text[offset:] or ERROR_REPLY)
+        raise
+
+    # Final edit drops the cursor
+    await reply.edit(content=text[offset:] or ERROR_REPLY)
+    return text
@@ -0,0 +1,51 @@
+import csv
+import json
+
+import pytest
+
+from agent import UserManager
+from analytics import JournalColumns, export_sqlite
+from storage import SQLiteStorage
+
+MOODS = ["Calm", "Sad", "Happy", "Anxious", "Calm"]
+
+
+@pytest.fixture
+def db(tmp_path):
+    path = str(tmp_path / "therabot.db")
+    storage = SQLiteStorage(path)
+    user_manager = UserManager(storage=storage)
+    for i, mood in enumerate(MOODS):
+        user_manager.log_mood(str(i % 2), mood, f"Entry {i}, with a comma")
+    storage.close()
+    return path
+
+
+def test_export_streams_every_entry_in_chunks(db, tmp_path):
+    jsonl, csv_path = str(tmp_path / "journal.jsonl"), str(tmp_path / "journal.csv")
+    assert export_sqlite(db, jsonl, chunk=2) == len(MOODS)
+    assert export_sqlite(db, csv_path, chunk=2) == len(MOODS)
+
+    with open(jsonl, encoding="utf-8") as f:
+        rows = [json.loads(line) for line in f]
+    with open(csv_path, encoding="utf-8", newline="") as f:
+        assert list(csv.DictReader(f)) == rows
+    assert [row["mood"] for row in rows] == MOODS
+    assert [row["user_id"] for row in rows] == ["0", "1", "0", "1", "0"]
+    assert rows[3]["synthesis"] == "Entry 3, with a comma"
+
+
+def test_parquet_export_writes_a_row_group_per_chunk(db, tmp_path):
+    pq = pytest.importorskip("pyarrow.parquet")
+    path = str(tmp_path / "journal.parquet")
+    export_sqlite(db, path, chunk=2)
+
+    assert pq.ParquetFile(path).num_row_groups == 3
+    assert pq.read_table(path).column("mood").to_pylist() == MOODS
+
+
+def test_summary_columns_leave_the_texts_out(db, tmp_path):
+    columns = JournalColumns.from_sqlite(db, keep_texts=False)
+    assert columns.texts is None and columns.size == len(MOODS)
+    with pytest.raises(ValueError):
+        columns.export(str(tmp_path / "journal.jsonl"))
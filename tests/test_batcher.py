@@ -0,0 +1,98 @@
+import json
+import asyncio
+
+import pytest
+
+from batcher import MicroBatcher, parse_batch
+
+
+def test_parse_batch_matches_results_to_items_by_id():
+    content = json.dumps({"results": [{"id": 2, "mood": "Sad"}, {"mood": "Calm"}, "junk", {"id": 7, "mood": "Happy"},
+                                      {"id": 2, "mood": "Angry"}]})
+    # id 2 first; the id-less entry takes its position; junk, out of range and duplicate ids are ignored
+    assert parse_batch(content, 3) == [None, {"mood": "Calm"}, {"mood": "Sad"}]
+
+
+def test_parse_batch_leaves_items_a_short_answer_skipped_empty():
+    assert parse_batch('{"results": [{"id": 0, "mood": "Calm"}]}', 3) == [{"mood": "Calm"}, None, None]
+
+
+@pytest.mark.parametrize("content", ["not json", '{"mood": "Calm"}', '{"results": {"id": 0}}', "[1, 2]"])
+def test_parse_batch_rejects_responses_that_are_not_batches(content):
+    with pytest.raises((ValueError, KeyError, TypeError)):
+        parse_batch(content, 2)
+
+
+class Calls:
+    """run_batch/run_one for a MicroBatcher; answers each item with its upper-cased self."""
+
+    def __init__(self, answer=None):
+        self.answer = answer or (lambda items: json.dumps({"results": [
+            {"id": i, "text": item.upper()} for i, item in enumerate(items)]}))
+        self.batches = []
+        self.singles = []
+
+    async def run_batch(self, items):
+        self.batches.append(items)
+        return parse_batch(self.answer(items), len(items))
+
+    async def run_one(self, item):
+        self.singles.append(item)
+        return {"text": item.upper()}
+
+
+def batched(calls, items, **kwargs):
+    async def scenario():
+        batcher = MicroBatcher("mood", calls.run_batch, calls.run_one, **kwargs)
+        return await asyncio.gather(*(batcher.submit(item) for item in items))
+
+    return [result["text"] for result in asyncio.run(scenario())]
+
+
+def test_a_full_batch_is_sent_without_waiting():
+    calls = Calls()
+
+    async def scenario():
+        batcher = MicroBatcher("mood", calls.run_batch, calls.run_one, max_size=3, max_wait=60)
+        return await asyncio.wait_for(asyncio.gather(*(batcher.submit(item) for item in "abc")), 1)
+
+    assert [result["text"] for result in asyncio.run(scenario())] == ["A", "B", "C"]
+    assert calls.batches == [["a", "b", "c"]] and not calls.singles
+
+
+def test_a_partial_batch_is_sent_after_the_wait():
+    calls = Calls()
+    assert batched(calls, "ab", max_size=8, max_wait=0.01) == ["A", "B"]
+    assert calls.batches == [["a", "b"]]
+
+
+def test_a_lone_item_is_a_single_call():
+    calls = Calls()
+    assert batched(calls, "a", max_wait=0.01) == ["A"]
+    assert not calls.batches and calls.singles == ["a"]
+
+
+def test_items_a_short_answer_missed_are_retried_singly():
+    calls = Calls(lambda items: '{"results": [{"id": 1, "text": "B"}]}')
+    assert batched(calls, "abc", max_wait=0.01) == ["A", "B", "C"]
+    assert calls.singles == ["a", "c"]
+
+
+def test_a_malformed_answer_falls_back_to_single_calls():
+    calls = Calls(lambda items: '{"results": ')
+    assert batched(calls, "abc", max_wait=0.01) == ["A", "B", "C"]
+    assert len(calls.batches) == 1 and calls.singles == ["a", "b", "c"]
+
+
+def test_api_errors_reach_every_caller():
+    async def run_batch(items):
+        raise ConnectionError("API down")
+
+    async def run_one(item):
+        raise AssertionError("no single calls after an API error")
+
+    async def scenario():
+        batcher = MicroBatcher("mood", run_batch, run_one, max_wait=0.01)
+        return await asyncio.gather(*(batcher.submit(item) for item in "ab"), return_exceptions=True)
+
+    assert [type(result) for result in asyncio.run(scenario())] == [ConnectionError, ConnectionError]
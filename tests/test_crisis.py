@@ -0,0 +1,57 @@
+from crisis import CrisisMatcher, detect
+
+
+def test_crisis_phrases_are_detected():
+    assert detect("honestly i just want to kms") == ("suicide",)
+    assert detect("I feel so suicidal tonight") == ("suicide",)
+    assert detect("I've been cutting again") == ("self_harm",)
+    assert detect("he hits me and I'm afraid to go home") == ("abuse",)
+
+
+def test_distances_are_not_kms():
+    for text in ("I ran 5 kms today", "walked 10 kms, then 2 more kms", "only ten kms to go", "a few kms"):
+        assert detect(text) == ()
+
+
+def test_everyday_words_near_phrases_do_not_match():
+    for text in (
+        "my phone battery is dead",
+        "I'm dying of laughter",
+        "cutting edge research",
+        "killing it at the gym",
+        "this deadline is killing me",
+        "I'd hurt my back",
+    ):
+        assert detect(text) == ()
+
+
+def test_stems_match_whole_word_starts_only():
+    matcher = CrisisMatcher({"suicide": ["suicid*"]})
+    assert matcher.scan("suicidal thoughts") == ("suicide",)
+    assert matcher.scan("antisuicide campaign") == ()
+
+
+def test_negated_suicide_phrases_do_not_match():
+    for text in (
+        "I don't want to die",
+        "i really dont wanna die, i'm just tired",
+        "I do not want to die yet",
+        "I'm not suicidal, just stressed",
+        "I would never kill myself",
+        "I'm not going to end my life over a breakup",
+    ):
+        assert detect(text) == (), text
+
+
+def test_negation_only_cancels_the_phrase_right_after_it():
+    for text in (
+        "I don't know why I want to die",
+        "why not kill myself",
+        "I can't kill myself",
+        "I don't want to live anymore",
+        "I'm not ok, I want to die",
+        "I don't want to die but I'm going to kill myself",
+        "I'm not okay and I'm suicidal",
+    ):
+        assert detect(text) == ("suicide",), text
+    assert detect("I'm not suicidal but I keep cutting myself") == ("self_harm",)
@@ -0,0 +1,83 @@
+from extract import LOCAL_CONFIDENCE, LocalExtractor, parse_age, parse_location, parse_name
+
+
+def test_bare_state_abbreviations_are_locations():
+    assert parse_location("ca") == ("California", 0.95)
+    assert parse_location("NY") == ("New York", 0.95)
+    assert parse_location("i live in tx")[0] == "Texas"
+
+
+def test_state_abbreviations_keep_city_aliases():
+    assert parse_location("la")[0] == "Los Angeles, CA"
+    assert parse_location("dc")[0] == "Washington, DC"
+
+
+def test_ambiguous_state_abbreviations_are_not_locations():
+    for word in ("ok", "in", "me", "hi"):
+        assert parse_location(word) == (None, 0.0)
+
+
+def test_single_lowercase_token_falls_through_to_llm():
+    for text in ("sf", "brb", "mark"):
+        _, confidence = parse_name(text)
+        assert confidence < LOCAL_CONFIDENCE
+    assert LocalExtractor().extract("name", "sf") is None
+    assert parse_name("idk") == (None, 0.0)
+
+
+def test_confident_names_stay_local():
+    assert LocalExtractor().extract("name", "Mark") == "Mark"
+    assert parse_name("my name is sam") == ("Sam", 0.95)
+    assert parse_name("my name is Joy") == ("Joy", 0.95)
+    assert parse_name("It's Sam") == ("Sam", 0.85)
+
+
+def test_filler_after_its_is_not_a_name():
+    for text in ("it's complicated", "its hard", "this is hard"):
+        _, confidence = parse_name(text)
+        assert confidence < LOCAL_CONFIDENCE
+        assert LocalExtractor().extract("name", text) is None
+
+
+def test_moods_are_not_names():
+    for text in ("Depressed", "Stressed out", "anxious", "i'm exhausted", "Joy"):
+        assert parse_name(text) == (None, 0.0)
+
+
+def test_multi_word_answers_without_a_prefix_go_to_the_llm():
+    assert parse_name("Mark Smith") == ("Mark Smith", 0.6)
+    assert parse_name("mark smith") == (None, 0.0)
+    assert parse_name("going to bed") == (None, 0.0)
+
+
+def test_ages_need_age_context():
+    assert parse_age("23") == (23, 0.95)
+    assert parse_age("I'm 23") == (23, 0.95)
+    assert parse_age("23 years old") == (23, 0.95)
+    assert parse_age("turning 30 next week") == (30, 0.85)
+    assert parse_age("twenty one") == (21, 0.9)
+    for text in ("i was born in 99", "100 percent sure", "90%", "30 next month", "i work 40 hours a week"):
+        assert parse_age(text) == (None, 0.0)
+
+
+def test_city_region_needs_a_known_region():
+    assert parse_location("Austin, TX") == ("Austin, TX", 0.9)
+    assert parse_location("portland, oregon") == ("Portland, OR", 0.9)
+    assert parse_location("kyoto, japan") == ("Kyoto, Japan", 0.9)
+    assert parse_location("leeds, uk") == ("Leeds, UK", 0.9)
+    for text in ("nowhere, really", "idk, somewhere", "home, i guess"):
+        assert parse_location(text) == (None, 0.0)
+
+
+def test_interjections_and_refusals_are_not_names():
+    for text in ("Nah", "Pass", "Later", "Bye", "Help", "Maybe", "Sorry", "Stop", "Nope", "Nevermind"):
+        assert parse_name(text) == (None, 0.0)
+        assert LocalExtractor().extract("name", text) is None
+
+
+def test_unfamiliar_bare_words_go_to_the_llm():
+    # Kept as a guess, but only a known first name is trusted without "I'm" or "my name is"
+    assert parse_name("Zephyr") == ("Zephyr", 0.7)
+    assert LocalExtractor().extract("name", "Zephyr") is None
+    assert LocalExtractor().extract("name", "Priya") == "Priya"
+    assert LocalExtractor().extract("name", "I'm Zephyr") == "Zephyr"
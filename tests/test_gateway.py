@@ -0,0 +1,218 @@
+import time
+import asyncio
+
+import pytest
+
+import gateway
+from gateway import LARGE_MODEL, SMALL_MODEL, AdmissionQueue, LLMGateway, Overloaded, TokenBucket
+
+
+def queue(slots=1, **kwargs):
+    return AdmissionQueue(slots, TokenBucket(1000, 1000), **kwargs)
+
+
+def later(seconds=10):
+    """A deadline `seconds` from now on the running loop."""
+    return asyncio.get_running_loop().time() + seconds
+
+
+def test_waiters_are_admitted_by_priority_then_arrival():
+    async def scenario():
+        admission = queue()
+        await admission.acquire("therapy", later())
+        admitted = []
+
+        async def call(kind):
+            await admission.acquire(kind, later())
+            admitted.append(kind)
+            admission.release()
+
+        tasks = [asyncio.create_task(call(kind)) for kind in ("button", "mood", "therapy", "crisis", "extract")]
+        await asyncio.sleep(0)
+        assert not admitted  # all queued behind the held slot
+        admission.release()
+        await asyncio.gather(*tasks)
+        return admitted
+
+    assert asyncio.run(scenario()) == ["crisis", "therapy", "extract", "mood", "button"]
+
+
+def test_a_model_at_its_cap_does_not_hold_up_the_others():
+    async def scenario():
+        admission = queue(slots=4, model_slots=1)
+        await admission.acquire("therapy", later(), LARGE_MODEL)
+        large = asyncio.create_task(admission.acquire("therapy", later(), LARGE_MODEL))
+        small = asyncio.create_task(admission.acquire("mood", later(), SMALL_MODEL))
+        await asyncio.sleep(0)
+        assert small.done() and not large.done()
+        assert admission.free == 2 and admission.model_free[LARGE_MODEL] == 0
+
+        admission.release(model=LARGE_MODEL)
+        await large
+        assert admission.model_free[LARGE_MODEL] == 0
+
+    asyncio.run(scenario())
+
+
+def test_calls_that_cannot_finish_in_time_are_shed():
+    async def scenario():
+        admission = queue()
+        await admission.acquire("therapy", later())
+        admission.expected = 1.0
+        hopeless = asyncio.create_task(admission.acquire("therapy", later(0.5)))
+        fine = asyncio.create_task(admission.acquire("therapy", later()))
+        await asyncio.sleep(0)
+        admission.release()
+        with pytest.raises(Overloaded, match="deadline"):
+            await hopeless
+        await fine  # the slot went to the next waiter instead
+
+    asyncio.run(scenario())
+
+
+def test_waiters_give_up_after_their_priority_max_wait(monkeypatch):
+    monkeypatch.setattr(gateway, "MAX_WAIT", [None, None, None, None, 0.02])
+
+    async def scenario():
+        admission = queue()
+        await admission.acquire("therapy", later())
+        with pytest.raises(Overloaded, match="waited too long"):
+            await admission.acquire("button", later())
+        assert not admission.waiting and admission.queued == [0] * len(gateway.PRIORITY_NAMES)
+
+    asyncio.run(scenario())
+
+
+def test_full_queues_shed_at_once_but_crisis_is_unbounded(monkeypatch):
+    monkeypatch.setattr(gateway, "QUEUE_LIMITS", [None, 1, 1, 1, 1])
+
+    async def scenario():
+        admission = queue()
+        await admission.acquire("therapy", later())
+        waiting = [asyncio.create_task(admission.acquire("button", later()))]
+        await asyncio.sleep(0)
+        with pytest.raises(Overloaded, match="queue_full"):
+            await admission.acquire("button", later())
+        waiting += [asyncio.create_task(admission.acquire("crisis", later())) for _ in range(3)]
+        await asyncio.sleep(0)
+        assert admission.queued[0] == 3
+        for task in waiting:
+            task.cancel()
+        await asyncio.gather(*waiting, return_exceptions=True)
+
+    asyncio.run(scenario())
+
+
+def primed(kind, model, seconds=0.01):
+    llm = LLMGateway(api_key="test")
+    for _ in range(gateway.HEDGE_MIN_SAMPLES):
+        llm.route_stats(kind, model, "complete").observe(seconds)
+    return llm
+
+
+def test_hedge_wins_and_the_slow_call_is_cancelled():
+    llm = primed("therapy", LARGE_MODEL)
+    cancelled = []
+
+    async def attempt(model):
+        if model == SMALL_MODEL:
+            return "fast"
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(model)
+            raise
+
+    async def scenario():
+        return await llm._hedged("therapy", LARGE_MODEL, "complete", attempt)
+
+    assert asyncio.run(scenario()) == (SMALL_MODEL, "fast")
+    assert cancelled == [LARGE_MODEL]
+    assert llm.route_stats("therapy", LARGE_MODEL, "complete").count == gateway.HEDGE_MIN_SAMPLES + 1
+
+
+def test_no_hedge_while_every_slot_is_taken():
+    llm = primed("therapy", LARGE_MODEL)
+    llm.admission.free = 0  # every slot is taken, so a hedge would have to queue
+    models = []
+
+    async def attempt(model):
+        models.append(model)
+        await asyncio.sleep(0.1)
+        return model
+
+    assert asyncio.run(llm._hedged("therapy", LARGE_MODEL, "complete", attempt)) == (LARGE_MODEL, LARGE_MODEL)
+    assert models == [LARGE_MODEL]
+
+
+class StatusError(Exception):
+    def __init__(self, status_code):
+        super().__init__(status_code)
+        self.status_code = status_code
+
+
+class Jitter:
+    """Stands in for the random module; records the backoff ceilings and waits no time."""
+
+    def __init__(self):
+        self.ceilings = []
+
+    def uniform(self, low, high):
+        self.ceilings.append(high)
+        return 0.0
+
+
+def retrying(failures, monkeypatch, timeout=10):
+    jitter = Jitter()
+    monkeypatch.setattr(gateway, "random", jitter)
+    llm = LLMGateway(api_key="test")
+    calls = []
+
+    async def call():
+        calls.append(len(calls))
+        if len(calls) <= len(failures):
+            raise failures[len(calls) - 1]
+        return "ok"
+
+    async def scenario():
+        return await llm._retrying(LARGE_MODEL, "therapy", later(timeout), call)
+
+    return scenario, calls, jitter
+
+
+def test_retries_back_off_exponentially(monkeypatch):
+    scenario, calls, jitter = retrying([StatusError(503), StatusError(429), TimeoutError()], monkeypatch)
+    assert asyncio.run(scenario()) == "ok"
+    assert len(calls) == 4
+    assert jitter.ceilings == [gateway.BACKOFF_BASE * 2 ** i for i in range(3)]
+
+
+def test_retries_stop_at_the_limit_and_on_client_errors(monkeypatch):
+    scenario, calls, _ = retrying([StatusError(503)] * (gateway.MAX_RETRIES + 1), monkeypatch)
+    with pytest.raises(StatusError):
+        asyncio.run(scenario())
+    assert len(calls) == gateway.MAX_RETRIES + 1
+
+    scenario, calls, _ = retrying([StatusError(400)], monkeypatch)
+    with pytest.raises(StatusError):
+        asyncio.run(scenario())
+    assert len(calls) == 1
+
+
+def test_retry_after_is_honoured_unless_it_overruns_the_deadline(monkeypatch):
+    class Response:
+        status_code = 429
+        headers = {"retry-after": "0.05"}
+
+    class RateLimited(Exception):
+        raw_response = Response()
+
+    scenario, calls, _ = retrying([RateLimited()], monkeypatch)
+    start = time.monotonic()
+    assert asyncio.run(scenario()) == "ok"
+    assert time.monotonic() - start >= 0.05
+
+    scenario, calls, _ = retrying([RateLimited()], monkeypatch, timeout=0.01)
+    with pytest.raises(RateLimited):
+        asyncio.run(scenario())
+    assert len(calls) == 1
@@ -0,0 +1,85 @@
+import pytest
+
+from journal import JournalIndex, JournalQuery, render_page
+
+MOODS = ["Calm", "Sad", "Happy"]
+JOURNAL = [{"timestamp": f"2026-01-{day:02d}T09:00:00", "mood": MOODS[day % 3], "synthesis": f"Day {day}."}
+           for day in range(1, 13)]
+
+
+def walk(index, query, limit):
+    """Every page from the newest to the oldest, then back with newer(); both as lists of positions."""
+    older_pages, before = [], None
+    while True:
+        positions, older, _ = index.page(query, before, limit)
+        older_pages.append(positions)
+        if not older:
+            break
+        before = positions[0]
+    newer_pages = [older_pages[-1]]
+    while before is not None:
+        before = index.newer(query, before, limit)
+        newer_pages.append(index.page(query, before, limit)[0])
+    return older_pages, newer_pages[::-1]
+
+
+@pytest.mark.parametrize("query", [JournalQuery(), JournalQuery("Sad"),
+                                   JournalQuery(since="2026-01-03", until="2026-01-11"),
+                                   JournalQuery("Calm", since="2026-01-04")])
+def test_pages_cover_every_match_once_in_both_directions(query):
+    index = JournalIndex(JOURNAL)
+    older_pages, newer_pages = walk(index, query, limit=2)
+    assert older_pages == newer_pages
+
+    matches = [position for position, entry in enumerate(JOURNAL)
+               if (query.mood is None or entry["mood"] == query.mood)
+               and (query.since is None or entry["timestamp"] >= query.since)
+               and (query.until is None or entry["timestamp"] < query.until)]
+    assert sorted(p for page in older_pages for p in page) == matches
+    assert all(0 < len(page) <= 2 for page in older_pages)
+    assert older_pages[0] == matches[-2:]
+
+
+def test_cursor_at_either_end():
+    index = JournalIndex(JOURNAL)
+    query = JournalQuery()
+    assert index.page(query, before=None, limit=5) == ([7, 8, 9, 10, 11], 7, 12)
+    assert index.page(query, before=len(JOURNAL) + 5, limit=5) == ([7, 8, 9, 10, 11], 7, 12)  # clamped
+    assert index.page(query, before=3, limit=5) == ([0, 1, 2], 0, 12)
+    assert index.page(query, before=0, limit=5) == ([], 0, 12)  # nothing older than the first entry
+    assert index.newer(query, before=7, limit=5) is None  # the newest page is before=None
+    assert index.newer(query, before=0, limit=5) == 5
+
+    calm = JournalQuery("Calm")  # positions 2, 5, 8, 11
+    assert index.page(calm, before=2, limit=2) == ([], 0, 4)
+    assert index.page(calm, before=5, limit=2) == ([2], 0, 4)
+    assert index.newer(calm, before=8, limit=2) is None
+    assert index.newer(calm, before=2, limit=2) == 8
+
+
+def test_empty_pages():
+    assert JournalIndex([]).page(JournalQuery()) == ([], 0, 0)
+    index = JournalIndex(JOURNAL)
+    assert index.page(JournalQuery("Angry")) == ([], 0, 0)
+    assert index.page(JournalQuery(since="2026-02-01")) == ([], 0, 0)
+    assert index.page(JournalQuery("Sad", until="2026-01-01")) == ([], 0, 0)
+    assert render_page(index, JournalQuery("Angry"), "header") == (None, None, None)
+
+
+def test_rendered_pages_link_their_neighbours():
+    index = JournalIndex(JOURNAL)
+    query = JournalQuery()
+    newest, older, newer = render_page(index, query, "header")
+    assert older == 7 and newer is None and "8–12 of 12" in newest
+    middle, older, newer = render_page(index, query, "header", before=7)
+    assert older == 2 and newer is None and "3–7 of 12" in middle  # the newer page is the newest
+    oldest, older, newer = render_page(index, query, "header", before=2)
+    assert older is None and newer == 7 and "1–2 of 12" in oldest
+
+
+def test_entries_appended_after_indexing_are_found():
+    journal = list(JOURNAL)
+    index = JournalIndex(journal)
+    assert index.page(JournalQuery("Sad"), limit=10)[2] == 4
+    journal.append({"timestamp": "2026-01-13T09:00:00", "mood": "Sad", "synthesis": "Day 13."})
+    assert index.page(JournalQuery("Sad"), limit=10) == ([0, 3, 6, 9, 12], 0, 5)
@@ -0,0 +1,15 @@
+import asyncio
+
+import metrics
+
+
+def test_taken_metrics_port_is_skipped_not_fatal():
+    async def scenario():
+        first = await metrics.start_metrics_server(port="0")  # any free port
+        port = first.sockets[0].getsockname()[1]
+        try:
+            return await metrics.start_metrics_server(port=port)
+        finally:
+            first.close()
+
+    assert asyncio.run(scenario()) is None
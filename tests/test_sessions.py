@@ -0,0 +1,202 @@
+import time
+import socket
+import asyncio
+
+import pytest
+
+import shared_state
+from agent import UserManager
+from context import ConversationContext
+from sessions import Session, SessionStore
+from storage import SQLiteStorage, StorageUnavailable
+
+TURN = ("word " * 20, "reply " * 20)  # ~50 tokens rendered
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_summary_covers_only_merged_turns():
+    async def scenario():
+        calls = []
+
+        async def summarize(previous, transcript):
+            calls.append(transcript)
+            if len(calls) > 1:
+                raise RuntimeError("LLM down")
+            return "they talked about work"
+
+        context = ConversationContext(summarize, budget=120)
+        for _ in range(3):
+            context.add(*TURN)
+        await asyncio.sleep(0)  # first fold merges
+        folded = context.covered
+        assert folded > 0 and not context.folding
+
+        for _ in range(3):
+            context.add(*TURN)
+        await asyncio.sleep(0)  # second fold fails; its turns stay in folding, not in the summary
+        assert context.folding and context.covered == folded
+        return context
+
+    context = asyncio.run(scenario())
+    clock = Clock()
+    store = SessionStore(idle_ttl=1, min_idle=0, clock=clock)
+    session = store.get("1", create=True)
+    session.turns = [TURN] * 6
+    session.context = context
+    clock.now = 2
+    store.spill_idle()
+
+    assert store.get("1").summary == ("they talked about work", context.covered)
+
+
+def test_users_are_loaded_from_storage_on_first_access(tmp_path):
+    storage = SQLiteStorage(str(tmp_path / "therabot.db"))
+    user_manager = UserManager(storage=storage)
+    user_manager.onboard_user("1", "Alex", 34, "Austin, TX")
+    user_manager.add_to_conversation("1", "hi", "hello")
+    user_manager.log_mood("1", "Calm", "A quiet day.")
+    storage.put_summary("1", "they said hi", 1)
+    storage.close()
+
+    storage = SQLiteStorage(str(tmp_path / "therabot.db"))
+    user_manager = UserManager(storage=storage)
+    assert not user_manager.sessions.live and not user_manager.sessions.cold
+    assert user_manager.is_onboarded("1")
+    assert not user_manager.is_onboarded("2")
+    session = user_manager.sessions.get("1")
+    assert session.turns == [("hi", "hello")]
+    assert session.summary == ("they said hi", 1)
+    assert user_manager.mood_journal["1"][0]["mood"] == "Calm"
+    assert user_manager.sessions.loads == 1
+    storage.close()
+
+
+def test_cold_tier_is_capped_with_durable_storage(tmp_path):
+    storage = SQLiteStorage(str(tmp_path / "therabot.db"))
+    clock = Clock()
+    store = SessionStore(storage, max_cold=2, idle_ttl=1, min_idle=0, clock=clock)
+    for uid in "1234":
+        store.get(uid, create=True).profile = {"name": uid}
+        storage.put_profile(uid, {"name": uid})
+    clock.now = 2
+    store.spill_idle()
+
+    assert list(store.cold) == ["3", "4"] and store.drops == 2
+    assert store.get("1").profile == {"name": "1"}  # dropped, so back from storage
+    assert store.loads == 1
+    storage.close()
+
+
+def test_cold_tier_keeps_everything_without_durable_storage():
+    clock = Clock()
+    store = SessionStore(max_cold=2, idle_ttl=1, min_idle=0, clock=clock)
+    for uid in "1234":
+        store.get(uid, create=True).profile = {"name": uid}
+    clock.now = 2
+    store.spill_idle()
+
+    assert len(store.cold) == 4 and store.drops == 0
+    assert isinstance(store.get("1"), Session)
+
+
+class CountingStorage(SQLiteStorage):
+    def __init__(self, path, delay=0.0):
+        super().__init__(path)
+        self.delay = delay
+        self.lookups = 0
+
+    def load_user(self, user_id):
+        self.lookups += 1
+        time.sleep(self.delay)
+        return super().load_user(user_id)
+
+
+def test_users_not_in_storage_are_looked_up_once(tmp_path):
+    storage = CountingStorage(str(tmp_path / "therabot.db"))
+    user_manager = UserManager(storage=storage)
+    for _ in range(5):
+        assert not user_manager.is_onboarded("1")
+        assert "1" not in user_manager.user_states
+    assert storage.lookups == 1
+
+    user_manager.user_profiles["1"] = {}  # onboarding started
+    assert "1" not in user_manager.sessions.missing
+    assert user_manager.is_onboarded("1")
+    storage.close()
+
+
+def test_preload_looks_users_up_off_the_event_loop(tmp_path):
+    storage = CountingStorage(str(tmp_path / "therabot.db"))
+    storage.put_profile("1", {"name": "Alex"})
+    store = SessionStore(storage)
+
+    async def scenario():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.005)
+                ticks += 1
+
+        storage.delay = 0.1
+        task = asyncio.create_task(ticker())
+        await store.preload("1")
+        await store.preload("2")
+        task.cancel()
+        return ticks
+
+    assert asyncio.run(scenario()) >= 10  # the loop kept running during both lookups
+    assert "1" in store.live and "2" in store.missing
+    assert store.get("1").profile == {"name": "Alex"}
+    assert storage.lookups == 2  # nothing left for get() to look up
+    storage.close()
+
+
+def test_preload_gives_up_on_slow_storage(tmp_path):
+    storage = CountingStorage(str(tmp_path / "therabot.db"), delay=0.5)
+    store = SessionStore(storage)
+    with pytest.raises(StorageUnavailable):
+        asyncio.run(store.preload("1", timeout=0.05))
+    assert "1" not in store.live and "1" not in store.missing
+    storage.close()
+
+
+def test_remote_lookup_fails_when_the_state_server_stops_answering(tmp_path, monkeypatch):
+    monkeypatch.setattr(shared_state, "CALL_TIMEOUT", 0.1)
+    path = str(tmp_path / "state.sock")
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(path)
+    server.listen()
+    storage = shared_state.RemoteStorage(0, path=path)
+    try:
+        with pytest.raises(StorageUnavailable):
+            storage.load_user("1")
+        with pytest.raises(StorageUnavailable):  # the connection is out of step now
+            storage.load_user("1")
+    finally:
+        storage.close()
+        server.close()
+
+
+def test_onboarding_clears_stored_turns(tmp_path):
+    storage = SQLiteStorage(str(tmp_path / "therabot.db"))
+    user_manager = UserManager(storage=storage)
+    user_manager.add_to_conversation("1", "I want to end it all", "Please reach out to 988 💛")
+    storage.put_summary("1", "a crisis", 1)
+    storage.flush()
+    user_manager.onboard_user("1", "Alex", 34, "Austin, TX")
+    user_manager.add_to_conversation("1", "hi", "hello")
+    storage.close()
+
+    storage = SQLiteStorage(str(tmp_path / "therabot.db"))
+    session = SessionStore(storage).get("1")
+    assert session.turns == [("hi", "hello")] and session.summary is None
+    storage.close()
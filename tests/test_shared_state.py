@@ -0,0 +1,88 @@
+import socket
+import asyncio
+
+import pytest
+
+import shared_state
+from shared_state import RemoteStorage, StateServer
+from storage import SQLiteStorage, StorageUnavailable
+
+
+class FlakyStorage(SQLiteStorage):
+    def load_user(self, user_id):
+        if user_id == "broken":
+            raise KeyError(user_id)
+        return super().load_user(user_id)
+
+
+@pytest.fixture
+def paths(tmp_path, monkeypatch):
+    monkeypatch.setattr(shared_state, "RECONNECT_DELAY", 0.01)
+    return str(tmp_path / "state.sock"), str(tmp_path / "therabot.db")
+
+
+def test_bad_frames_and_failed_lookups_keep_the_connection(paths):
+    sock, db = paths
+
+    async def scenario():
+        server = await StateServer(FlakyStorage(db), 2, path=sock).start()
+        storage = await asyncio.to_thread(RemoteStorage, 0, path=sock, flush_interval=60)
+        storage.file.write(b"not json\n{\"op\": \"nonsense\"}\n")
+        storage.put_profile("1", {"name": "Alex"})
+        with pytest.raises(StorageUnavailable):
+            await asyncio.to_thread(storage.load_user, "broken")
+        profile, *_ = await asyncio.to_thread(storage.load_user, "1")
+        await asyncio.to_thread(storage.close)
+        await server.close()
+        return profile
+
+    assert asyncio.run(scenario()) == {"name": "Alex"}
+
+
+def test_storage_reconnects_and_sends_what_it_held_back(paths):
+    sock, db = paths
+
+    async def scenario():
+        server = await StateServer(SQLiteStorage(db), 2, path=sock).start()
+        storage = await asyncio.to_thread(RemoteStorage, 0, path=sock, flush_interval=60)
+        storage.sock.shutdown(socket.SHUT_RDWR)  # the connection drops
+        await asyncio.sleep(0.01)  # the server sees it too
+        await server.close()
+
+        storage.put_profile("1", {"name": "Alex"})
+        await asyncio.to_thread(storage.flush)
+        assert storage.unsent  # nobody to send it to
+        with pytest.raises(StorageUnavailable):
+            await asyncio.to_thread(storage.load_user, "1")
+
+        server = await StateServer(SQLiteStorage(db), 2, path=sock).start()
+        await asyncio.sleep(0.05)  # past the backoff
+        profile, *_ = await asyncio.to_thread(storage.load_user, "1")
+        assert not storage.unsent and storage.failures == 0
+        await asyncio.to_thread(storage.close)
+        await server.close()
+        return profile
+
+    assert asyncio.run(scenario()) == {"name": "Alex"}
+
+
+def test_storage_gives_up_after_repeated_failures(paths, monkeypatch):
+    sock, db = paths
+    monkeypatch.setattr(shared_state, "RECONNECT_DELAY", 0)
+    lost = []
+
+    async def scenario():
+        server = await StateServer(SQLiteStorage(db), 2, path=sock).start()
+        storage = await asyncio.to_thread(RemoteStorage, 0, path=sock, lost=lambda: lost.append(True),
+                                          flush_interval=60)
+        storage.sock.shutdown(socket.SHUT_RDWR)
+        await asyncio.sleep(0.01)
+        await server.close()
+        return storage
+
+    storage = asyncio.run(scenario())
+    for _ in range(shared_state.RECONNECT_ATTEMPTS + 2):
+        with pytest.raises(StorageUnavailable):
+            storage.load_user("1")
+    assert storage.gone and lost == [True]
+    storage.close()
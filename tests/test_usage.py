@@ -0,0 +1,118 @@
+import json
+import asyncio
+import datetime
+from types import SimpleNamespace
+
+import gateway
+from agent import UserManager
+from gateway import LARGE_MODEL, SMALL_MODEL, LLMGateway
+from usage import DOWNGRADE, EXHAUSTED, WITHIN, UsageLedger
+
+
+def usage(prompt, completion):
+    return SimpleNamespace(prompt_tokens=prompt, completion_tokens=completion)
+
+
+class Today:
+    def __init__(self):
+        self.day = datetime.date(2026, 1, 1)
+
+    def __call__(self):
+        return self.day
+
+
+def test_record_splits_a_batch_between_its_users():
+    ledger = UsageLedger({"m": (1.0, 2.0)}, user_budget=0)
+    ledger.record("mood", "m", usage(600, 100))
+    ledger.record("mood", "m", usage(5, 2), ["a", "b", None, "c"])
+    ledger.record("mood", "m", None, "a")  # the API reported no usage
+
+    assert ledger.routes[("mood", "m")] == [2, 605, 102, (605 * 1.0 + 102 * 2.0) / 1e6]
+    assert ledger.spent_today() == (707, (605 + 204) / 1e6)
+    assert [ledger.spent(uid)[0] for uid in "abc"] == [3, 2, 2]
+    assert ledger.spent("a")[1] == ledger.spent("c")[1] == 9 / 3 / 1e6
+
+
+def test_level_moves_from_within_to_downgrade_to_exhausted():
+    ledger = UsageLedger({}, user_budget=100, soft=0.8)
+    assert ledger.level("mood", "a") == WITHIN
+    ledger.record("mood", "m", usage(70, 9), "a")
+    assert ledger.level("mood", "a") == WITHIN
+    ledger.record("mood", "m", usage(1, 0), "a")
+    assert ledger.level("mood", "a") == DOWNGRADE
+    ledger.record("mood", "m", usage(20, 0), "a")
+    assert ledger.level("mood", "a") == EXHAUSTED
+    assert ledger.level("crisis", "a") == WITHIN  # never limited
+    assert ledger.level("mood", ["b", "a"]) == EXHAUSTED
+    assert ledger.level("mood", "b") == ledger.level("mood") == WITHIN
+    assert ledger.users_by_level() == {"within": 0, "downgrade": 0, "exhausted": 1}
+
+
+def test_process_budget_applies_to_everyone_and_days_roll_over():
+    today = Today()
+    ledger = UsageLedger({}, user_budget=0, daily_budget=1000, today=today)
+    ledger.record("therapy", "m", usage(900, 0), "a")
+    assert ledger.level("mood", "b") == DOWNGRADE
+    today.day += datetime.timedelta(days=1)
+    assert ledger.level("mood", "b") == WITHIN and ledger.spent("a") == (0, 0.0)
+
+
+class Client:
+    """Stands in for the Mistral client: answers after `delays[model]` seconds and logs every call."""
+
+    def __init__(self, delays=None):
+        self.delays = delays or {}
+        self.calls = []
+        self.chat = self
+
+    async def complete_async(self, model, messages, **kwargs):
+        self.calls.append((model, messages[-1]["content"]))
+        await asyncio.sleep(self.delays.get(model, 0))
+        count = messages[-1]["content"].count("### Item")
+        if count:
+            content = {"results": [{"id": i, "mood": "Calm"} for i in range(count)]}
+        else:
+            content = {"mood": "Calm"}
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=json.dumps(content)))],
+                               usage=usage(100, 10))
+
+
+def gateway_with(client):
+    llm = LLMGateway(api_key="test")
+    llm._client = client
+    return llm
+
+
+def test_usage_of_both_hedge_legs_is_recorded():
+    llm = gateway_with(Client({LARGE_MODEL: 0.2}))
+    for _ in range(gateway.HEDGE_MIN_SAMPLES):
+        llm.route_stats("therapy", LARGE_MODEL, "complete").observe(0.01)
+
+    async def scenario():
+        response = await llm.complete([{"role": "user", "content": "hi"}], kind="therapy", user_id="a")
+        assert llm.usage.spent("a")[0] == 110  # the hedge answered first
+        await asyncio.gather(*llm._losers)
+        return response
+
+    asyncio.run(scenario())
+    assert set(llm.usage.routes) == {("therapy", SMALL_MODEL), ("therapy", LARGE_MODEL)}
+    assert llm.usage.spent("a") == (220, llm.usage.cost(LARGE_MODEL, 100, 10) + llm.usage.cost(SMALL_MODEL, 100, 10))
+
+
+def test_downgraded_users_are_kept_out_of_shared_batches():
+    client = Client()
+    llm = gateway_with(client)
+    user_manager = UserManager(gateway=llm)
+    spent = int(0.9 * llm.usage.user_budget)
+    llm.usage.record("therapy", LARGE_MODEL, usage(spent, 0), "c")
+    assert llm.usage.level("mood", "c") == DOWNGRADE
+
+    async def scenario():
+        return await asyncio.gather(*(user_manager.get_mood(uid) for uid in "abc"))
+
+    assert asyncio.run(scenario()) == ["Calm"] * 3
+    batched = [content for _, content in client.calls if "### Item" in content]
+    assert len(client.calls) == 2 and len(batched) == 1 and batched[0].count("### Item") == 2
+    assert llm.usage.spent("a")[0] == llm.usage.spent("b")[0] == 55
+    assert llm.usage.spent("c")[0] == spent + 110
+    assert all(model == SMALL_MODEL for model, _ in client.calls)
@@ -0,0 +1,107 @@
+# Shared timeline scheduler for timed exercises
+#
+# Every running exercise (e.g. a breathing session) is a TimelineSession: a
+# list of (offset in seconds, text) steps rendered by editing one message.
+# A single hashed timer wheel on the event loop drives all sessions. Each
+# tick collects the steps that came due, keeps only the latest one per
+# session (so a late tick sends one edit, not a burst), and issues the
+# edits for all sessions concurrently.
+
+import os
+import asyncio
+import logging
+
+logger = logging.getLogger("discord")
+
+TICK = float(os.getenv("TIMELINE_TICK", "0.5"))  # seconds per wheel slot
+SLOTS = 128  # wheel size; longer delays just wait extra rotations
+
+
+class TimelineSession:
+    """One exercise run. `render(text, last)` edits the session's message."""
+
+    def __init__(self, steps, render):
+        self.steps = sorted(steps, key=lambda step: step[0])
+        self.render = render
+        self.remaining = len(self.steps)
+        self.cancelled = False
+        self.finished = asyncio.get_running_loop().create_future()
+
+    def cancel(self):
+        """Stop the session; steps still on the wheel are skipped when they come due."""
+        self.cancelled = True
+        if not self.finished.done():
+            self.finished.set_result(False)
+
+
+class TimelineScheduler:
+    def __init__(self, tick=TICK, slots=SLOTS):
+        self.tick = tick
+        self.slots = slots
+        self.wheel = [[] for _ in range(slots)]  # slot -> [(due tick, session, step index)]
+        self.ticks = 0  # ticks processed since the driver started
+        self.pending = 0
+        self._started_at = None
+        self._driver = None
+
+        self.edits = 0
+        self.coalesced = 0  # due steps skipped because a later one for the same session was due too
+
+    def start(self, session):
+        """Put every step of `session` on the wheel; returns the session."""
+        loop = asyncio.get_running_loop()
+        if self._driver is None:
+            self._started_at = loop.time()
+            self.ticks = 0
+            self._driver = loop.create_task(self._drive())
+
+        # Offsets are measured from now, which is partway into the current tick
+        now_tick = (loop.time() - self._started_at) / self.tick
+        for index, (offset, _) in enumerate(session.steps):
+            due = max(self.ticks + 1, int(now_tick + offset / self.tick + 0.5))
+            self.wheel[due % self.slots].append((due, session, index))
+            self.pending += 1
+        return session
+
+    async def _drive(self):
+        loop = asyncio.get_running_loop()
+        try:
+            while self.pending:
+                self.ticks += 1
+                # Sleep to the tick's absolute time so delays don't accumulate drift
+                await asyncio.sleep(max(0.0, self._started_at + self.ticks * self.tick - loop.time()))
+                await self._advance()
+        finally:
+            self._driver = None
+
+    async def _advance(self):
+        bucket = self.wheel[self.ticks % self.slots]
+        due = [entry for entry in bucket if entry[0] <= self.ticks]
+        if not due:
+            return
+        self.wheel[self.ticks % self.slots] = [entry for entry in bucket if entry[0] > self.ticks]
+        self.pending -= len(due)
+
+        latest = {}  # session -> index of its latest due step
+        for _, session, index in due:
+            session.remaining -= 1
+            if session.cancelled:
+                continue
+            if session in latest:
+                self.coalesced += 1
+            latest[session] = max(index, latest.get(session, -1))
+
+        await asyncio.gather(*(self._render(session, index) for session, index in latest.items()))
+
+    async def _render(self, session, index):
+        last = session.remaining == 0
+        try:
+            await session.render(session.steps[index][1], last)
+            self.edits += 1
+        except Exception as e:
+            # Usually the interaction expired or the message was deleted
+            logger.warning(f"Timeline edit failed, cancelling session: {e!r}")
+            session.cancel()
+            return
+        if last and not session.finished.done():
+            session.finished.set_result(True)
@@ -0,0 +1,127 @@
+# Token and cost accounting for LLM calls, with per-user and per-day budgets
+#
+# The gateway hands every response's usage to a UsageLedger, which adds it
+# up by prompt kind and model and, for calls made on a user's behalf, by user
+# for the current day. Cost comes from per-model prices in USD per million
+# prompt/completion tokens.
+#
+# Budgets degrade in two steps instead of cutting anyone off. Past
+# BUDGET_SOFT of their daily tokens, a user's calls go to the cheaper model
+# of their route and aren't hedged. Past the whole budget, the gateway
+# refuses their calls with OverBudget, an Overloaded, so every caller's
+# degraded fallback takes over. DAILY_TOKENS does the same for the whole
+# process at once. Crisis calls are never limited. A batched call made for
+# several users is charged to them in equal shares. Callers only batch users
+# still within their budget (a downgraded user's item goes on its own), so
+# one user's level never applies to everyone else in a batch. Totals are kept
+# in memory and start from zero on a restart.
+
+import os
+import datetime
+
+import metrics
+
+USER_DAILY_TOKENS = int(os.getenv("LLM_USER_DAILY_TOKENS", "150000"))  # per user per day; 0 turns it off
+DAILY_TOKENS = int(os.getenv("LLM_DAILY_TOKENS", "0"))  # whole process per day; 0 turns it off
+BUDGET_SOFT = float(os.getenv("LLM_BUDGET_SOFT", "0.8"))  # share of a budget after which calls are downgraded
+UNLIMITED_KINDS = {"crisis"}
+
+# Budget levels
+WITHIN, DOWNGRADE, EXHAUSTED = 0, 1, 2
+LEVEL_NAMES = ["within", "downgrade", "exhausted"]
+
+
+def _members(user_id):
+    """The users a call is for: none, one, or a batch's list (items made for nobody left out)."""
+    if isinstance(user_id, (list, tuple)):
+        return [uid for uid in user_id if uid is not None]
+    return [] if user_id is None else [user_id]
+
+
+class UsageLedger:
+    def __init__(self, prices, user_budget=USER_DAILY_TOKENS, daily_budget=DAILY_TOKENS, soft=BUDGET_SOFT,
+                 today=datetime.date.today):
+        self.prices = prices  # model -> (USD per 1M prompt tokens, USD per 1M completion tokens)
+        self.user_budget = user_budget
+        self.daily_budget = daily_budget
+        self.soft = soft
+        self.today = today
+        self.routes = {}  # (kind, model) -> [calls, prompt tokens, completion tokens, USD]
+        self.day = None
+        self.day_tokens = 0
+        self.day_cost = 0.0
+        self.users = {}  # user_id -> [tokens, USD], today only
+
+    def _roll(self):
+        day = self.today()
+        if day != self.day:
+            self.day = day
+            self.day_tokens = 0
+            self.day_cost = 0.0
+            self.users.clear()
+
+    def cost(self, model, prompt_tokens, completion_tokens):
+        prompt_price, completion_price = self.prices.get(model, (0.0, 0.0))
+        return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1e6
+
+    def record(self, kind, model, usage, user_id=None):
+        """Add one response's usage (None if the API reported none); `user_id` may be a list, for a batch."""
+        if usage is None:
+            return
+        prompt, completion = usage.prompt_tokens or 0, usage.completion_tokens or 0
+        cost = self.cost(model, prompt, completion)
+        self._roll()
+        route = self.routes.setdefault((kind, model), [0, 0, 0, 0.0])
+        route[0] += 1
+        route[1] += prompt
+        route[2] += completion
+        route[3] += cost
+        self.day_tokens += prompt + completion
+        self.day_cost += cost
+        user_ids = _members(user_id)
+        for i, uid in enumerate(user_ids):
+            spent = self.users.setdefault(uid, [0, 0.0])
+            share, remainder = divmod(prompt + completion, len(user_ids))
+            spent[0] += share + (i < remainder)
+            spent[1] += cost / len(user_ids)
+        metrics.record_usage(kind, model, usage)
+        metrics.LLM_COST.inc(cost, kind=kind, model=model)
+
+    def spent(self, user_id):
+        """(tokens, USD) the user has used today."""
+        self._roll()
+        tokens, cost = self.users.get(user_id, (0, 0.0))
+        return tokens, cost
+
+    def spent_today(self):
+        """(tokens, USD) used by the whole process today."""
+        self._roll()
+        return self.day_tokens, self.day_cost
+
+    def level(self, kind, user_id=None):
+        """WITHIN, DOWNGRADE or EXHAUSTED: how far this call's user, and the process, are into their budgets."""
+        if kind in UNLIMITED_KINDS:
+            return WITHIN
+        self._roll()
+        level = self._level(self.day_tokens, self.daily_budget)
+        for uid in _members(user_id):
+            level = max(level, self._level(self.users.get(uid, (0,))[0], self.user_budget))
+        return level
+
+    def _level(self, tokens, budget):
+        if not budget or tokens < self.soft * budget:
+            return WITHIN
+        return DOWNGRADE if tokens < budget else EXHAUSTED
+
+    def users_by_level(self):
+        self._roll()
+        counts = [0, 0, 0]
+        for tokens, _ in self.users.values():
+            counts[self._level(tokens, self.user_budget)] += 1
+        return dict(zip(LEVEL_NAMES, counts))
+
+    def top_users(self, n=10):
+        """The n users who have used the most tokens today, as (user_id, tokens, USD)."""
+        self._roll()
+        return sorted(((uid, tokens, cost) for uid, (tokens, cost) in self.users.items()),
+                      key=lambda row: row[1], reverse=True)[:n]